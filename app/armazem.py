@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class ArmazemLRU:
+    # Chave -> bytes. A memória é um LRU limitado por bytes; com diretório
+    # configurado, o que sai do LRU é gravado em disco (e volta para a
+    # memória quando lido) e os arquivos sem acesso há mais de
+    # ttl_segundos são apagados. Usado pelo page store e pelo cache de
+    # extração.
+    def __init__(self, max_bytes, diretorio=None, ttl_segundos=3600, extensao=".bin"):
+        self.max_bytes = max_bytes
+        self.diretorio = diretorio
+        self.ttl_segundos = ttl_segundos
+        self.extensao = extensao
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._ultima_limpeza = 0.0
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, f"{chave}{self.extensao}")
+
+    def __contains__(self, chave):
+        with self._lock:
+            if chave in self._itens:
+                return True
+        return bool(self.diretorio) and os.path.exists(self._caminho(chave))
+
+    def guardar(self, chave, dados):
+        self._inserir(chave, dados)
+
+    def _inserir(self, chave, dados):
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+            else:
+                self._itens[chave] = dados
+                self._bytes += len(dados)
+                self._despejar()
+        self._limpar_disco()
+
+    def obter(self, chave):
+        with self._lock:
+            dados = self._itens.get(chave)
+            if dados is not None:
+                self._itens.move_to_end(chave)
+                self.hits_memoria += 1
+                return dados
+        if self.diretorio:
+            try:
+                with open(self._caminho(chave), "rb") as f:
+                    dados = f.read()
+                os.utime(self._caminho(chave))
+            except FileNotFoundError:
+                dados = None
+            if dados is not None:
+                self.hits_disco += 1
+                self._inserir(chave, dados)
+                return dados
+        self.misses += 1
+        return None
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+
+    def _despejar(self):
+        while self._bytes > self.max_bytes and len(self._itens) > 1:
+            chave, dados = self._itens.popitem(last=False)
+            self._bytes -= len(dados)
+            if self.diretorio:
+                with open(self._caminho(chave), "wb") as f:
+                    f.write(dados)
+
+    def _limpar_disco(self):
+        agora = time.time()
+        if not self.diretorio or agora - self._ultima_limpeza < 60:
+            return
+        self._ultima_limpeza = agora
+        for entrada in os.scandir(self.diretorio):
+            if entrada.name.endswith(self.extensao) and agora - entrada.stat().st_mtime > self.ttl_segundos:
+                try:
+                    os.remove(entrada.path)
+                except FileNotFoundError:
+                    pass
+
+    def estado(self):
+        with self._lock:
+            return {
+                "itens_memoria": len(self._itens),
+                "bytes_memoria": self._bytes,
+                "max_bytes": self.max_bytes,
+                "diretorio": self.diretorio,
+                "ttl_segundos": self.ttl_segundos,
+                "hits_memoria": self.hits_memoria,
+                "hits_disco": self.hits_disco,
+                "misses": self.misses,
+            }
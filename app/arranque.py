@@ -0,0 +1,183 @@
+import asyncio
+import importlib
+import os
+import sys
+import threading
+import time
+import traceback
+
+from fastapi import APIRouter
+
+router = APIRouter()
+
+# Arranque a frio (deploys que escalam a zero): as bibliotecas pesadas
+# (PyMuPDF, pdfplumber/pdfminer, fpdf2/fontTools, openpyxl) não são mais
+# importadas com o app, e sim no primeiro uso, por ModuloPreguicoso. Depois
+# que o servidor já aceita requisições, o lifespan dispara o aquecimento em
+# segundo plano: cada módulo registra suas etapas (imports, fonte DejaVu,
+# regras e setores do HGR) dizendo onde rodam, no processo do app e/ou em
+# cada worker do pool (ver executor.aquecer_pool). Uma requisição que
+# precise de algo ainda não aquecido só espera o import em andamento.
+# GET /arranque mostra os tempos: processo até o app pronto, cada import
+# pesado, cada etapa do aquecimento e a primeira requisição.
+
+# --- CONFIGURAÇÃO (variáveis de ambiente) ---
+# "padrao", "todos", "0" (desliga) ou lista de etapas: "fitz,fonte"
+AQUECIMENTO = os.getenv("AQUECIMENTO", "padrao")
+
+INICIO = time.perf_counter()
+_etapas = {}  # nome -> (função síncrona, processos, padrão)
+_pool = {"aquecer": None}  # async aquecer(funcoes) nos workers; ver registrar_pool
+_relatorio = {"pronto": None, "primeira_requisicao": None, "imports": {}, "aquecimento": {}}
+_estado = {"tarefa": None}
+_lock = threading.Lock()
+
+
+def _desde_inicio():
+    return round(time.perf_counter() - INICIO, 4)
+
+
+def _idade_processo():
+    # Segundos desde o início do processo (inclui o interpretador e os
+    # imports anteriores a este módulo); só no Linux
+    try:
+        with open("/proc/self/stat") as f:
+            inicio_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return round(uptime - inicio_ticks / os.sysconf("SC_CLK_TCK"), 2)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def importar(nome):
+    modulo = sys.modules.get(nome)
+    if modulo is not None and not getattr(modulo.__spec__, "_initializing", False):
+        return modulo
+    # Ausente, ou ainda importando em outra thread (o aquecimento): o
+    # import_module espera o lock do módulo em vez de devolvê-lo pela metade
+    inicio = time.perf_counter()
+    modulo = importlib.import_module(nome)
+    if nome not in _relatorio["imports"]:
+        with _lock:
+            _relatorio["imports"].setdefault(nome, {
+                "segundos": round(time.perf_counter() - inicio, 4),
+                "thread": threading.current_thread().name,
+            })
+    return modulo
+
+
+class ModuloPreguicoso:
+    # fitz = ModuloPreguicoso("fitz"): o import acontece no primeiro fitz.open
+    def __init__(self, nome):
+        self._nome = nome
+
+    def __getattr__(self, atributo):
+        return getattr(importar(self._nome), atributo)
+
+    def __repr__(self):
+        return f"<módulo preguiçoso {self._nome!r}>"
+
+
+def registrar_aquecimento(nome, funcao, processos=("app",), padrao=True):
+    # funcao: picklable (nível de módulo ou partial) se "pool" em processos
+    _etapas[nome] = (funcao, tuple(processos), padrao)
+
+
+def registrar_pool(aquecer_workers):
+    _pool["aquecer"] = aquecer_workers
+
+
+def _escolhidas():
+    if AQUECIMENTO in ("", "0"):
+        return []
+    if AQUECIMENTO in ("padrao", "todos"):
+        return [nome for nome, (_, _, padrao) in _etapas.items() if padrao or AQUECIMENTO == "todos"]
+    return [nome.strip() for nome in AQUECIMENTO.split(",") if nome.strip() in _etapas]
+
+
+async def _medir(nome, corrotina):
+    inicio = time.perf_counter()
+    try:
+        await corrotina
+        resultado = {"status": "ok"}
+    except Exception as e:
+        # Aquecimento é só otimização: a requisição refaz e mostra o erro
+        resultado = {"status": "erro", "erro": str(e), "trace": traceback.format_exc()}
+    resultado["segundos"] = round(time.perf_counter() - inicio, 4)
+    resultado["concluido_em"] = _desde_inicio()
+    _relatorio["aquecimento"][nome] = resultado
+
+
+async def aquecer(etapas=None):
+    # Primeiro o processo do app, uma etapa por vez numa thread; depois as
+    # etapas de worker, todas juntas em cada worker do pool
+    etapas = etapas if etapas is not None else _escolhidas()
+    no_pool = []
+    for nome in etapas:
+        funcao, processos, _ = _etapas[nome]
+        if "pool" in processos and _pool["aquecer"] is not None:
+            no_pool.append(nome)
+        if "app" in processos or nome not in no_pool:
+            await _medir(nome, asyncio.to_thread(funcao))
+    if no_pool:
+        await _medir(f"pool: {', '.join(no_pool)}", _pool["aquecer"]([_etapas[nome][0] for nome in no_pool]))
+
+
+def iniciar():
+    # Chamado no lifespan: o app está pronto; o aquecimento segue em paralelo
+    _relatorio["pronto"] = {"segundos": _desde_inicio(), "processo_segundos": _idade_processo()}
+    if _escolhidas():
+        _estado["tarefa"] = asyncio.get_running_loop().create_task(aquecer())
+
+
+async def encerrar():
+    tarefa = _estado["tarefa"]
+    if tarefa is not None and not tarefa.done():
+        tarefa.cancel()
+        await asyncio.gather(tarefa, return_exceptions=True)
+    _estado["tarefa"] = None
+
+
+def registrar_requisicao(endpoint, duracao):
+    # Chamado pelo MetricasMiddleware ao fim de cada requisição
+    if _relatorio["primeira_requisicao"] is None and endpoint != "/arranque":
+        _relatorio["primeira_requisicao"] = {
+            "endpoint": endpoint,
+            "segundos": round(duracao, 4),
+            "concluida_em": _desde_inicio(),
+        }
+
+
+def relatorio():
+    tarefa = _estado["tarefa"]
+    with _lock:
+        imports = dict(_relatorio["imports"])
+    return {
+        "pronto": _relatorio["pronto"],
+        "primeira_requisicao": _relatorio["primeira_requisicao"],
+        "imports": imports,
+        "aquecimento": {
+            "etapas_configuradas": _escolhidas(),
+            "em_andamento": tarefa is not None and not tarefa.done(),
+            "etapas": dict(_relatorio["aquecimento"]),
+        },
+    }
+
+
+def estado():
+    # Para o /metrics: só os números
+    pronto = _relatorio["pronto"] or {}
+    primeira = _relatorio["primeira_requisicao"] or {}
+    return {
+        "pronto_segundos": pronto.get("segundos"),
+        "processo_segundos": pronto.get("processo_segundos"),
+        "primeira_requisicao_segundos": primeira.get("segundos"),
+        "aquecimento_segundos": sum(e["segundos"] for e in _relatorio["aquecimento"].values()),
+    }
+
+
+# --- ROTAS ---
+@router.get("/arranque")
+def consultar_arranque():
+    return relatorio()
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+from itertools import repeat
+
+from fastapi import APIRouter
+
+from app import executor, metrics, perfil
+from app.armazem import ArmazemLRU
+
+router = APIRouter()
+
+# --- CONFIGURAÇÃO (variáveis de ambiente) ---
+# Páginas por tarefa no modo documento inteiro (cada tarefa abre o PDF uma vez)
+PAGINAS_POR_LOTE = int(os.getenv("PDF_PAGINAS_POR_LOTE", "8"))
+CACHE_EXTRACAO_MAX_BYTES = int(os.getenv("CACHE_EXTRACAO_MAX_BYTES", str(128 * 1024 * 1024)))
+# Diretório opcional para a camada em disco do cache.
+CACHE_EXTRACAO_DIR = os.getenv("CACHE_EXTRACAO_DIR") or None
+CACHE_EXTRACAO_TTL_SEGUNDOS = int(os.getenv("CACHE_EXTRACAO_TTL_SEGUNDOS", str(7 * 24 * 3600)))
+
+# Texto e tabelas extraídos por página, chaveados por backend + SHA-256 dos
+# bytes da página. Os valores ficam serializados em JSON: o tamanho em bytes
+# limita o LRU e cada hit devolve uma cópia nova (a consolidação pode
+# alterar as linhas sem contaminar o cache).
+cache_extracao = ArmazemLRU(CACHE_EXTRACAO_MAX_BYTES, CACHE_EXTRACAO_DIR, CACHE_EXTRACAO_TTL_SEGUNDOS, extensao=".json")
+
+
+def chave_extracao(backend, pdf_bytes):
+    return f"{backend}-{hashlib.sha256(pdf_bytes).hexdigest()}"
+
+
+async def extrair_com_cache(extrator, backend, pdfs, *args):
+    # Consulta o cache no processo principal e só manda para o pool as
+    # páginas que faltam (uma vez cada, mesmo se repetidas na requisição).
+    chaves = [chave_extracao(backend, pdf_bytes) for pdf_bytes in pdfs]
+    resultados = {}
+    faltando = {}
+    for chave, pdf_bytes in zip(chaves, pdfs):
+        if chave in resultados or chave in faltando: continue
+        dados = None if perfil.perfil_atual.get() else cache_extracao.obter(chave)
+        if dados is None:
+            faltando[chave] = pdf_bytes
+        else:
+            resultados[chave] = json.loads(dados)
+    metrics.contar("cache_extracao_hits", len(resultados))
+    metrics.contar("cache_extracao_misses", len(faltando))
+    executor.informar_progresso(len(resultados))
+
+    novos = await executor.mapear_paginas(extrator, faltando.values(), *(repeat(arg) for arg in args))
+    for chave, valor in zip(faltando, novos):
+        dados = json.dumps(valor, separators=(",", ":")).encode("utf-8")
+        cache_extracao.guardar(chave, dados)
+        resultados[chave] = json.loads(dados)
+
+    return [resultados[chave] for chave in chaves]
+
+
+async def extrair_documento_com_cache(extrator_lote, backend, pdf_bytes, indices, *args):
+    # Modo documento inteiro: a chave inclui o índice da página e as páginas
+    # que faltam vão para o pool em lotes; extrator_lote(pdf_bytes, lote,
+    # *args) abre o documento uma vez por lote e devolve uma extração por
+    # índice.
+    sha = hashlib.sha256(pdf_bytes).hexdigest()
+    chaves = {i: f"{backend}-{sha}-p{i}" for i in indices}
+    resultados = {}
+    faltando = []
+    for i in dict.fromkeys(indices):
+        dados = None if perfil.perfil_atual.get() else cache_extracao.obter(chaves[i])
+        if dados is None:
+            faltando.append(i)
+        else:
+            resultados[i] = json.loads(dados)
+    metrics.contar("cache_extracao_hits", len(resultados))
+    metrics.contar("cache_extracao_misses", len(faltando))
+    executor.informar_progresso(len(resultados))
+
+    tamanho = max(1, min(PAGINAS_POR_LOTE, -(-len(faltando) // executor.CONCORRENCIA_POR_REQUISICAO)))
+    lotes = [faltando[i:i + tamanho] for i in range(0, len(faltando), tamanho)]
+    novos = await executor.mapear_paginas(
+        extrator_lote, repeat(pdf_bytes), lotes, *(repeat(arg) for arg in args), pesos=[len(lote) for lote in lotes]
+    )
+    for lote, valores in zip(lotes, novos):
+        for i, valor in zip(lote, valores):
+            dados = json.dumps(valor, separators=(",", ":")).encode("utf-8")
+            cache_extracao.guardar(chaves[i], dados)
+            resultados[i] = json.loads(dados)
+
+    return [resultados[i] for i in indices]
+
+
+@router.get("/cache/extracao")
+def estado_cache_extracao():
+    estado = cache_extracao.estado()
+    consultas = estado["hits_memoria"] + estado["hits_disco"] + estado["misses"]
+    estado["taxa_acerto"] = round((estado["hits_memoria"] + estado["hits_disco"]) / consultas, 4) if consultas else None
+    return estado
+
+
+@router.delete("/cache/extracao")
+def limpar_cache_extracao():
+    cache_extracao.limpar()
+    return {"ok": True}
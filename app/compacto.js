@@ -0,0 +1,42 @@
+// Expansão do formato compacto (?formato=compacto) de volta às escalas no
+// formato verboso, igual a compacto.expandir() em Python. Para o nó Code
+// do n8n: const escalas = expandirCompacto($json);
+function expandirCompacto(compacto) {
+  if (!compacto || compacto.formato !== "compacto") return compacto;
+  const { tabelas, dicionarios } = compacto;
+  const dois = (n) => String(n).padStart(2, "0");
+  return compacto.escalas.map((escala) => {
+    if (!escala.colunas) return escala;
+    const [d, m, a] = escala.data_base.split("/").map(Number);
+    const base = Date.UTC(a, m - 1, d);
+    const extras = escala.colunas.slice(2);
+    const campos = escala.campos_plantao;
+    const { data_base, colunas, campos_plantao, ...verbosa } = escala;
+    verbosa.profissionais = escala.profissionais.map((profissional) => {
+      const plantoes = profissional.plantoes;
+      if (!plantoes || !plantoes.length || !Array.isArray(plantoes[0])) return profissional;
+      return {
+        ...profissional,
+        plantoes: plantoes.map((linha) => {
+          const data = new Date(base + linha[0] * 86400000);
+          const dia = data.getUTCDate();
+          const turno = linha[1];
+          const valores = {
+            dia,
+            data: `${dois(dia)}/${dois(data.getUTCMonth() + 1)}/${data.getUTCFullYear()}`,
+            turno: tabelas.turnos[turno],
+            inicio: tabelas.horarios[turno][0],
+            fim: tabelas.horarios[turno][1],
+          };
+          extras.forEach((campo, i) => { valores[campo] = tabelas[dicionarios[campo]][linha[2 + i]]; });
+          const plantao = {};
+          for (const campo of campos) plantao[campo] = valores[campo];
+          return plantao;
+        }),
+      };
+    });
+    return verbosa;
+  });
+}
+
+if (typeof module !== "undefined") module.exports = { expandirCompacto };
@@ -0,0 +1,194 @@
+import os
+from datetime import date
+from functools import lru_cache
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app import metrics, turnos
+from app.erros import ErroRequisicao
+
+router = APIRouter()
+
+# Formato compacto (?formato=compacto nos normaliza-escala-*, no GET
+# /jobs/{id} e no finalizar das sessões). Cada plantão vira uma linha de
+# inteiros [deslocamento do dia, código do turno, índices de setor/unidade]:
+#   dia, data        data_base da escala + deslocamento em dias
+#   turno, inicio,   tabelas.turnos[código] e tabelas.horarios[código]
+#   fim
+#   setor, medico_setor, medico_unidade (MATRICIAL, PACS)
+#                    tabelas.setores / tabelas.unidades[índice]
+# "colunas" dá o significado de cada posição, "dicionarios" a tabela de cada
+# coluna de texto e "campos_plantao" a ordem das chaves no formato verboso.
+# Um profissional com algum plantão fora desse molde (chaves ou horários
+# diferentes) mantém a lista verbosa, então expandir(compactar(x)) == x. A expansão é pura: expandir() aqui ou
+# o equivalente em JavaScript de GET /formato-compacto/expandir.js (para o
+# nó Code do n8n).
+
+FORMATOS = ("json", "compacto")
+VERSAO = 1
+# Campo do plantão -> tabela de valores compartilhada
+DICIONARIOS = {"setor": "setores", "medico_setor": "setores", "medico_unidade": "unidades"}
+CAMPOS_DERIVADOS = ("dia", "data", "turno", "inicio", "fim")
+EXPANSOR_JS = os.path.join(os.path.dirname(__file__), "compacto.js")
+
+_CODIGO_TURNO = {nome: i for i, nome in enumerate(turnos.TURNOS)}
+
+
+def validar_formato(formato):
+    if formato not in FORMATOS:
+        raise ErroRequisicao(f"Formato inválido: {formato!r}. Use um de: {', '.join(FORMATOS)}.")
+    return formato
+
+
+@lru_cache(maxsize=4096)
+def ordinal_data(data):
+    # "dd/mm/aaaa" -> ordinal, ou None se não for uma data
+    try:
+        dia, mes, ano = map(int, data.split("/"))
+        return date(ano, mes, dia).toordinal()
+    except (AttributeError, ValueError):
+        return None
+
+
+class _Tabelas:
+    def __init__(self):
+        self.valores = {"setores": [], "unidades": []}
+        self._indices = {"setores": {}, "unidades": {}}
+
+    def indice(self, tabela, valor):
+        indices = self._indices[tabela]
+        if valor not in indices:
+            indices[valor] = len(self.valores[tabela])
+            self.valores[tabela].append(valor)
+        return indices[valor]
+
+
+def _linhas(plantoes, ordem, extras, base, tabelas):
+    # Linhas compactas dos plantões, ou None se algum não couber no molde
+    linhas = []
+    for plantao in plantoes:
+        if tuple(plantao) != ordem:
+            return None
+        ordinal = ordinal_data(plantao["data"])
+        turno = _CODIGO_TURNO.get(plantao["turno"])
+        if ordinal is None or turno is None or (plantao["inicio"], plantao["fim"]) != turnos.HORARIOS[turno] \
+                or plantao["dia"] != date.fromordinal(ordinal).day:
+            return None
+        linha = [ordinal - base, turno]
+        for campo in extras:
+            linha.append(tabelas.indice(DICIONARIOS[campo], plantao[campo]))
+        linhas.append(linha)
+    return linhas
+
+
+def _ordem(escala):
+    # Chaves do primeiro plantão, se for do molde (derivados + dicionários)
+    for profissional in escala["profissionais"]:
+        for plantao in profissional.get("plantoes") or ():
+            ordem = tuple(plantao)
+            if all(c in ordem for c in CAMPOS_DERIVADOS) and all(c in CAMPOS_DERIVADOS or c in DICIONARIOS for c in ordem):
+                return ordem
+            return None
+    return None
+
+
+def _compactar_escala(escala, tabelas):
+    if not isinstance(escala, dict) or not isinstance(escala.get("profissionais"), list):
+        return escala
+    ordem = _ordem(escala)
+    if ordem is None:
+        return escala
+    extras = tuple(c for c in ordem if c not in CAMPOS_DERIVADOS)
+    ordinais = [
+        o for profissional in escala["profissionais"] for p in profissional.get("plantoes") or ()
+        if (o := ordinal_data(p.get("data"))) is not None
+    ]
+    if not ordinais:
+        return escala
+    base = date.fromordinal(min(ordinais)).replace(day=1).toordinal()
+    profissionais = []
+    for profissional in escala["profissionais"]:
+        plantoes = profissional.get("plantoes")
+        linhas = _linhas(plantoes, ordem, extras, base, tabelas) if plantoes else None
+        profissionais.append({**profissional, "plantoes": linhas} if linhas is not None else profissional)
+    return {
+        **escala,
+        "data_base": date.fromordinal(base).strftime("%d/%m/%Y"),
+        "colunas": ["dia", "turno", *extras],
+        "campos_plantao": list(ordem),
+        "profissionais": profissionais,
+    }
+
+
+def compactar(resultado):
+    # Saída de um normalizador ([escala, ...]) no formato compacto
+    if not isinstance(resultado, list):
+        return resultado
+    tabelas = _Tabelas()
+    escalas = [_compactar_escala(escala, tabelas) for escala in resultado]
+    return {
+        "formato": "compacto",
+        "versao": VERSAO,
+        "tabelas": {
+            "turnos": list(turnos.TURNOS),
+            "horarios": [list(h) for h in turnos.HORARIOS],
+            **tabelas.valores,
+        },
+        "dicionarios": DICIONARIOS,
+        "escalas": escalas,
+    }
+
+
+def expandir(compacto):
+    # Inverso de compactar(): devolve a lista de escalas no formato verboso
+    if not isinstance(compacto, dict) or compacto.get("formato") != "compacto":
+        return compacto
+    tabelas = compacto["tabelas"]
+    dicionarios = compacto["dicionarios"]
+    escalas = []
+    for escala in compacto["escalas"]:
+        if "colunas" not in escala:
+            escalas.append(escala)
+            continue
+        base = ordinal_data(escala["data_base"])
+        extras = escala["colunas"][2:]
+        campos = escala["campos_plantao"]
+        verbosa = {k: v for k, v in escala.items() if k not in ("data_base", "colunas", "campos_plantao")}
+        profissionais = []
+        for profissional in escala["profissionais"]:
+            plantoes = profissional.get("plantoes")
+            if plantoes and isinstance(plantoes[0], list):
+                expandidos = []
+                for linha in plantoes:
+                    d = date.fromordinal(base + linha[0])
+                    turno = linha[1]
+                    valores = {
+                        "dia": d.day,
+                        "data": f"{d.day:02d}/{d.month:02d}/{d.year}",
+                        "turno": tabelas["turnos"][turno],
+                        "inicio": tabelas["horarios"][turno][0],
+                        "fim": tabelas["horarios"][turno][1],
+                    }
+                    for campo, indice in zip(extras, linha[2:]):
+                        valores[campo] = tabelas[dicionarios[campo]][indice]
+                    expandidos.append({campo: valores[campo] for campo in campos})
+                profissional = {**profissional, "plantoes": expandidos}
+            profissionais.append(profissional)
+        verbosa["profissionais"] = profissionais
+        escalas.append(verbosa)
+    return escalas
+
+
+def formatar(resultado, formato):
+    if formato != "compacto":
+        return resultado
+    with metrics.etapa("compactacao"):
+        return compactar(resultado)
+
+
+# --- ROTAS ---
+@router.get("/formato-compacto/expandir.js")
+def expansor_js():
+    with open(EXPANSOR_JS, encoding="utf-8") as f:
+        return PlainTextResponse(f.read(), media_type="application/javascript")
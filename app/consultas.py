@@ -0,0 +1,411 @@
+import bisect
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+from datetime import date
+from functools import lru_cache
+
+from fastapi import APIRouter, Request
+
+from app import compacto, diferencas, metrics
+from app.corpo import ler_json
+from app.erros import ErroRequisicao
+from app.metrics import RespostaJSON
+
+router = APIRouter()
+
+# Consultas sobre escalas já normalizadas, sem o n8n varrer o JSON inteiro:
+#   POST /consultas/escalas?hash=<X-Escala-Hash>   carrega uma escala guardada
+#                                                  (ver app/diferencas.py)
+#   POST /consultas/escalas  (corpo JSON)          ou a saída de qualquer
+#                                                  normaliza-escala-* (verbosa
+#                                                  ou compacta)
+#   ?substitui=<fonte> descarrega a versão anterior (retificação).
+#   GET /consultas/plantoes?data=12/07/2025&turno=noite&setor=UTI 1
+#       filtros: data ou de/ate, turno (prefixo), setor (inteiro ou uma das
+#       partes de "A/B/C"), unidade, profissional, crm
+#   GET /consultas/cobertura?inicio=12/07/2025 19:00&fim=13/07/2025 07:00
+#       &setor=UTI 1&minimo=2: plantões que tocam o intervalo e as lacunas
+#       com menos de `minimo` profissionais
+# Os plantões ficam particionados por mês; cada mês tem um índice por campo
+# (valor normalizado, sem acento -> ids) e a lista de inícios ordenada para
+# as consultas de sobreposição. A memória é limitada despejando meses
+# inteiros, do carregado há mais tempo para o mais recente.
+
+# --- CONFIGURAÇÃO (variáveis de ambiente) ---
+CONSULTAS_MAX_MESES = int(os.getenv("CONSULTAS_MAX_MESES", "6"))
+CONSULTAS_MAX_PLANTOES = int(os.getenv("CONSULTAS_MAX_PLANTOES", "1000000"))
+CONSULTAS_LIMITE = int(os.getenv("CONSULTAS_LIMITE", "5000"))
+
+CAMPOS_INDICE = ("data", "turno", "setor", "unidade", "profissional", "crm")
+MINUTOS_DIA = 24 * 60
+
+
+class FonteNaoEncontradaError(ErroRequisicao):
+    status_code = 404
+
+
+@lru_cache(maxsize=16384)
+def _chave(valor):
+    # Chave de índice: maiúsculas, sem acentos e espaços repetidos
+    texto = unicodedata.normalize("NFKD", str(valor))
+    return " ".join("".join(c for c in texto if not unicodedata.combining(c)).upper().split())
+
+
+def _ordinal(texto, campo):
+    ordinal = compacto.ordinal_data(texto.strip()) if isinstance(texto, str) else None
+    if ordinal is None:
+        raise ErroRequisicao(f"{campo} inválido: {texto!r}. Use dd/mm/aaaa.")
+    return ordinal
+
+
+def _hora(texto):
+    # "HH:MM" -> minutos, ou None
+    try:
+        horas, minutos = map(int, texto.split(":"))
+    except (AttributeError, ValueError):
+        return None
+    return horas * 60 + minutos if 0 <= horas <= 24 and 0 <= minutos < 60 else None
+
+
+def _instante(texto, campo, fim=False):
+    # "dd/mm/aaaa HH:MM" (ou só a data: início do dia, ou fim dele se fim=True)
+    # -> minutos desde o ordinal 0
+    data, _, hora = texto.strip().partition(" ")
+    minutos = _hora(hora.strip()) if hora.strip() else (MINUTOS_DIA if fim else 0)
+    if minutos is None:
+        raise ErroRequisicao(f"{campo} inválido: {texto!r}. Use dd/mm/aaaa HH:MM.")
+    return _ordinal(data, campo) * MINUTOS_DIA + minutos
+
+
+def _formatar_instante(minutos):
+    d = date.fromordinal(minutos // MINUTOS_DIA)
+    hora = minutos % MINUTOS_DIA
+    return f"{d.day:02d}/{d.month:02d}/{d.year} {hora // 60:02d}:{hora % 60:02d}"
+
+
+class _Plantao:
+    __slots__ = ("fonte", "unidade_escala", "profissional", "setor", "unidade", "plantao", "data", "inicio", "fim")
+
+    def __init__(self, fonte, unidade_escala, profissional, plantao):
+        self.fonte = fonte
+        self.unidade_escala = unidade_escala
+        self.profissional = profissional
+        self.plantao = plantao
+        self.setor = plantao.get("setor") or plantao.get("medico_setor") or profissional.get("medico_setor")
+        self.unidade = plantao.get("medico_unidade") or profissional.get("medico_unidade") or unidade_escala
+        self.data = compacto.ordinal_data(plantao.get("data"))
+        self.inicio = self.fim = None
+        inicio, fim = _hora(plantao.get("inicio")), _hora(plantao.get("fim"))
+        if self.data is not None and inicio is not None and fim is not None:
+            # Turnos que cruzam a meia-noite (19:00-01:00) terminam no dia seguinte
+            self.inicio = self.data * MINUTOS_DIA + inicio
+            self.fim = self.data * MINUTOS_DIA + fim + (MINUTOS_DIA if fim <= inicio else 0)
+
+    def chaves(self):
+        setores = {_chave(self.setor)} | {_chave(parte) for parte in str(self.setor).split("/")} if self.setor else ()
+        return {
+            "data": (self.data,),
+            "turno": (_chave(self.plantao.get("turno")),),
+            "setor": setores,
+            "unidade": {_chave(u) for u in (self.unidade, self.unidade_escala) if u},
+            "profissional": (_chave(self.profissional.get("medico_nome", "")),),
+            "crm": (_chave(self.profissional["medico_crm"]),) if self.profissional.get("medico_crm") else (),
+        }
+
+    def json(self):
+        saida = {"unidade_escala": self.unidade_escala, "medico_nome": self.profissional.get("medico_nome")}
+        if self.profissional.get("medico_crm"):
+            saida["medico_crm"] = self.profissional["medico_crm"]
+        saida["setor"] = self.setor
+        saida["plantao"] = self.plantao
+        return saida
+
+
+class _Mes:
+    # Partição de um mês: plantões, índices por campo e inícios ordenados
+    def __init__(self, plantoes=()):
+        self.plantoes = []
+        self.indices = {campo: defaultdict(list) for campo in CAMPOS_INDICE}
+        self._inicios = None
+        self._duracao_max = 0
+        for plantao in plantoes:
+            self.adicionar(plantao)
+
+    def adicionar(self, plantao):
+        i = len(self.plantoes)
+        self.plantoes.append(plantao)
+        for campo, chaves in plantao.chaves().items():
+            for chave in chaves:
+                self.indices[campo][chave].append(i)
+        if plantao.inicio is not None:
+            self._duracao_max = max(self._duracao_max, plantao.fim - plantao.inicio)
+        self._inicios = None
+
+    def ids(self, filtros):
+        # filtros: {campo: [chaves]} (turno por prefixo); None = sem filtro
+        resultado = None
+        for campo, chaves in filtros.items():
+            indice = self.indices[campo]
+            if campo == "turno":
+                chaves = [k for k in indice if any(k.startswith(c) for c in chaves)]
+            ids = set()
+            for chave in chaves:
+                ids.update(indice.get(chave, ()))
+            resultado = ids if resultado is None else resultado & ids
+            if not resultado:
+                return set()
+        return resultado
+
+    def sobrepostos(self, inicio, fim):
+        # ids dos plantões com [início, fim) cruzando o intervalo
+        if self._inicios is None:
+            self._inicios = sorted((p.inicio, i) for i, p in enumerate(self.plantoes) if p.inicio is not None)
+        a = bisect.bisect_left(self._inicios, (inicio - self._duracao_max, -1))
+        b = bisect.bisect_left(self._inicios, (fim, -1))
+        return {i for _, i in self._inicios[a:b] if self.plantoes[i].fim > inicio}
+
+
+class IndiceEscalas:
+    def __init__(self, max_meses, max_plantoes):
+        self.max_meses = max_meses
+        self.max_plantoes = max_plantoes
+        self._meses = OrderedDict()  # (ano, mês) -> _Mes, do carregado há mais tempo ao mais recente
+        self._fontes = {}  # fonte -> {"escalas", "meses", "plantoes", "carregada_em"}
+        self._lock = threading.Lock()
+        self.meses_despejados = 0
+
+    def _total(self):
+        return sum(len(mes.plantoes) for mes in self._meses.values())
+
+    def carregar(self, fonte, resultado, substitui=None):
+        if not isinstance(resultado, list):
+            raise ErroRequisicao("Escala deve ser a lista devolvida pelo normaliza-escala-*.")
+        por_mes, sem_data, escalas = defaultdict(list), 0, []
+        for escala in resultado:
+            if not isinstance(escala, dict):
+                continue
+            unidade = escala.get("unidade_escala")
+            escalas.append({"unidade_escala": unidade, "mes_ano_escala": escala.get("mes_ano_escala")})
+            for profissional in escala.get("profissionais") or ():
+                dados = {k: v for k, v in profissional.items() if k != "plantoes"}
+                for item in profissional.get("plantoes") or ():
+                    plantao = _Plantao(fonte, unidade, dados, item)
+                    if plantao.data is None:
+                        sem_data += 1
+                        continue
+                    d = date.fromordinal(plantao.data)
+                    por_mes[(d.year, d.month)].append(plantao)
+        with self._lock:
+            for antiga in {fonte, substitui} - {None}:
+                self._remover(antiga)
+            for chave in sorted(por_mes):
+                mes = self._meses.setdefault(chave, _Mes())
+                for plantao in por_mes[chave]:
+                    mes.adicionar(plantao)
+                self._meses.move_to_end(chave)
+            self._fontes[fonte] = {
+                "escalas": escalas,
+                "meses": set(por_mes),
+                "plantoes": sum(len(p) for p in por_mes.values()),
+                "carregada_em": time.time(),
+            }
+            despejados = self._despejar(keep=len(por_mes))
+        return {
+            "fonte": fonte,
+            "plantoes": self._fontes.get(fonte, {}).get("plantoes", 0),
+            "sem_data": sem_data,
+            "meses": [f"{m:02d}/{a}" for a, m in sorted(por_mes)],
+            "meses_despejados": despejados,
+        }
+
+    def _remover(self, fonte):
+        info = self._fontes.pop(fonte, None)
+        if info is None:
+            return False
+        for chave in info["meses"]:
+            mes = self._meses.get(chave)
+            if mes is None:
+                continue
+            restantes = [p for p in mes.plantoes if p.fonte != fonte]
+            if restantes:
+                self._meses[chave] = _Mes(restantes)
+            else:
+                del self._meses[chave]
+        return True
+
+    def remover(self, fonte):
+        with self._lock:
+            if not self._remover(fonte):
+                raise FonteNaoEncontradaError(f"Escala {fonte} não está carregada.")
+
+    def _despejar(self, keep):
+        # Tira meses inteiros, do carregado há mais tempo, até caber nos
+        # limites; os `keep` meses mais recentes (o que acabou de entrar) ficam
+        despejados = []
+        total = self._total()
+        while len(self._meses) > keep and (len(self._meses) > self.max_meses or total > self.max_plantoes):
+            (ano, numero), mes = self._meses.popitem(last=False)
+            total -= len(mes.plantoes)
+            despejados.append(f"{numero:02d}/{ano}")
+            for fonte, info in list(self._fontes.items()):
+                info["meses"].discard((ano, numero))
+                if not info["meses"]:
+                    del self._fontes[fonte]
+        self.meses_despejados += len(despejados)
+        return despejados
+
+    def _meses_entre(self, primeiro, ultimo):
+        inicio, fim = date.fromordinal(primeiro), date.fromordinal(ultimo)
+        return [(chave, mes) for chave, mes in sorted(self._meses.items())
+                if (inicio.year, inicio.month) <= chave <= (fim.year, fim.month)]
+
+    def plantoes(self, filtros, de=None, ate=None):
+        with self._lock:
+            if de is not None:
+                meses = self._meses_entre(de, ate)
+                filtros = {**filtros, "data": range(de, ate + 1)}
+            else:
+                meses = sorted(self._meses.items())
+            encontrados = []
+            for _, mes in meses:
+                ids = mes.ids(filtros)
+                encontrados.extend(mes.plantoes[i] for i in (range(len(mes.plantoes)) if ids is None else ids))
+        encontrados.sort(key=lambda p: (p.inicio if p.inicio is not None else p.data * MINUTOS_DIA, _chave(p.profissional.get("medico_nome", ""))))
+        return encontrados
+
+    def cobertura(self, inicio, fim, filtros):
+        with self._lock:
+            encontrados = []
+            # Um plantão do último dia do mês anterior pode atravessar o início
+            for _, mes in self._meses_entre(inicio // MINUTOS_DIA - 1, (fim - 1) // MINUTOS_DIA):
+                ids = mes.sobrepostos(inicio, fim)
+                if filtros and ids:
+                    ids &= mes.ids(filtros)
+                encontrados.extend(mes.plantoes[i] for i in ids)
+        encontrados.sort(key=lambda p: (p.inicio, _chave(p.profissional.get("medico_nome", ""))))
+        return encontrados
+
+    def fontes(self):
+        with self._lock:
+            return [
+                {"fonte": fonte, "escalas": info["escalas"], "plantoes": info["plantoes"],
+                 "meses": [f"{m:02d}/{a}" for a, m in sorted(info["meses"])], "carregada_em": info["carregada_em"]}
+                for fonte, info in self._fontes.items()
+            ]
+
+    def estado(self):
+        with self._lock:
+            return {
+                "fontes": len(self._fontes),
+                "meses": len(self._meses),
+                "plantoes": self._total(),
+                "max_meses": self.max_meses,
+                "max_plantoes": self.max_plantoes,
+                "meses_despejados": self.meses_despejados,
+            }
+
+
+indice = IndiceEscalas(CONSULTAS_MAX_MESES, CONSULTAS_MAX_PLANTOES)
+
+
+def lacunas(plantoes, inicio, fim, minimo=1):
+    # Trechos de [inicio, fim) com menos de `minimo` plantões simultâneos
+    eventos = defaultdict(int)
+    for p in plantoes:
+        eventos[max(p.inicio, inicio)] += 1
+        eventos[min(p.fim, fim)] -= 1
+    eventos.setdefault(fim, 0)
+    resultado, cobertos, anterior = [], 0, inicio
+    for instante in sorted(eventos):
+        if instante > anterior and cobertos < minimo:
+            if resultado and resultado[-1]["fim"] == anterior and resultado[-1]["profissionais"] == cobertos:
+                resultado[-1]["fim"] = instante
+            else:
+                resultado.append({"inicio": anterior, "fim": instante, "profissionais": cobertos})
+        cobertos += eventos[instante]
+        anterior = max(anterior, instante)
+    return [{**lacuna, "inicio": _formatar_instante(lacuna["inicio"]), "fim": _formatar_instante(lacuna["fim"])}
+            for lacuna in resultado]
+
+
+def _filtros(turno=None, setor=None, unidade=None, profissional=None, crm=None):
+    valores = {"turno": turno, "setor": setor, "unidade": unidade, "profissional": profissional, "crm": crm}
+    return {campo: [_chave(valor)] for campo, valor in valores.items() if valor}
+
+
+def _limitar(plantoes, limite):
+    limite = CONSULTAS_LIMITE if limite is None else min(limite, CONSULTAS_LIMITE)
+    return {"total": len(plantoes), "truncado": len(plantoes) > limite, "plantoes": [p.json() for p in plantoes[:limite]]}
+
+
+# --- ROTAS ---
+@router.post("/consultas/escalas")
+async def carregar_escala(request: Request, hash: str = None, substitui: str = None):
+    try:
+        if hash:
+            resultado, fonte = diferencas.ler(hash), hash
+        else:
+            with metrics.etapa("decodificacao"):
+                resultado = compacto.expandir(await ler_json(request, ()))
+            fonte = diferencas.guardar(resultado) or hashlib.sha256(diferencas.serializar(resultado)).hexdigest()
+        with metrics.etapa("indexacao"):
+            resumo = indice.carregar(fonte, resultado, substitui)
+        metrics.contar("plantoes_indexados", resumo["plantoes"])
+        return RespostaJSON(content=resumo)
+    except ErroRequisicao as e:
+        return e.resposta()
+
+
+@router.get("/consultas/escalas")
+def listar_escalas():
+    return {**indice.estado(), "escalas": indice.fontes()}
+
+
+@router.delete("/consultas/escalas/{fonte}")
+def descarregar_escala(fonte: str):
+    try:
+        indice.remover(fonte)
+        return {"fonte": fonte, "removida": True}
+    except ErroRequisicao as e:
+        return e.resposta()
+
+
+@router.get("/consultas/plantoes")
+def consultar_plantoes(data: str = None, de: str = None, ate: str = None, turno: str = None, setor: str = None,
+                       unidade: str = None, profissional: str = None, crm: str = None, limite: int = None):
+    try:
+        if data:
+            de = ate = _ordinal(data, "data")
+        elif de or ate:
+            de, ate = _ordinal(de or ate, "de"), _ordinal(ate or de, "ate")
+        filtros = _filtros(turno, setor, unidade, profissional, crm)
+        with metrics.etapa("consulta"):
+            plantoes = indice.plantoes(filtros, de, ate)
+        return RespostaJSON(content=_limitar(plantoes, limite))
+    except ErroRequisicao as e:
+        return e.resposta()
+
+
+@router.get("/consultas/cobertura")
+def consultar_cobertura(inicio: str, fim: str, turno: str = None, setor: str = None, unidade: str = None,
+                        profissional: str = None, crm: str = None, minimo: int = 1, limite: int = None):
+    try:
+        a, b = _instante(inicio, "inicio"), _instante(fim, "fim", fim=True)
+        if b <= a:
+            raise ErroRequisicao("fim deve ser depois de inicio.")
+        with metrics.etapa("consulta"):
+            plantoes = indice.cobertura(a, b, _filtros(turno, setor, unidade, profissional, crm))
+            vazios = lacunas(plantoes, a, b, max(minimo, 1))
+        return RespostaJSON(content={
+            "inicio": _formatar_instante(a),
+            "fim": _formatar_instante(b),
+            "minimo": max(minimo, 1),
+            "lacunas": vazios,
+            **_limitar(plantoes, limite),
+        })
+    except ErroRequisicao as e:
+        return e.resposta()
@@ -0,0 +1,319 @@
+import binascii
+import json
+import os
+import re
+from contextlib import aclosing
+
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from app.erros import CorpoGrandeDemaisError, ErroRequisicao
+
+# Leitura do corpo das requisições com orçamento de bytes. O JSON das
+# páginas ([{"base64": ...}, ...], {"pages": [...]}, {"base64": ...} do
+# /split-pdf-base64) é analisado conforme os pedaços chegam: os valores dos
+# campos base64 nunca viram str, são decodificados direto em bytes por
+# página. Sem o corpo inteiro e a str base64 em memória, sobra só uma cópia
+# (os bytes do PDF) por página.
+
+# --- CONFIGURAÇÃO (variáveis de ambiente) ---
+# Limite por requisição; 0 desliga
+MAX_BYTES_REQUISICAO = int(os.getenv("MAX_BYTES_REQUISICAO", str(512 * 1024 * 1024)))
+
+
+def verificar_tamanho(request):
+    # Recusa antes de ler quando o Content-Length já passa do limite
+    tamanho = request.headers.get("content-length")
+    if MAX_BYTES_REQUISICAO and tamanho and tamanho.isdigit() and int(tamanho) > MAX_BYTES_REQUISICAO:
+        raise CorpoGrandeDemaisError(f"Requisição maior que o limite de {MAX_BYTES_REQUISICAO} bytes.")
+
+
+async def _pedacos(request):
+    verificar_tamanho(request)
+    total = 0
+    async for pedaco in request.stream():
+        total += len(pedaco)
+        if MAX_BYTES_REQUISICAO and total > MAX_BYTES_REQUISICAO:
+            raise CorpoGrandeDemaisError(f"Requisição maior que o limite de {MAX_BYTES_REQUISICAO} bytes.")
+        if pedaco:
+            yield pedaco
+
+
+async def ler_corpo(request):
+    return b"".join([pedaco async for pedaco in _pedacos(request)])
+
+
+async def ler_json(request, campos_base64):
+    parser = ParserJSON(campos_base64)
+    async for pedaco in _pedacos(request):
+        parser.alimentar(pedaco)
+    return parser.fechar()
+
+
+async def ler_formulario(request, max_itens):
+    # multipart/form-data pelo parser do Starlette, mas com o mesmo
+    # orçamento: o request.form() só respeitaria o Content-Length declarado
+    async with aclosing(_pedacos(request)) as pedacos:
+        try:
+            return await MultiPartParser(request.headers, pedacos, max_files=max_itens, max_fields=max_itens).parse()
+        except MultiPartException as e:
+            raise ErroRequisicao(e.message)
+
+
+async def linhas_ndjson(request):
+    # (número, linha) de cada linha não vazia de um corpo NDJSON, conforme
+    # chega. O limite vale por linha: o corpo inteiro pode ser maior.
+    buf = bytearray()
+    numero = 0
+    async for pedaco in request.stream():
+        buf += pedaco
+        inicio = 0
+        while (fim := buf.find(b"\n", inicio)) >= 0:
+            numero += 1
+            linha = bytes(buf[inicio:fim]).strip()
+            if linha:
+                yield numero, linha
+            inicio = fim + 1
+        del buf[:inicio]
+        if MAX_BYTES_REQUISICAO and len(buf) > MAX_BYTES_REQUISICAO:
+            raise CorpoGrandeDemaisError(f"Linha maior que o limite de {MAX_BYTES_REQUISICAO} bytes.")
+    if bytes(buf).strip():
+        yield numero + 1, bytes(buf).strip()
+
+
+# --- BASE64 INCREMENTAL ---
+_ALFABETO = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+_FORA_DO_ALFABETO = bytes(c for c in range(256) if c not in _ALFABETO)
+
+
+class Base64Decodificado:
+    # Valor de um campo base64 já decodificado. Verdadeiro se o texto não
+    # era vazio (como a str original); dados é None se o base64 era inválido.
+    def __init__(self):
+        self._partes = []
+        self._resto = b""
+        self._tamanho_texto = 0
+        self._invalido = False
+        self.dados = None
+
+    def escrever(self, texto):
+        self._tamanho_texto += len(texto)
+        # Como o b64decode sem validate: ignora o que não é do alfabeto
+        texto = self._resto + texto.translate(None, _FORA_DO_ALFABETO)
+        n = len(texto) - len(texto) % 4
+        self._resto = texto[n:]
+        if n and not self._invalido:
+            try:
+                self._partes.append(binascii.a2b_base64(texto[:n]))
+            except binascii.Error:
+                self._invalido = True
+
+    def fechar(self):
+        if self._resto:
+            self._invalido = True
+        self.dados = None if self._invalido else b"".join(self._partes)
+        self._partes = []
+
+    def __bool__(self):
+        return self._tamanho_texto > 0
+
+
+# --- PARSER ---
+_ESPERA_VALOR, _ESPERA_VALOR_OU_FIM, _ESPERA_CHAVE, _ESPERA_CHAVE_OU_FIM, \
+    _ESPERA_DOIS_PONTOS, _ESPERA_VIRGULA_OU_FIM, _STRING, _FIM = range(8)
+
+_ESPACOS = b" \t\r\n"
+_ESPECIAL_STRING = re.compile(rb'["\\]')
+_CARACTERES_NUMERO = re.compile(rb'[-+0-9.eE]*')
+_NUMERO = re.compile(rb'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?')
+_LITERAIS = ((b"true", True), (b"false", False), (b"null", None))
+
+
+class ParserJSON:
+    # Analisador JSON incremental (alimentar() a cada pedaço, fechar() no
+    # fim). Strings de campos em campos_base64 vão para um
+    # Base64Decodificado; as demais são juntadas e decodificadas no fecho.
+    def __init__(self, campos_base64):
+        self.campos_base64 = set(campos_base64)
+        self.buf = b""
+        self.pos = 0
+        self.estado = _ESPERA_VALOR
+        self.pilha = []   # contêineres abertos
+        self.chaves = []  # chave atual de cada contêiner (None em listas)
+        self.resultado = None
+        self.string = None  # (é chave?, destino) da string aberta
+
+    def _erro(self, mensagem="JSON inválido."):
+        raise ErroRequisicao(mensagem)
+
+    def alimentar(self, pedaco):
+        self.buf = self.buf[self.pos:] + pedaco
+        self.pos = 0
+        self._processar(final=False)
+
+    def fechar(self):
+        self._processar(final=True)
+        if self.estado != _FIM:
+            self._erro("JSON incompleto.")
+        return self.resultado
+
+    def _valor(self, valor):
+        if not self.pilha:
+            self.resultado = valor
+            self.estado = _FIM
+            return
+        topo = self.pilha[-1]
+        if isinstance(topo, list):
+            topo.append(valor)
+        else:
+            topo[self.chaves[-1]] = valor
+        self.estado = _ESPERA_VIRGULA_OU_FIM
+
+    def _abrir(self, conteiner, estado):
+        self.pilha.append(conteiner)
+        self.chaves.append(None)
+        self.estado = estado
+
+    def _fechar_conteiner(self, tipo):
+        if not self.pilha or not isinstance(self.pilha[-1], tipo):
+            self._erro()
+        conteiner = self.pilha.pop()
+        self.chaves.pop()
+        self._valor(conteiner)
+
+    def _iniciar_string(self, chave):
+        if not chave and self.pilha and isinstance(self.pilha[-1], dict) and self.chaves[-1] in self.campos_base64:
+            destino = Base64Decodificado()
+        else:
+            destino = bytearray()
+        self.string = (chave, destino)
+        self.estado = _STRING
+
+    def _fechar_string(self):
+        chave, destino = self.string
+        self.string = None
+        if isinstance(destino, Base64Decodificado):
+            destino.fechar()
+            valor = destino
+        else:
+            try:
+                valor = json.loads(b'"' + bytes(destino) + b'"')
+            except ValueError:
+                self._erro()
+        if chave:
+            self.chaves[-1] = valor
+            self.estado = _ESPERA_DOIS_PONTOS
+        else:
+            self._valor(valor)
+
+    def _consumir_string(self, final):
+        buf, pos = self.buf, self.pos
+        _, destino = self.string
+        base64 = isinstance(destino, Base64Decodificado)
+        escrever = destino.escrever if base64 else destino.extend
+        while True:
+            m = _ESPECIAL_STRING.search(buf, pos)
+            fim = m.start() if m else len(buf)
+            if fim > pos:
+                escrever(buf[pos:fim])
+            if not m:
+                self.pos = len(buf)
+                return False
+            if buf[fim] == 0x22:  # aspas: fim da string
+                self.pos = fim + 1
+                self._fechar_string()
+                return True
+            # Escape: espera o pedaço seguinte se estiver incompleto
+            tamanho = 6 if buf[fim + 1:fim + 2] == b"u" else 2
+            if fim + tamanho > len(buf):
+                if final:
+                    self._erro()
+                self.pos = fim
+                return False
+            escape = buf[fim:fim + tamanho]
+            if not base64:
+                escrever(escape)
+            elif escape == b"\\/":
+                escrever(b"/")
+            elif tamanho == 6:
+                escrever(json.loads(b'"' + escape + b'"').encode("utf-8", "ignore"))
+            pos = fim + tamanho
+
+    def _processar(self, final):
+        buf = self.buf
+        while True:
+            if self.estado == _STRING:
+                if not self._consumir_string(final):
+                    return
+                continue
+            while self.pos < len(buf) and buf[self.pos] in _ESPACOS:
+                self.pos += 1
+            if self.pos >= len(buf):
+                return
+            c = buf[self.pos]
+            estado = self.estado
+
+            if estado == _FIM:
+                self._erro()
+            elif estado in (_ESPERA_VALOR, _ESPERA_VALOR_OU_FIM):
+                if c == 0x5D and estado == _ESPERA_VALOR_OU_FIM:  # ]
+                    self.pos += 1
+                    self._fechar_conteiner(list)
+                elif c == 0x7B:  # {
+                    self.pos += 1
+                    self._abrir({}, _ESPERA_CHAVE_OU_FIM)
+                elif c == 0x5B:  # [
+                    self.pos += 1
+                    self._abrir([], _ESPERA_VALOR_OU_FIM)
+                elif c == 0x22:
+                    self.pos += 1
+                    self._iniciar_string(chave=False)
+                elif not self._escalar(final):
+                    return
+            elif estado in (_ESPERA_CHAVE, _ESPERA_CHAVE_OU_FIM):
+                if c == 0x7D and estado == _ESPERA_CHAVE_OU_FIM:  # }
+                    self.pos += 1
+                    self._fechar_conteiner(dict)
+                elif c == 0x22:
+                    self.pos += 1
+                    self._iniciar_string(chave=True)
+                else:
+                    self._erro()
+            elif estado == _ESPERA_DOIS_PONTOS:
+                if c != 0x3A:
+                    self._erro()
+                self.pos += 1
+                self.estado = _ESPERA_VALOR
+            elif estado == _ESPERA_VIRGULA_OU_FIM:
+                self.pos += 1
+                if c == 0x2C:  # ,
+                    self.estado = _ESPERA_CHAVE if isinstance(self.pilha[-1], dict) else _ESPERA_VALOR
+                elif c == 0x7D:
+                    self._fechar_conteiner(dict)
+                elif c == 0x5D:
+                    self._fechar_conteiner(list)
+                else:
+                    self._erro()
+
+    def _escalar(self, final):
+        # Número ou true/false/null; False se o token pode continuar no
+        # próximo pedaço
+        buf, pos = self.buf, self.pos
+        fim = _CARACTERES_NUMERO.match(buf, pos).end()
+        if fim > pos:
+            if fim == len(buf) and not final:
+                return False
+            m = _NUMERO.match(buf, pos)
+            if not m or m.end() != fim:
+                self._erro()
+            texto = m.group()
+            self.pos = m.end()
+            self._valor(float(texto) if any(c in texto for c in b".eE") else int(texto))
+            return True
+        for literal, valor in _LITERAIS:
+            if buf.startswith(literal, pos):
+                self.pos = pos + len(literal)
+                self._valor(valor)
+                return True
+            if not final and literal.startswith(buf[pos:]):
+                return False
+        self._erro()
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import re
+import traceback
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from app import compacto, extracao, metrics
+from app.armazem import ArmazemLRU
+from app.corpo import ler_json
+from app.erros import ErroRequisicao
+from app.metrics import RespostaJSON
+from app.paginas import CAMPOS_BASE64, carregar_paginas, paginas_de_corpo_json
+
+router = APIRouter()
+
+# Diferença entre escalas para retificações: POST /diff-escala?tipo=PACS
+# recebe o documento novo (qualquer entrada dos normaliza-escala-*) e a
+# escala anterior, já normalizada, e devolve só os plantões adicionados,
+# removidos e alterados. A anterior vem:
+#   ?anterior=<hash>   o X-Escala-Hash devolvido pelo normaliza-escala-*
+#                      chamado com ?guardar=true (ou por um diff anterior),
+#                      guardado aqui num LRU
+#   "anterior": [...]  no corpo JSON, ao lado de "pages"/"documento_base64"
+#                      (verbosa ou ?formato=compacto)
+# ?backend= funciona como nos normaliza-escala-*. A escala nova também é
+# guardada ("atual" na resposta), pronta para a próxima retificação.
+# Cada lado vira um índice (unidade, profissional, data, turno) -> hash do
+# plantão; a comparação é por chave e hash, então o custo do que vai para o
+# downstream é o tamanho da mudança. Mudanças nos dados do profissional
+# (setor, CRM, vínculo...) saem à parte, em "profissionais_alterados".
+#
+# O hash de uma escala é o SHA-256 do JSON verboso exatamente como o
+# normaliza-escala-* responde com formato=json; nesse formato o corpo já
+# renderizado é o que se guarda, sem serializar de novo. Sem ?guardar=true
+# (ou ESCALAS_GUARDAR=1) os normaliza-escala-* não guardam nem calculam hash.
+
+# --- CONFIGURAÇÃO (variáveis de ambiente) ---
+ESCALAS_MAX_BYTES = int(os.getenv("ESCALAS_MAX_BYTES", str(64 * 1024 * 1024)))
+ESCALAS_DIR = os.getenv("ESCALAS_DIR") or None
+ESCALAS_TTL_SEGUNDOS = int(os.getenv("ESCALAS_TTL_SEGUNDOS", str(7 * 24 * 3600)))
+# Padrão do ?guardar= dos normaliza-escala-*
+ESCALAS_GUARDAR = os.getenv("ESCALAS_GUARDAR", "0") == "1"
+
+HASH_REGEX = re.compile(r"^[0-9a-f]{64}$")
+
+escalas = ArmazemLRU(ESCALAS_MAX_BYTES, ESCALAS_DIR, ESCALAS_TTL_SEGUNDOS, extensao=".json")
+
+# tipo -> async func(paginas) que devolve o resultado do normalizador
+_tipos = {}
+
+
+class EscalaNaoEncontradaError(ErroRequisicao):
+    status_code = 404
+
+
+def registrar_tipo(tipo, funcao):
+    _tipos[tipo] = funcao
+
+
+def serializar(resultado):
+    # Os mesmos bytes que o JSONResponse envia
+    return json.dumps(resultado, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def guardar(resultado, dados=None):
+    # Guarda a escala normalizada e devolve o hash (None se desligado);
+    # dados: a escala já serializada, se houver
+    if ESCALAS_MAX_BYTES <= 0:
+        return None
+    with metrics.etapa("hash_escala"):
+        dados = serializar(resultado) if dados is None else dados
+        escala_hash = hashlib.sha256(dados).hexdigest()
+    escalas.guardar(escala_hash, dados)
+    return escala_hash
+
+
+def cabecalho(resposta, escala_hash):
+    if escala_hash:
+        resposta.headers["X-Escala-Hash"] = escala_hash
+    return resposta
+
+
+def guardar_resposta(resposta, resultado, formato, pedido=None):
+    # Nos normaliza-escala-*: guarda só se pedido; com formato=json reusa o
+    # corpo da resposta
+    if not (ESCALAS_GUARDAR if pedido is None else pedido):
+        return resposta
+    return cabecalho(resposta, guardar(resultado, resposta.body if formato == "json" else None))
+
+
+def ler(escala_hash):
+    # Escala guardada por guardar(), já decodificada
+    dados = escalas.obter(escala_hash) if HASH_REGEX.match(escala_hash) else None
+    if dados is None:
+        raise EscalaNaoEncontradaError(f"Escala {escala_hash} não encontrada (expirada ou inexistente).")
+    return json.loads(dados)
+
+
+def _anterior(escala_hash, inline):
+    if inline is not None:
+        return compacto.expandir(inline)
+    if not escala_hash:
+        raise ErroRequisicao("Informe a escala anterior: ?anterior=<hash> ou \"anterior\" no corpo JSON.")
+    return ler(escala_hash)
+
+
+def _hash_item(item):
+    return hashlib.blake2b(json.dumps(item, sort_keys=True, ensure_ascii=False).encode("utf-8"), digest_size=12).digest()
+
+
+def indexar(resultado):
+    # ({(unidade, nome, data, turno): (hash, plantão)}, {(unidade, nome): dados do profissional})
+    plantoes, profissionais = {}, {}
+    if not isinstance(resultado, list):
+        raise ErroRequisicao("Escala deve ser a lista devolvida pelo normaliza-escala-*.")
+    for escala in resultado:
+        if not isinstance(escala, dict):
+            continue
+        unidade = escala.get("unidade_escala")
+        for profissional in escala.get("profissionais") or ():
+            nome = str(profissional.get("medico_nome", "")).strip().upper()
+            dados = {k: v for k, v in profissional.items() if k != "plantoes"}
+            profissionais[(unidade, nome)] = dados
+            for plantao in profissional.get("plantoes") or ():
+                chave = (unidade, nome, plantao.get("data"), plantao.get("turno"))
+                plantoes[chave] = (_hash_item(plantao), plantao)
+    return plantoes, profissionais
+
+
+def _identificacao(chave, profissionais):
+    unidade, nome = chave[:2]
+    dados = profissionais.get((unidade, nome), {})
+    return {
+        "unidade_escala": unidade,
+        "medico_nome": dados.get("medico_nome", nome),
+        **({"medico_crm": dados["medico_crm"]} if dados.get("medico_crm") else {}),
+    }
+
+
+def comparar(anterior, atual):
+    plantoes_antes, profissionais_antes = indexar(anterior)
+    plantoes_depois, profissionais_depois = indexar(atual)
+    adicionados, removidos, alterados = [], [], []
+    for chave, (hash_depois, plantao) in plantoes_depois.items():
+        antes = plantoes_antes.get(chave)
+        if antes is None:
+            adicionados.append({**_identificacao(chave, profissionais_depois), "plantao": plantao})
+        elif antes[0] != hash_depois:
+            alterados.append({**_identificacao(chave, profissionais_depois), "antes": antes[1], "depois": plantao})
+    for chave, (_, plantao) in plantoes_antes.items():
+        if chave not in plantoes_depois:
+            removidos.append({**_identificacao(chave, profissionais_antes), "plantao": plantao})
+    profissionais_alterados = [
+        {"unidade_escala": chave[0], "medico_nome": dados.get("medico_nome", chave[1]),
+         "antes": profissionais_antes[chave], "depois": dados}
+        for chave, dados in profissionais_depois.items()
+        if chave in profissionais_antes and profissionais_antes[chave] != dados
+    ]
+    return {
+        "resumo": {
+            "adicionados": len(adicionados),
+            "removidos": len(removidos),
+            "alterados": len(alterados),
+            "inalterados": len(plantoes_depois) - len(adicionados) - len(alterados),
+            "profissionais_adicionados": len(profissionais_depois.keys() - profissionais_antes.keys()),
+            "profissionais_removidos": len(profissionais_antes.keys() - profissionais_depois.keys()),
+        },
+        "adicionados": adicionados,
+        "removidos": removidos,
+        "alterados": alterados,
+        "profissionais_alterados": profissionais_alterados,
+    }
+
+
+async def _ler_entrada(request):
+    # (páginas, escala anterior inline ou None)
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith(("multipart/", "application/zip", "application/x-zip-compressed", "application/pdf")):
+        return await carregar_paginas(request), None
+    with metrics.etapa("decodificacao"):
+        body = await ler_json(request, CAMPOS_BASE64 + ("documento_base64",))
+        anterior = body.pop("anterior", None) if isinstance(body, dict) else None
+        paginas = await paginas_de_corpo_json(body, request.query_params.get("paginas"))
+    metrics.contar("paginas", len(paginas))
+    return paginas, anterior
+
+
+# --- ROTAS ---
+@router.post("/diff-escala")
+async def diff_escala(request: Request, tipo: str, anterior: str = None, backend: str = None):
+    try:
+        extracao.escolher_backend(backend)
+        if tipo not in _tipos:
+            raise ErroRequisicao(f"Tipo inválido: {tipo!r}. Use um de: {', '.join(_tipos)}.")
+        paginas, inline = await _ler_entrada(request)
+        escala_anterior = _anterior(anterior, inline)
+        if inline is not None:
+            anterior = guardar(escala_anterior)
+        atual = await _tipos[tipo](paginas)
+        with metrics.etapa("diff"):
+            diferencas = comparar(escala_anterior, atual)
+        metrics.contar("plantoes_alterados", sum(diferencas["resumo"][k] for k in ("adicionados", "removidos", "alterados")))
+        escala_hash = guardar(atual)
+        resposta = {"tipo": tipo, "anterior": anterior, "atual": escala_hash, **diferencas}
+        return cabecalho(RespostaJSON(content=resposta), escala_hash)
+    except ErroRequisicao as e:
+        return e.resposta()
+    except Exception as e:
+        return JSONResponse(content={"error": str(e), "trace": traceback.format_exc()}, status_code=500)
+
+
+@router.get("/escalas/{escala_hash}")
+def obter_escala(escala_hash: str, formato: str = "json"):
+    try:
+        compacto.validar_formato(formato)
+        return JSONResponse(content=compacto.formatar(ler(escala_hash), formato))
+    except ErroRequisicao as e:
+        return e.resposta()
@@ -0,0 +1,118 @@
+import base64
+import json
+import os
+
+from app import arranque, metrics
+from app.erros import ErroRequisicao
+from app.pacotes import descrever_pagina
+from app.page_store import page_store
+from app.paginas import interpretar_intervalo
+
+fitz = arranque.ModuloPreguicoso("fitz")  # PyMuPDF
+
+# Divisão do /split-pdf. ?paginas=1-3,7,10- escolhe as páginas (como nos
+# normalizadores): só elas são copiadas e escritas. ?por_arquivo=N agrupa N
+# páginas por arquivo (pages_1-3.pdf, com "paginas": [1, 2, 3]); com 1, o
+# padrão, a saída é a de sempre, page_N.pdf. Cada arquivo informa "bytes".
+# Escrita otimizada (SPLIT_OTIMIZAR ou ?otimizar=): garbage=4 junta objetos
+# e streams repetidos (fontes e imagens copiadas mais de uma vez), deflate
+# comprime o que veio sem compressão e use_objstms agrupa os objetos em
+# object streams. Cada arquivo ainda leva a sua cópia das fontes da página;
+# num arquivo com várias páginas elas são compartilhadas.
+# Arquivos com várias páginas não servem de entrada "uma página por item"
+# dos normalizadores, que os recusam (400; ver extracao.extrair_pagina);
+# para eles use ?por_arquivo=1 ou mande o PDF inteiro (modo documento,
+# app/paginas.py).
+
+# --- CONFIGURAÇÃO (variáveis de ambiente) ---
+SPLIT_OTIMIZAR = os.getenv("SPLIT_OTIMIZAR", "1") != "0"
+
+OPCOES_ESCRITA = {"garbage": 4, "deflate": True, "use_objstms": 1}
+
+
+def planejar(total, intervalo=None, por_arquivo=1):
+    # Índices (0-based) de cada arquivo de saída
+    if por_arquivo < 1:
+        raise ErroRequisicao("por_arquivo deve ser pelo menos 1.")
+    indices = interpretar_intervalo(intervalo, total)
+    return [indices[i:i + por_arquivo] for i in range(0, len(indices), por_arquivo)]
+
+
+def _sequencias(indices):
+    # [0, 1, 2, 5] -> (0, 2), (5, 5): um insert_pdf por trecho contíguo
+    inicio = anterior = indices[0]
+    for i in indices[1:]:
+        if i != anterior + 1:
+            yield inicio, anterior
+            inicio = i
+        anterior = i
+    yield inicio, anterior
+
+
+def escrever_parte(doc, indices, otimizar=SPLIT_OTIMIZAR):
+    saida = fitz.open()
+    try:
+        for inicio, fim in _sequencias(indices):
+            saida.insert_pdf(doc, from_page=inicio, to_page=fim)
+        return saida.write(**(OPCOES_ESCRITA if otimizar else {}))
+    finally:
+        saida.close()
+
+
+def gerar_partes(doc, partes, otimizar=SPLIT_OTIMIZAR):
+    # Gera (página ou tupla de páginas, bytes) de um arquivo por vez; o
+    # documento de saída é fechado antes do yield para manter só um buffer
+    # vivo. Fecha doc no fim.
+    try:
+        for indices in partes:
+            with metrics.etapa("escrita_pdf"):
+                dados = escrever_parte(doc, indices, otimizar)
+            metrics.contar("bytes_paginas_divididas", len(dados))
+            paginas = tuple(i + 1 for i in indices)
+            yield (paginas if len(paginas) > 1 else paginas[0]), dados
+    finally:
+        doc.close()
+
+
+def abrir_partes(contents, intervalo=None, por_arquivo=1, otimizar=SPLIT_OTIMIZAR):
+    # Valida a seleção antes de começar a responder (erro 400, não no meio
+    # do stream) e devolve o gerador de gerar_partes
+    doc = fitz.open(stream=contents, filetype="pdf")
+    try:
+        partes = planejar(len(doc), intervalo, por_arquivo)
+    except BaseException:
+        doc.close()
+        raise
+    metrics.contar("paginas", sum(len(p) for p in partes))
+    return gerar_partes(doc, partes, otimizar)
+
+
+def pagina_split_json(page, page_bytes):
+    descricao = descrever_pagina(page, page_bytes)
+    return {
+        "page": descricao.pop("page"),
+        "file_base64": base64.b64encode(page_bytes).decode("utf-8"),
+        **descricao,
+    }
+
+
+def dividir_pdf(contents, intervalo=None, por_arquivo=1, otimizar=SPLIT_OTIMIZAR):
+    return [pagina_split_json(page, page_bytes) for page, page_bytes in abrir_partes(contents, intervalo, por_arquivo, otimizar)]
+
+
+def dividir_pdf_em_handles(partes):
+    # Roda em thread (não no pool): o page store vive neste processo.
+    return [
+        {**descrever_pagina(page, page_bytes), "handle": page_store.guardar(page_bytes)}
+        for page, page_bytes in partes
+    ]
+
+
+def stream_split_ndjson(partes):
+    # Uma linha JSON por arquivo, enviada assim que ele é escrito.
+    # Erros no meio do stream viram uma última linha {"error": ...}.
+    try:
+        for page, page_bytes in partes:
+            yield json.dumps(pagina_split_json(page, page_bytes)) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
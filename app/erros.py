@@ -0,0 +1,24 @@
+from fastapi.responses import JSONResponse
+
+
+class ErroRequisicao(Exception):
+    # Erro "esperado" que vira resposta {"error": ...} com status próprio.
+    # Usa só a mensagem como argumento para continuar serializável (pickle)
+    # quando levantado dentro de um processo do pool.
+    status_code = 400
+
+    def resposta(self):
+        return JSONResponse(content={"error": str(self)}, status_code=self.status_code)
+
+
+class FilaCheiaError(ErroRequisicao):
+    status_code = 503
+
+    def resposta(self):
+        resposta = super().resposta()
+        resposta.headers["Retry-After"] = "1"
+        return resposta
+
+
+class CorpoGrandeDemaisError(ErroRequisicao):
+    status_code = 413
@@ -0,0 +1,205 @@
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from app import metrics, perfil
+from app.erros import CorpoGrandeDemaisError, FilaCheiaError
+
+# --- CONFIGURAÇÃO (variáveis de ambiente) ---
+# PDF_POOL_WORKERS=0 executa tudo no próprio processo (útil para depuração).
+POOL_WORKERS = int(os.getenv("PDF_POOL_WORKERS", str(os.cpu_count() or 1)))
+POOL_START_METHOD = os.getenv("PDF_POOL_START_METHOD", "spawn")
+MAX_PAGINAS_FILA = int(os.getenv("PDF_MAX_PAGINAS_FILA", "1000"))
+CONCORRENCIA_POR_REQUISICAO = int(os.getenv("PDF_CONCORRENCIA_POR_REQUISICAO", str(max(POOL_WORKERS, 1))))
+# Quanto uma requisição espera por espaço na fila antes do 503
+MAX_ESPERA_FILA_SEGUNDOS = float(os.getenv("PDF_MAX_ESPERA_FILA_SEGUNDOS", "30"))
+# Quanto cada worker espera pelos demais no aquecimento (ver aquecer_pool)
+MAX_ESPERA_AQUECIMENTO_SEGUNDOS = float(os.getenv("PDF_MAX_ESPERA_AQUECIMENTO_SEGUNDOS", "60"))
+
+_pool = None
+_barreira = None  # nos workers: a Barrier de todos eles (ver _iniciar_worker)
+_fila = {"paginas": 0}
+_espera = deque()  # (páginas, future) na ordem de chegada
+# Callback da tarefa atual que recebe o número de páginas concluídas (ver
+# app/jobs.py); fora de um job fica None.
+progresso = contextvars.ContextVar("progresso_paginas", default=None)
+# Nos jobs cada página reserva o seu lugar na fila só quando vai rodar, e sem
+# prazo: a escala pode ser maior que a fila e o job espera a sua vez.
+reserva_por_pagina = contextvars.ContextVar("reserva_por_pagina", default=False)
+
+
+def get_pool():
+    global _pool
+    if _pool is None and POOL_WORKERS > 0:
+        contexto = multiprocessing.get_context(POOL_START_METHOD)
+        _pool = ProcessPoolExecutor(
+            max_workers=POOL_WORKERS,
+            mp_context=contexto,
+            initializer=_iniciar_worker,
+            initargs=(contexto.Barrier(POOL_WORKERS),),
+        )
+    return _pool
+
+
+def _iniciar_worker(barreira):
+    # Roda em cada worker ao subir; a Barrier só pode chegar por aqui
+    global _barreira
+    _barreira = barreira
+
+
+def informar_progresso(paginas):
+    callback = progresso.get()
+    if callback is not None and paginas:
+        callback(paginas)
+
+
+def encerrar_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def executar(func, *args):
+    # Roda uma tarefa pesada (picklable, nível de módulo) fora do event loop.
+    pool = get_pool()
+    if pool is None:
+        return func(*args)
+    perfil_atual = perfil.perfil_atual.get()
+    if perfil_atual is not None:
+        retorno = await asyncio.get_running_loop().run_in_executor(pool, perfil.executar_perfilado, func, *args)
+        return metrics.absorver(perfil_atual.absorver(retorno))
+    retorno = await asyncio.get_running_loop().run_in_executor(pool, metrics.executar_medido, func, *args)
+    return metrics.absorver(retorno)
+
+
+def _despachar():
+    # Atende quem espera, na ordem de chegada, enquanto couber na fila
+    while _espera:
+        paginas, futuro = _espera[0]
+        if not futuro.done():
+            if _fila["paginas"] + paginas > MAX_PAGINAS_FILA:
+                break
+            _fila["paginas"] += paginas
+            futuro.set_result(None)
+        _espera.popleft()
+
+
+def _liberar(paginas):
+    _fila["paginas"] -= paginas
+    _despachar()
+
+
+async def _reservar(paginas, prazo=None):
+    # Reserva páginas na fila global, esperando a vez; passado o prazo,
+    # FilaCheiaError (503)
+    futuro = asyncio.get_running_loop().create_future()
+    _espera.append((paginas, futuro))
+    _despachar()
+    if futuro.done():
+        return
+    try:
+        await asyncio.wait([futuro], timeout=prazo)
+    except BaseException:
+        if futuro.done():
+            _liberar(paginas)
+        else:
+            futuro.cancel()
+            _despachar()
+        raise
+    if not futuro.done():
+        futuro.cancel()
+        _despachar()
+        raise FilaCheiaError(
+            f"Fila de processamento cheia ({_fila['paginas']}/{MAX_PAGINAS_FILA} páginas). Tente novamente."
+        )
+
+
+async def mapear_paginas(func, *iteraveis, concorrencia=None, pesos=None):
+    # Como map(): executa func(a, b, ...) para cada página no pool e devolve
+    # os resultados na ordem original. Reserva as páginas na fila global antes
+    # de começar, esperando até MAX_ESPERA_FILA_SEGUNDOS por espaço; um
+    # documento maior que a fila inteira é recusado (413) de cara. Em jobs
+    # (reserva_por_pagina) cada item reserva o seu lugar ao rodar. pesos dá o
+    # número de páginas de cada item quando um item é um lote de várias
+    # páginas.
+    itens = list(zip(*iteraveis))
+    if not itens:
+        return []
+    pesos = list(pesos) if pesos is not None else [1] * len(itens)
+    por_pagina = reserva_por_pagina.get()
+    total = sum(pesos)
+    reservadas = {"paginas": 0}
+    if not por_pagina:
+        if total > MAX_PAGINAS_FILA:
+            raise CorpoGrandeDemaisError(
+                f"{total} páginas excedem o limite de {MAX_PAGINAS_FILA} por requisição. Use POST /jobs."
+            )
+        await _reservar(total, MAX_ESPERA_FILA_SEGUNDOS)
+        reservadas["paginas"] = total
+    semaforo = asyncio.Semaphore(concorrencia or CONCORRENCIA_POR_REQUISICAO)
+
+    async def _uma(args, peso):
+        async with semaforo:
+            if por_pagina:
+                peso = min(peso, MAX_PAGINAS_FILA)
+                await _reservar(peso)
+                reservadas["paginas"] += peso
+            try:
+                resultado = await executar(func, *args)
+                informar_progresso(peso)
+                return resultado
+            finally:
+                reservadas["paginas"] -= peso
+                _liberar(peso)
+
+    tarefas = [asyncio.ensure_future(_uma(args, peso)) for args, peso in zip(itens, pesos)]
+    try:
+        return await asyncio.gather(*tarefas)
+    except BaseException:
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+        raise
+    finally:
+        # Tarefas canceladas antes de começar não passam pelo finally acima.
+        _liberar(reservadas["paginas"])
+
+
+def _aquecer_worker(funcoes):
+    for funcao in funcoes:
+        funcao()
+    if _barreira is not None:
+        # Segura este worker até cada um ter pegado a sua tarefa, para que
+        # nenhum fique com duas e outro frio
+        try:
+            _barreira.wait(MAX_ESPERA_AQUECIMENTO_SEGUNDOS)
+        except threading.BrokenBarrierError:
+            _barreira.reset()
+    return os.getpid()
+
+
+async def aquecer_pool(funcoes):
+    # Uma tarefa por worker, ao mesmo tempo, para que o pool suba todos. Um
+    # worker ocupado com uma requisição pega a sua quando ela terminar.
+    pool = get_pool()
+    if pool is None:
+        return await asyncio.to_thread(_aquecer_worker, funcoes)
+    loop = asyncio.get_running_loop()
+    pids = await asyncio.gather(*(loop.run_in_executor(pool, _aquecer_worker, funcoes) for _ in range(POOL_WORKERS)))
+    if len(set(pids)) < POOL_WORKERS:
+        raise RuntimeError(f"Só {len(set(pids))} de {POOL_WORKERS} workers aquecidos.")
+
+
+def estado_pool():
+    return {
+        "workers": POOL_WORKERS,
+        "paginas_na_fila": _fila["paginas"],
+        "max_paginas_fila": MAX_PAGINAS_FILA,
+        "reservas_esperando": sum(not futuro.done() for _, futuro in _espera),
+        "concorrencia_por_requisicao": CONCORRENCIA_POR_REQUISICAO,
+    }
@@ -0,0 +1,316 @@
+import contextvars
+import io
+import logging
+import os
+
+from fastapi import APIRouter
+
+from app import arranque, metrics, prefiltro
+from app.cache import extrair_com_cache, extrair_documento_com_cache
+from app.erros import ErroRequisicao
+from app.grade import RE_NOME, grade_de_palavras
+from app.layout import LAYOUT_RAPIDO, aplicar_layout, aprender_layout, layouts_conhecidos, registrar_layout
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+fitz = arranque.ModuloPreguicoso("fitz")  # PyMuPDF
+pdfplumber = arranque.ModuloPreguicoso("pdfplumber")
+
+# Backends de extração de tabelas, comuns a todos os normalizadores. Cada
+# um recebe a página e devolve {"text", "tables"} no mesmo formato:
+#   pymupdf     get_text + find_tables (com o layout rápido, app/layout.py)
+#   pdfplumber  extract_text + extract_tables
+#   palavras    get_text + grade montada das palavras (app/grade.py), sem
+#               depender de linhas de tabela; o mais barato
+#   auto        tenta os backends na ordem de EXTRACAO_ORDEM_AUTO e só passa
+#               ao seguinte quando o texto da página tem cabeçalho (NOME e a
+#               linha de dias) e as tabelas extraídas não têm; a extração
+#               leva "backend": nome de quem resolveu
+# O backend vem do parâmetro ?backend= (endpoints, jobs e sessões) ou do
+# padrão do tipo de escala (EXTRACAO_BACKENDS="PACS=auto,...", senão
+# EXTRACAO_BACKEND). GET /extracao/backends mostra a configuração.
+
+# --- CONFIGURAÇÃO (variáveis de ambiente) ---
+BACKENDS = ("pymupdf", "pdfplumber", "palavras", "auto")
+EXTRACAO_BACKEND = os.getenv("EXTRACAO_BACKEND", "pymupdf")
+EXTRACAO_BACKENDS = dict(
+    par.split("=", 1) for par in os.getenv("EXTRACAO_BACKENDS", "MATERNIDADE-MATRICIAL=pdfplumber").split(",") if "=" in par
+)
+EXTRACAO_ORDEM_AUTO = tuple(
+    nome.strip() for nome in os.getenv("EXTRACAO_ORDEM_AUTO", "palavras,pymupdf,pdfplumber").split(",") if nome.strip()
+)
+# Suba ao mudar o que a extração devolve: invalida o cache de extração
+VERSAO_EXTRACAO = 3
+
+# Backend pedido na tarefa atual (None: padrão do tipo); ver escolher_backend
+backend_escolhido = contextvars.ContextVar("backend_extracao", default=None)
+
+
+def validar_backend(backend):
+    if backend not in BACKENDS:
+        raise ErroRequisicao(f"Backend de extração inválido: {backend!r}. Use um de: {', '.join(BACKENDS)}.")
+    return backend
+
+
+def escolher_backend(backend):
+    # Chamado pelas rotas com o ?backend= recebido (None mantém o padrão)
+    backend_escolhido.set(validar_backend(backend) if backend else None)
+    return backend
+
+
+def backend_do_tipo(tipo):
+    return backend_escolhido.get() or EXTRACAO_BACKENDS.get(tipo, EXTRACAO_BACKEND)
+
+
+def backends_disponiveis():
+    return {
+        "backends": list(BACKENDS),
+        "padrao": EXTRACAO_BACKEND,
+        "por_tipo": EXTRACAO_BACKENDS,
+        "ordem_auto": list(EXTRACAO_ORDEM_AUTO),
+    }
+
+
+# Tarefas de página executadas nos processos do pool (ver app/executor.py):
+# recebem os bytes de um PDF e devolvem só dados simples (texto e linhas de
+# tabela) para serem serializados de volta.
+def contar_paginas(pdf_bytes):
+    # Só falha ao abrir vira 400 (FileDataError/EmptyFileError são
+    # RuntimeError); o resto segue para o handler de 500
+    try:
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    except RuntimeError:
+        raise ErroRequisicao("Documento PDF inválido.")
+    with doc:
+        return len(doc)
+
+
+class _Documento:
+    # Abre o PDF no PyMuPDF e/ou no pdfplumber só quando um backend pede
+    def __init__(self, pdf_bytes):
+        self.pdf_bytes = pdf_bytes
+        self._fitz = None
+        self._plumber = None
+
+    @property
+    def fitz(self):
+        if self._fitz is None:
+            with metrics.etapa("abrir_pdf"):
+                self._fitz = fitz.open(stream=self.pdf_bytes, filetype="pdf")
+        return self._fitz
+
+    @property
+    def plumber(self):
+        if self._plumber is None:
+            with metrics.etapa("abrir_pdf"):
+                self._plumber = pdfplumber.open(io.BytesIO(self.pdf_bytes))
+        return self._plumber
+
+    def __len__(self):
+        return len(self._plumber.pages) if self._plumber is not None and self._fitz is None else len(self.fitz)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self._fitz is not None:
+            self._fitz.close()
+        if self._plumber is not None:
+            self._plumber.close()
+
+
+def _pagina_pymupdf(doc, i, filtro, layouts):
+    page = doc.fitz[i]
+    with metrics.etapa("texto"):
+        text = page.get_text("text")
+    motivo = filtro(text)
+    if motivo:
+        return {"text": text, "tables": [], "ignorada": motivo}
+    words = desenhos = None
+    if LAYOUT_RAPIDO:
+        with metrics.etapa("layout_rapido"):
+            words, desenhos = page.get_text("words"), page.get_drawings()
+            for layout in layouts or []:
+                linhas = aplicar_layout(page, layout, words, desenhos)
+                if linhas is not None:
+                    return {"text": text, "tables": [linhas], "layout": layout["fingerprint"]}
+
+    resultado = {"text": text, "tables": []}
+    with metrics.etapa("find_tables"):
+        for table in page.find_tables():
+            linhas = table.extract()
+            if not linhas: continue
+            resultado["tables"].append(linhas)
+            if LAYOUT_RAPIDO and "layout_aprendido" not in resultado:
+                layout = aprender_layout(page, table, words, desenhos)
+                if layout:
+                    resultado["layout"] = layout["fingerprint"]
+                    resultado["layout_aprendido"] = layout
+    return resultado
+
+
+def _pagina_pdfplumber(doc, i, filtro, layouts):
+    page = doc.plumber.pages[i]
+    with metrics.etapa("texto"):
+        text = page.extract_text() or ""
+    motivo = filtro(text)
+    if motivo:
+        return {"text": text, "tables": [], "ignorada": motivo}
+    with metrics.etapa("tabelas"):
+        return {"text": text, "tables": page.extract_tables()}
+
+
+def _pagina_palavras(doc, i, filtro, layouts):
+    page = doc.fitz[i]
+    with metrics.etapa("texto"):
+        text = page.get_text("text")
+    motivo = filtro(text)
+    if motivo:
+        return {"text": text, "tables": [], "ignorada": motivo}
+    with metrics.etapa("palavras"):
+        grade = grade_de_palavras(page.get_text("words"))
+    return {"text": text, "tables": [grade] if grade else []}
+
+
+_BACKENDS = {"pymupdf": _pagina_pymupdf, "pdfplumber": _pagina_pdfplumber, "palavras": _pagina_palavras}
+
+
+def tem_cabecalho(tabelas):
+    # Alguma tabela com célula NOME e pelo menos MIN_DIAS_SEGUIDOS colunas de dia?
+    for tabela in tabelas:
+        celulas = [str(c).strip().upper() for linha in tabela for c in linha if c is not None]
+        if any(RE_NOME.search(c) for c in celulas):
+            if sum(1 for c in celulas if c.isdigit() and 1 <= int(c) <= 31) >= prefiltro.MIN_DIAS_SEGUIDOS:
+                return True
+    return False
+
+
+def _pagina_auto(doc, i, filtro, layouts):
+    primeira = None
+    for nome in EXTRACAO_ORDEM_AUTO:
+        resultado = _BACKENDS[nome](doc, i, filtro, layouts)
+        resultado["backend"] = nome
+        if primeira is None:
+            primeira = resultado
+            # Página ignorada ou sem cabeçalho no texto: nada a comparar
+            if resultado.get("ignorada") or not prefiltro.parece_ter_cabecalho(resultado["text"]):
+                return resultado
+        if tem_cabecalho(resultado["tables"]):
+            if resultado is not primeira:
+                metrics.contar(f"fallback_{nome}")
+            return resultado
+    return primeira
+
+
+def _extrair_pagina(doc, i, backend, filtro, layouts):
+    extrator = _pagina_auto if backend == "auto" else _BACKENDS[backend]
+    return extrator(doc, i, filtro, layouts)
+
+
+def extrair_pagina(pdf_bytes, backend, filtro, layouts=None, todas=False):
+    # Um item (PDF de uma página do /split-pdf): a extração da página ou,
+    # com todas=True, a lista de extrações de todas as páginas do item
+    with _Documento(pdf_bytes) as doc:
+        if not todas:
+            if len(doc) > 1:
+                # Ler só a primeira perderia plantões sem aviso
+                raise ErroRequisicao(
+                    f"Item com {len(doc)} páginas: envie uma página por item (/split-pdf com por_arquivo=1) "
+                    "ou o PDF inteiro como documento."
+                )
+            return _extrair_pagina(doc, 0, backend, filtro, layouts)
+        layouts = list(layouts or [])
+        resultados = []
+        try:
+            for i in range(len(doc)):
+                resultado = _extrair_pagina(doc, i, backend, filtro, layouts)
+                if "layout_aprendido" in resultado:
+                    layouts.insert(0, resultado["layout_aprendido"])
+                resultados.append(resultado)
+        except Exception as e:
+            # Item com várias páginas: fica o que deu para extrair
+            logger.warning("Erro extraindo a página %d de %d: %s", len(resultados) + 1, len(doc), e)
+        return resultados
+
+
+def extrair_lote(pdf_bytes, indices, backend, filtro, layouts=None, todas=False):
+    # Documento inteiro: abre uma vez e percorre só as páginas do lote; um
+    # layout aprendido no meio do lote já vale para as páginas seguintes.
+    # Com todas=True cada página vem numa lista, como em extrair_pagina.
+    layouts = list(layouts or [])
+    resultados = []
+    with _Documento(pdf_bytes) as doc:
+        for i in indices:
+            resultado = _extrair_pagina(doc, i, backend, filtro, layouts)
+            if "layout_aprendido" in resultado:
+                layouts.insert(0, resultado["layout_aprendido"])
+            resultados.append([resultado] if todas else resultado)
+    return resultados
+
+
+def documento_de(paginas):
+    # (pdf_bytes, índices) quando as páginas vieram de um único documento
+    # enviado inteiro (ver app/paginas.py), senão None
+    if paginas and all(p.get("indice") is not None and p["pdf_bytes"] is paginas[0]["pdf_bytes"] for p in paginas):
+        return paginas[0]["pdf_bytes"], [p["indice"] for p in paginas]
+    return None
+
+
+def _nome_cache(backend, filtro, todas):
+    # O resultado depende do backend (e da ordem, no auto), do filtro, do
+    # formato e da configuração da extração; com o cache em disco, uma troca
+    # de configuração ou de VERSAO_EXTRACAO não reaproveita o que já estava lá
+    nome = "auto:" + "+".join(EXTRACAO_ORDEM_AUTO) if backend == "auto" else backend
+    if filtro is not prefiltro.motivo_para_ignorar:
+        nome += f":{filtro.__name__}"
+    nome += f":v{VERSAO_EXTRACAO}:layout{int(LAYOUT_RAPIDO)}:prefiltro{int(prefiltro.PREFILTRO_PAGINAS)}"
+    return nome + (":todas" if todas else "")
+
+
+async def extrair_paginas(paginas, tipo, filtro=prefiltro.motivo_para_ignorar, todas=False):
+    # Extração de todos os normalizadores, com o backend da tarefa ou do tipo
+    backend = backend_do_tipo(tipo)
+    with metrics.etapa("extracao"):
+        extracoes = await _extrair_paginas(paginas, backend, filtro, todas)
+    prefiltro.registrar(paginas, extracoes)
+    metrics.contar(f"backend_{backend}", len(paginas))
+    metrics.contar("linhas_tabela", sum(
+        len(tabela) for extracao in extracoes for sub in (extracao if todas else [extracao]) for tabela in sub["tables"]
+    ))
+    return extracoes
+
+
+async def _extrair_paginas(paginas, backend, filtro, todas):
+    nome = _nome_cache(backend, filtro, todas)
+
+    async def _extrair(sub, layouts):
+        documento = documento_de(sub)
+        if documento:
+            return await extrair_documento_com_cache(extrair_lote, nome, *documento, backend, filtro, layouts, todas)
+        return await extrair_com_cache(extrair_pagina, nome, [p["pdf_bytes"] for p in sub], backend, filtro, layouts, todas)
+
+    # O layout rápido só vale para o find_tables (pymupdf, ou o auto quando
+    # chega nele). Sem layout conhecido, a primeira página vai sozinha
+    # (find_tables completo) para que as demais já recebam o layout aprendido.
+    if not LAYOUT_RAPIDO or backend not in ("pymupdf", "auto"):
+        return await _extrair(paginas, [])
+    def _registrar(extracoes):
+        for extracao in extracoes:
+            for sub in (extracao if todas else [extracao]):
+                registrar_layout(sub.get("layout_aprendido"))
+
+    extracoes = []
+    if not layouts_conhecidos() and len(paginas) > 1:
+        extracoes = await _extrair(paginas[:1], [])
+        _registrar(extracoes)
+    if paginas[len(extracoes):]:
+        extracoes += await _extrair(paginas[len(extracoes):], layouts_conhecidos())
+    _registrar(extracoes)
+    return extracoes
+
+
+# --- ROTAS ---
+@router.get("/extracao/backends")
+def listar_backends():
+    return backends_disponiveis()
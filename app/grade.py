@@ -0,0 +1,72 @@
+import re
+from statistics import median
+
+# Backend "palavras": monta a tabela só a partir de page.get_text("words"),
+# sem linhas de grade nem find_tables(). As linhas saem do agrupamento das
+# palavras por y; as colunas, das faixas de x que nenhuma palavra da tabela
+# ocupa (da linha de cabeçalho, com NOME, até o primeiro salto vertical
+# grande). Espaços entre palavras da mesma célula são estreitos demais para
+# separar colunas. Serve para tabelas sem bordas e como alternativa barata
+# no modo auto (ver app/extracao.py).
+
+RE_NOME = re.compile(r"\bNOME\b")
+# Intervalo mínimo entre colunas e máximo entre linhas da tabela, em alturas
+# de palavra
+FATOR_INTERVALO_COLUNA = 0.5
+FATOR_SALTO_LINHA = 2.5
+
+
+def _linhas(words):
+    # Palavras agrupadas por linha (centro y), em ordem de leitura
+    linhas = []
+    for w in sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0])):
+        cy, altura = (w[1] + w[3]) / 2, w[3] - w[1]
+        if linhas and cy - linhas[-1]["cy"] <= altura / 2:
+            linhas[-1]["palavras"].append(w)
+        else:
+            linhas.append({"cy": cy, "palavras": [w]})
+    for linha in linhas:
+        linha["palavras"].sort(key=lambda w: w[0])
+    return linhas
+
+
+def _colunas(palavras, intervalo_minimo):
+    # Fronteiras x entre as faixas ocupadas por palavras
+    faixas = []
+    for x0, x1 in sorted((w[0], w[2]) for w in palavras):
+        if faixas and x0 - faixas[-1][1] < intervalo_minimo:
+            faixas[-1][1] = max(faixas[-1][1], x1)
+        else:
+            faixas.append([x0, x1])
+    return [(a[1] + b[0]) / 2 for a, b in zip(faixas, faixas[1:])]
+
+
+def grade_de_palavras(words):
+    # Lista de linhas (listas de células, None nas vazias, como o
+    # find_tables) ou None sem cabeçalho NOME
+    if not words:
+        return None
+    linhas = _linhas(words)
+    inicio = next((i for i, linha in enumerate(linhas)
+                   if any(RE_NOME.search(w[4].upper()) for w in linha["palavras"])), None)
+    if inicio is None:
+        return None
+    altura = median(w[3] - w[1] for w in words)
+    tabela = [linhas[inicio]]
+    passos = []
+    for linha in linhas[inicio + 1:]:
+        passo = linha["cy"] - tabela[-1]["cy"]
+        if passos and passo > FATOR_SALTO_LINHA * median(passos):
+            break
+        passos.append(passo)
+        tabela.append(linha)
+
+    fronteiras = _colunas([w for linha in tabela for w in linha["palavras"]], FATOR_INTERVALO_COLUNA * altura)
+    grade = []
+    for linha in tabela:
+        celulas = [[] for _ in range(len(fronteiras) + 1)]
+        for w in linha["palavras"]:
+            cx = (w[0] + w[2]) / 2
+            celulas[sum(1 for f in fronteiras if f < cx)].append(w[4])
+        grade.append([" ".join(c) if c else None for c in celulas])
+    return grade
@@ -1,9 +1,17 @@
-from fastapi import APIRouter
-from pydantic import BaseModel
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional
-import re
-import unicodedata
-from difflib import get_close_matches
+import json
+import os
+import tempfile
+
+from app import metrics
+from app.corpo import linhas_ndjson
+from app.erros import ErroRequisicao
+from app.prefiltro import RE_LIXO
+from app.regras import MotorRegras, Regra
+from app.setores import SETORES_CONFIG_PATH, SetoresRecarregaveis, normalizar
 
 router = APIRouter()
 
@@ -34,74 +42,165 @@ SETOR_CARIMBO_MAP = {
     "RCP SALA DE ESTABILIZAÇÃO": "Estabilizacao"
 }
 
-SETOR_CHAVES_NORMALIZADAS = {
-    re.sub(r'[^a-z0-9 ]', '', unicodedata.normalize('NFKD', k.lower()).encode('ascii', 'ignore').decode()): v
-    for k, v in SETOR_CARIMBO_MAP.items()
-}
+# Índice pronto no import; SETORES_CONFIG_PATH pode substituir o mapa acima
+setores = SetoresRecarregaveis(SETOR_CARIMBO_MAP, SETORES_CONFIG_PATH)
+
+SPOOL_BYTES = 8 * 1024 * 1024
+
+# Regras da classificação, na ordem de prioridade (ver app/regras.py). Sem
+# regra, a página é descartada. A regra "setor" leva o texto do cabeçalho ao
+# índice de setores; "continuacao" herda o setor da última página válida.
+REGRAS_HGR = (
+    Regra("setor", "setor", r"(?:unidade ?/ ?setor|setor)[\s:.-]*(?P<setor_texto>.+)"),
+    Regra("retificacao", "retificada", r"retifica|alteracao"),
+    Regra("lixo", "descartada", RE_LIXO.pattern),
+    Regra("dados", "continuacao", r"\b(?:pss1|chm|pjm|pj|m|t|n|d)\b", r"\b[a-z]+ [a-z]+\b"),
+)
+motor = MotorRegras(REGRAS_HGR)
 
 class Pagina(BaseModel):
     page_number: int
     filename: str
-    base64: str
+    base64: Optional[str] = None
+    handle: Optional[str] = None
     text: str
 
-@router.post("/classifica-paginas-hgr")
-def classifica_paginas_hgr(paginas: List[Pagina]):
-    resultados = []
-    ultima_classificacao_valida = None
-    ultima_carimbo_valido = None
-
-    for i, pagina in enumerate(paginas):
-        texto = pagina.text
-        texto_lower = texto.lower()
-        texto_normalizado = re.sub(r'[^a-z0-9 ]', '', unicodedata.normalize('NFKD', texto_lower).encode('ascii', 'ignore').decode())
-        linhas = texto_normalizado.splitlines()
-
-        classificacao = "desconhecida"
-        carimbo = None
-
-        # Verifica cabeçalho de setor
-        match = re.search(r'(unidade ?/ ?setor|setor)[\s:.-]*(.+)', texto_lower)
-        setor_extraido = None
-        if match:
-            setor_extraido = match.group(2).strip().splitlines()[0].strip(" :-•")
-            setor_normalizado = re.sub(r'[^a-z0-9 ]', '', unicodedata.normalize('NFKD', setor_extraido.lower()).encode('ascii', 'ignore').decode())
-            setor_proximo = get_close_matches(setor_normalizado, SETOR_CHAVES_NORMALIZADAS.keys(), n=1, cutoff=0.75)
-            if setor_proximo:
-                classificacao = SETOR_CHAVES_NORMALIZADAS[setor_proximo[0]]
-                carimbo = classificacao
-                ultima_classificacao_valida = classificacao
-                ultima_carimbo_valido = carimbo
-            else:
-                classificacao = "desconhecida"
-                carimbo = None
-        else:
+class ClassificadorHGR:
+    # Estado da classificação entre páginas, uma página por vez; o resultado
+    # vai para saida.escrever(), que devolve uma marca. Uma retificação
+    # descarta a última página ainda válida (e uma sequência delas vai
+    # descartando as anteriores) com saida.descartar(marca).
+    def __init__(self, saida):
+        self.indice = setores.indice()
+        self.saida = saida
+        self.ultima_classificacao_valida = None
+        self.ultima_carimbo_valido = None
+        self.candidatas = []
+
+    def _classificar(self, texto_lower):
+        regra, m = motor.avaliar(texto_lower)
+        acao = regra.classificacao if regra else "descartada"
+        if acao == "setor":
+            # Verifica cabeçalho de setor
+            linhas = m.group("setor_texto").strip().splitlines()
+            setor_extraido = linhas[0].strip(" :-•") if linhas else ""
+            setor_proximo = setor_extraido and self.indice.buscar(normalizar(setor_extraido))
+            if not setor_proximo:
+                return "desconhecida", None, None
+            classificacao, _, score = setor_proximo
+            self.ultima_classificacao_valida = classificacao
+            self.ultima_carimbo_valido = classificacao
+            return classificacao, classificacao, round(score, 4)
+        if acao == "retificada":
             # Retificação substitui página anterior
-            if "retifica" in texto_lower or "alteracao" in texto_lower:
-                classificacao = "retificada"
-                carimbo = ultima_carimbo_valido
-                for j in range(len(resultados) - 1, -1, -1):
-                    if resultados[j]["classificacao"] not in ["retificada", "descartada"]:
-                        resultados[j]["classificacao"] = "descartada"
-                        break
-            # Verificação de lixo
-            elif re.search(r"documento assinado|autenticidade do documento|decreto|sei\.rr\.gov\.br", texto_lower):
-                classificacao = "descartada"
-                carimbo = ultima_carimbo_valido
+            if self.candidatas:
+                self.saida.descartar(self.candidatas.pop())
+        elif acao == "continuacao":
             # Dados úteis: nome + turno
-            elif re.search(r"\b(pss1|chm|pjm|pj|m|t|n|d)\b", texto_lower) and re.search(r"\b[a-z]+ [a-z]+\b", texto_lower):
-                classificacao = ultima_classificacao_valida or "desconhecida"
-                carimbo = ultima_carimbo_valido
-            else:
-                classificacao = "descartada"
-                carimbo = ultima_carimbo_valido
-
-        resultados.append({
+            return self.ultima_classificacao_valida or "desconhecida", self.ultima_carimbo_valido, None
+        return acao, self.ultima_carimbo_valido, None
+
+    def adicionar(self, pagina):
+        classificacao, carimbo, score = self._classificar(pagina.text.lower())
+        resultado = {
             "page_number": pagina.page_number,
             "filename": pagina.filename,
-            "base64": pagina.base64,
             "classificacao": classificacao,
-            "carimbo": carimbo
-        })
+            "carimbo": carimbo,
+            # Similaridade do cabeçalho de setor com o carimbo escolhido
+            "score": score
+        }
+        # Só devolve o base64 se ele veio; com handle, devolve só o handle
+        if pagina.base64 is not None: resultado["base64"] = pagina.base64
+        if pagina.handle is not None: resultado["handle"] = pagina.handle
+        marca = self.saida.escrever(resultado)
+        if classificacao not in ("retificada", "descartada"):
+            self.candidatas.append(marca)
+
+class SaidaLista(list):
+    def escrever(self, resultado):
+        self.append(resultado)
+        return resultado
+
+    def descartar(self, resultado):
+        resultado["classificacao"] = "descartada"
+
+@router.post("/classifica-paginas-hgr")
+def classifica_paginas_hgr(paginas: List[Pagina]):
+    resultados = SaidaLista()
+    classificador = ClassificadorHGR(resultados)
+    with metrics.etapa("classificacao"):
+        for pagina in paginas:
+            classificador.adicionar(pagina)
+    return list(resultados)
+
+
+# Modo NDJSON: uma página {"page_number", "filename", "text", "base64" |
+# "handle"} por linha, classificada assim que a linha chega. A saída (uma
+# linha por página, na ordem) vai direto para um arquivo temporário, em
+# memória até SPOOL_BYTES, e é devolvida em streaming depois de lida a
+# entrada inteira: responder enquanto o corpo ainda chega travaria clientes
+# que só leem a resposta depois de enviar tudo.
+class SaidaNDJSON:
+    # O valor de "classificacao" de uma página válida é seguido de espaços
+    # até caber "descartada", escrito por cima se uma retificação a descartar;
+    # da página só fica em memória a posição desse valor no arquivo.
+    DESCARTADA = b'"descartada"'
+
+    def __init__(self):
+        self.arquivo = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+
+    def escrever(self, resultado):
+        dumps = lambda v: json.dumps(v, ensure_ascii=False).encode("utf-8")
+        inicio = dumps({"page_number": resultado["page_number"], "filename": resultado["filename"]})[:-1] + b', "classificacao": '
+        valor = dumps(resultado["classificacao"]).ljust(len(self.DESCARTADA))
+        resto = dumps({k: v for k, v in resultado.items() if k not in ("page_number", "filename", "classificacao")})
+        posicao = self.arquivo.tell() + len(inicio)
+        self.arquivo.write(inicio + valor + b", " + resto[1:] + b"\n")
+        return posicao, len(valor)
+
+    def descartar(self, marca):
+        posicao, tamanho = marca
+        self.arquivo.seek(posicao)
+        self.arquivo.write(self.DESCARTADA.ljust(tamanho))
+        self.arquivo.seek(0, os.SEEK_END)
+
+    def ler(self):
+        self.arquivo.seek(0)
+        with self.arquivo:
+            while pedaco := self.arquivo.read(64 * 1024):
+                yield pedaco
+
+async def _classificar_ndjson(request):
+    saida = SaidaNDJSON()
+    classificador = ClassificadorHGR(saida)
+    try:
+        async for numero, linha in linhas_ndjson(request):
+            try:
+                pagina = Pagina.model_validate_json(linha)
+            except ValidationError as e:
+                erro = e.errors()[0]
+                raise ErroRequisicao(f"Linha {numero}: {'.'.join(map(str, erro['loc'])) or 'página'}: {erro['msg']}.")
+            classificador.adicionar(pagina)
+    except BaseException:
+        saida.arquivo.close()
+        raise
+    return saida
+
+@router.post("/classifica-paginas-hgr/ndjson")
+async def classifica_paginas_hgr_ndjson(request: Request):
+    try:
+        saida = await _classificar_ndjson(request)
+    except ErroRequisicao as e:
+        return e.resposta()
+    return StreamingResponse(saida.ler(), media_type="application/x-ndjson")
+
+
+@router.get("/regras-hgr")
+def regras_hgr():
+    return motor.estado()
+
 
-    return resultados
+@router.get("/setores-hgr")
+def setores_hgr():
+    return setores.estado()
@@ -0,0 +1,253 @@
+import asyncio
+import os
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from app import compacto, executor, extracao, prefiltro
+from app.erros import ErroRequisicao, FilaCheiaError
+from app.paginas import carregar_paginas
+
+router = APIRouter()
+
+# Jobs assíncronos para escalas grandes: POST /jobs?tipo=PACS recebe as
+# páginas em qualquer formato aceito pelos normalizadores e responde na hora
+# com o id; o processamento (o mesmo corpo dos endpoints normaliza-escala-*,
+# registrado por app/main.py) roda em workers asyncio limitados, alimentados
+# por uma fila limitada. GET /jobs/{id}?esperar=30 faz long-poll até o job
+# terminar; DELETE /jobs/{id} cancela ou descarta.
+
+# --- CONFIGURAÇÃO (variáveis de ambiente) ---
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+JOBS_MAX_FILA = int(os.getenv("JOBS_MAX_FILA", "50"))
+JOBS_TTL_SEGUNDOS = int(os.getenv("JOBS_TTL_SEGUNDOS", "3600"))
+JOBS_MAX_RETIDOS = int(os.getenv("JOBS_MAX_RETIDOS", "500"))
+JOBS_MAX_ESPERA_SEGUNDOS = float(os.getenv("JOBS_MAX_ESPERA_SEGUNDOS", "60"))
+
+NA_FILA, PROCESSANDO, CONCLUIDO, ERRO, CANCELADO = "na_fila", "processando", "concluido", "erro", "cancelado"
+FINAIS = (CONCLUIDO, ERRO, CANCELADO)
+
+# tipo -> async func(paginas) que devolve o resultado do normalizador
+_tipos = {}
+_jobs = OrderedDict()
+_estado = {"fila": None, "workers": []}
+
+
+class JobNaoEncontradoError(ErroRequisicao):
+    status_code = 404
+
+
+def registrar_tipo(tipo, funcao):
+    _tipos[tipo] = funcao
+
+
+class Job:
+    def __init__(self, tipo, paginas, backend=None):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.backend = backend
+        self.paginas = paginas
+        self.status = NA_FILA
+        self.paginas_total = len(paginas)
+        self.paginas_processadas = 0
+        self.criado_em = time.time()
+        self.iniciado_em = None
+        self.concluido_em = None
+        self.resultado = None
+        self.erro = None
+        self.paginas_ignoradas = []
+        self.tarefa = None
+        self.terminou = asyncio.Event()
+
+    def progresso(self, paginas):
+        self.paginas_processadas = min(self.paginas_total, self.paginas_processadas + paginas)
+
+    def finalizar(self, status):
+        self.status = status
+        self.concluido_em = time.time()
+        self.paginas = None  # libera os bytes das páginas
+        self.terminou.set()
+
+    def json(self, incluir_resultado=True, formato="json"):
+        dados = {
+            "id": self.id,
+            "tipo": self.tipo,
+            "backend": self.backend,
+            "status": self.status,
+            "paginas_total": self.paginas_total,
+            "paginas_processadas": self.paginas_processadas,
+            "criado_em": self.criado_em,
+            "iniciado_em": self.iniciado_em,
+            "concluido_em": self.concluido_em,
+        }
+        if self.paginas_ignoradas:
+            dados["paginas_ignoradas"] = self.paginas_ignoradas
+        if self.erro is not None:
+            dados["erro"] = self.erro
+        if incluir_resultado and self.status == CONCLUIDO:
+            dados["resultado"] = compacto.formatar(self.resultado, formato)
+        return dados
+
+
+async def _executar_job(job):
+    job.status = PROCESSANDO
+    job.iniciado_em = time.time()
+    executor.progresso.set(job.progresso)
+    # Sem 503 da fila do pool: o job espera a sua vez, página por página
+    executor.reserva_por_pagina.set(True)
+    prefiltro.ignoradas.set(job.paginas_ignoradas)
+    extracao.backend_escolhido.set(job.backend)
+    try:
+        job.resultado = await _tipos[job.tipo](job.paginas)
+        job.paginas_processadas = job.paginas_total
+        job.finalizar(CONCLUIDO)
+    except asyncio.CancelledError:
+        job.finalizar(CANCELADO)
+    except ErroRequisicao as e:
+        job.erro = {"error": str(e), "status_code": e.status_code}
+        job.finalizar(ERRO)
+    except Exception as e:
+        job.erro = {"error": str(e), "trace": traceback.format_exc()}
+        job.finalizar(ERRO)
+
+
+async def _worker(fila):
+    while True:
+        job = await fila.get()
+        try:
+            if job.status != NA_FILA:
+                continue  # cancelado enquanto esperava
+            # Tarefa própria (com cópia do contexto) para poder ser cancelada
+            # sem derrubar o worker
+            job.tarefa = asyncio.ensure_future(_executar_job(job))
+            try:
+                await asyncio.shield(job.tarefa)
+            except asyncio.CancelledError:
+                if not job.tarefa.done():
+                    raise
+        finally:
+            fila.task_done()
+
+
+def iniciar():
+    if _estado["fila"] is not None:
+        return
+    fila = asyncio.Queue(maxsize=JOBS_MAX_FILA)
+    _estado["fila"] = fila
+    _estado["workers"] = [asyncio.ensure_future(_worker(fila)) for _ in range(JOBS_WORKERS)]
+
+
+async def encerrar():
+    for job in _jobs.values():
+        if job.tarefa is not None and not job.tarefa.done():
+            job.tarefa.cancel()
+    for worker in _estado["workers"]:
+        worker.cancel()
+    await asyncio.gather(*_estado["workers"], return_exceptions=True)
+    _estado["fila"], _estado["workers"] = None, []
+
+
+def _limpar_expirados():
+    agora = time.time()
+    finalizados = [j for j in _jobs.values() if j.status in FINAIS]
+    for job in finalizados:
+        if agora - job.concluido_em > JOBS_TTL_SEGUNDOS:
+            del _jobs[job.id]
+    excesso = len(_jobs) - JOBS_MAX_RETIDOS
+    for job in finalizados:
+        if excesso <= 0: break
+        if job.id in _jobs:
+            del _jobs[job.id]
+            excesso -= 1
+
+
+def _obter(job_id):
+    _limpar_expirados()
+    job = _jobs.get(job_id)
+    if job is None:
+        raise JobNaoEncontradoError(f"Job {job_id} não encontrado (expirado ou inexistente).")
+    return job
+
+
+def enfileirar(tipo, paginas, backend=None):
+    if tipo not in _tipos:
+        raise ErroRequisicao(f"Tipo de job inválido: {tipo!r}. Use um de: {', '.join(_tipos)}.")
+    if backend:
+        extracao.validar_backend(backend)
+    if not paginas:
+        raise ErroRequisicao("Nenhuma página recebida.")
+    iniciar()
+    _limpar_expirados()
+    job = Job(tipo, paginas, backend)
+    try:
+        _estado["fila"].put_nowait(job)
+    except asyncio.QueueFull:
+        raise FilaCheiaError(f"Fila de jobs cheia ({JOBS_MAX_FILA}). Tente novamente.")
+    _jobs[job.id] = job
+    return job
+
+
+def estado_jobs():
+    fila = _estado["fila"]
+    contagem = {}
+    for job in _jobs.values():
+        contagem[job.status] = contagem.get(job.status, 0) + 1
+    return {
+        "workers": JOBS_WORKERS,
+        "na_fila": fila.qsize() if fila else 0,
+        "max_fila": JOBS_MAX_FILA,
+        "ttl_segundos": JOBS_TTL_SEGUNDOS,
+        "jobs": contagem,
+    }
+
+
+# --- ROTAS ---
+@router.post("/jobs")
+async def criar_job(request: Request, tipo: str, backend: str = None):
+    try:
+        job = enfileirar(tipo, await carregar_paginas(request), backend)
+        return JSONResponse(content=job.json(), status_code=202)
+    except ErroRequisicao as e:
+        return e.resposta()
+
+
+@router.get("/jobs")
+async def listar_jobs():
+    _limpar_expirados()
+    return {**estado_jobs(), "lista": [job.json(incluir_resultado=False) for job in _jobs.values()]}
+
+
+@router.get("/jobs/{job_id}")
+async def consultar_job(job_id: str, esperar: float = 0, resultado: bool = True, formato: str = "json"):
+    try:
+        compacto.validar_formato(formato)
+        job = _obter(job_id)
+        if esperar > 0 and job.status not in FINAIS:
+            try:
+                await asyncio.wait_for(job.terminou.wait(), timeout=min(esperar, JOBS_MAX_ESPERA_SEGUNDOS))
+            except asyncio.TimeoutError:
+                pass
+        return JSONResponse(content=job.json(incluir_resultado=resultado, formato=formato))
+    except ErroRequisicao as e:
+        return e.resposta()
+
+
+@router.delete("/jobs/{job_id}")
+async def cancelar_job(job_id: str):
+    try:
+        job = _obter(job_id)
+        if job.status == NA_FILA:
+            job.finalizar(CANCELADO)
+        elif job.status == PROCESSANDO:
+            job.tarefa.cancel()
+            await asyncio.wait([job.tarefa])
+        else:
+            del _jobs[job.id]
+            return JSONResponse(content={"id": job.id, "removido": True})
+        return JSONResponse(content=job.json(incluir_resultado=False))
+    except ErroRequisicao as e:
+        return e.resposta()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+from bisect import bisect_right
+from collections import OrderedDict
+
+# Atalho de layout para as escalas no template fixo da SESAU (NOME COMPLETO,
+# CARGO, VÍNCULO, CRM, dias 1..31). O find_tables() da primeira página
+# ensina as fronteiras x das colunas; as páginas seguintes são recortadas em
+# células a partir de page.get_text("words") e das linhas horizontais da
+# grade, bem mais barato. Um layout só é aceito se o recorte reproduzir
+# exatamente o find_tables() da página onde foi aprendido, e só é usado numa
+# página nova se a linha de cabeçalho recortada for idêntica à aprendida e
+# nada da faixa vertical da tabela (palavras ou arestas verticais da grade)
+# ficar fora das colunas aprendidas; senão a página volta ao find_tables().
+# Ex.: o layout de fevereiro (28 dias) num mês de 31 perderia os dias 29-31.
+
+LAYOUT_RAPIDO = os.getenv("PDF_LAYOUT_RAPIDO", "1") != "0"
+MAX_LAYOUTS = int(os.getenv("PDF_MAX_LAYOUTS", "32"))
+TOLERANCIA = 1.0
+
+# (largura, nº de colunas) -> layout, no processo principal
+_layouts = OrderedDict()
+
+
+def _agrupar(valores, tol=TOLERANCIA):
+    grupos = []
+    for v in sorted(valores):
+        if grupos and v - grupos[-1] <= tol: continue
+        grupos.append(v)
+    return grupos
+
+
+def _alinhado(x, colunas):
+    i = bisect_right(colunas, x)
+    return any(0 <= j < len(colunas) and abs(colunas[j] - x) <= TOLERANCIA for j in (i - 1, i))
+
+
+def _linhas_horizontais(desenhos, colunas):
+    # y das arestas horizontais cujas pontas caem nas fronteiras das colunas
+    ys = []
+    for desenho in desenhos:
+        for item in desenho["items"]:
+            if item[0] == "re":
+                r = item[1]
+                bordas = [(r.x0, r.x1, r.y0), (r.x0, r.x1, r.y1)]
+            elif item[0] == "l" and abs(item[1].y - item[2].y) < 0.5:
+                bordas = [(min(item[1].x, item[2].x), max(item[1].x, item[2].x), item[1].y)]
+            else:
+                continue
+            for x0, x1, y in bordas:
+                if x1 - x0 > TOLERANCIA and _alinhado(x0, colunas) and _alinhado(x1, colunas):
+                    ys.append(y)
+    return _agrupar(ys)
+
+
+def _grade_fora_das_colunas(desenhos, colunas, y0, y1):
+    # Aresta vertical da grade, dentro da faixa da tabela, fora das colunas
+    # aprendidas: a página tem outro número (ou outra largura) de colunas
+    for desenho in desenhos:
+        for item in desenho["items"]:
+            if item[0] == "re":
+                r = item[1]
+                bordas = [(r.x0, r.y0, r.y1), (r.x1, r.y0, r.y1)]
+            elif item[0] == "l" and abs(item[1].x - item[2].x) < 0.5:
+                bordas = [(item[1].x, min(item[1].y, item[2].y), max(item[1].y, item[2].y))]
+            else:
+                continue
+            for x, ya, yb in bordas:
+                if ya < y1 - TOLERANCIA and yb > y0 + TOLERANCIA and not _alinhado(x, colunas):
+                    return True
+    return False
+
+
+def recortar_tabela(layout, words, desenhos):
+    colunas = layout["colunas"]
+    ys = _linhas_horizontais(desenhos, colunas)
+    if len(ys) < 2 or _grade_fora_das_colunas(desenhos, colunas, ys[0], ys[-1]):
+        return None
+    celulas = {}
+    for w in words:
+        cx, cy = (w[0] + w[2]) / 2, (w[1] + w[3]) / 2
+        col = bisect_right(colunas, cx) - 1
+        lin = bisect_right(ys, cy) - 1
+        if 0 <= lin < len(ys) - 1:
+            if not 0 <= col < len(colunas) - 1:
+                return None
+            # Texto vazando para a coluna vizinha: o find_tables() corta
+            # caracteres no meio da palavra, o recorte por palavras não
+            if bisect_right(colunas, w[0] + TOLERANCIA) != bisect_right(colunas, w[2] - TOLERANCIA):
+                return None
+            celulas.setdefault((lin, col), []).append(w)
+    linhas = []
+    for lin in range(len(ys) - 1):
+        linha = []
+        for col in range(len(colunas) - 1):
+            partes = {}
+            for w in sorted(celulas.get((lin, col), []), key=lambda w: (w[5], w[6], w[7])):
+                partes.setdefault((w[5], w[6]), []).append(w[4])
+            linha.append("\n".join(" ".join(p) for p in partes.values()))
+        linhas.append(linha)
+    return linhas
+
+
+def _linha_cabecalho(linhas):
+    return next((linha for linha in linhas if any("NOME" in str(c or '').upper() for c in linha)), None)
+
+
+def aprender_layout(page, table, words, desenhos):
+    # Chamado depois de um find_tables() completo; devolve None quando o
+    # recorte por palavras não reproduz a tabela detectada.
+    cells = [c for c in table.cells if c]
+    if not cells:
+        return None
+    esperado = [["" if c is None else c for c in linha] for linha in table.extract()]
+    cabecalho = _linha_cabecalho(esperado)
+    if cabecalho is None:
+        return None
+    layout = {
+        "largura": round(page.rect.width, 1),
+        "colunas": _agrupar([c[0] for c in cells] + [c[2] for c in cells]),
+        "cabecalho": cabecalho,
+    }
+    if recortar_tabela(layout, words, desenhos) != esperado:
+        return None
+    layout["fingerprint"] = hashlib.sha1(json.dumps(layout, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return layout
+
+
+def aplicar_layout(page, layout, words, desenhos):
+    # Tabela recortada pelo layout, ou None se a página não bate com ele
+    if round(page.rect.width, 1) != layout["largura"]:
+        return None
+    linhas = recortar_tabela(layout, words, desenhos)
+    if not linhas or layout["cabecalho"] not in linhas:
+        return None
+    return linhas
+
+
+def layouts_conhecidos():
+    # Mais recente primeiro
+    return list(reversed(_layouts.values()))
+
+
+def registrar_layout(layout):
+    # Um layout por formato de tabela: um novo com a mesma largura e o mesmo
+    # número de colunas substitui o anterior
+    if not layout:
+        return
+    chave = (layout["largura"], len(layout["colunas"]) - 1)
+    _layouts[chave] = layout
+    _layouts.move_to_end(chave)
+    while len(_layouts) > MAX_LAYOUTS:
+        _layouts.popitem(last=False)
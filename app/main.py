@@ -1,41 +1,81 @@
 from fastapi import FastAPI, UploadFile, File, Request
-from fastapi.responses import JSONResponse
-from openpyxl import Workbook, load_workbook
-from app.hgr import router as hgr_router
-import tempfile
-import fitz  # PyMuPDF
-import base64
-import os
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from app.hgr import motor as regras_hgr, router as hgr_router
+from app import arranque, consultas, diferencas, divisao, executor, jobs, metrics, perfil, prefiltro, sessoes, textopdf
+from app.compacto import formatar, validar_formato, router as compacto_router
+from app.corpo import ler_json
+from app.erros import ErroRequisicao
+from app.extracao import escolher_backend, extrair_paginas, router as extracao_router
+from app.pacotes import stream_zip, stream_multipart, nova_fronteira
+from app.paginas import carregar_paginas, decodificar_base64, router as paginas_router
+from app.planilhas import router as planilhas_router
+from app.page_store import page_store
+from app import turnos
+from app.cache import cache_extracao, router as cache_router
+from app.metrics import MetricasMiddleware, RespostaJSON, router as metrics_router
 import io
-from fpdf import FPDF
 import traceback
 from collections import defaultdict
 import re
-from datetime import datetime, timedelta
-import pdfplumber
 from typing import List
-import uvicorn # Adicionado para o bloco __main__
-
-app = FastAPI()
+from contextlib import asynccontextmanager
+from functools import partial
+
+@asynccontextmanager
+async def lifespan(app):
+    jobs.iniciar()
+    arranque.iniciar()
+    yield
+    await arranque.encerrar()
+    await jobs.encerrar()
+    executor.encerrar_pool()
+
+app = FastAPI(lifespan=lifespan)
+# O perfil fica dentro das métricas (o último adicionado é o mais externo)
+app.add_middleware(perfil.PerfilMiddleware)
+app.add_middleware(MetricasMiddleware)
 
 app.include_router(hgr_router)
+app.include_router(paginas_router)
+app.include_router(planilhas_router)
+app.include_router(textopdf.router)
+app.include_router(extracao_router)
+app.include_router(cache_router)
+app.include_router(metrics_router)
+app.include_router(arranque.router)
+app.include_router(perfil.router)
+app.include_router(compacto_router)
+app.include_router(diferencas.router)
+app.include_router(consultas.router)
+app.include_router(jobs.router)
+app.include_router(sessoes.router)
+
+metrics.registrar_estado("pool", executor.estado_pool)
+metrics.registrar_estado("cache_extracao", cache_extracao.estado)
+metrics.registrar_estado("page_store", page_store.estado)
+metrics.registrar_estado("escalas", diferencas.escalas.estado)
+metrics.registrar_estado("consultas", consultas.indice.estado)
+metrics.registrar_estado("regras_hgr", regras_hgr.acertos)
+metrics.registrar_estado("arranque", arranque.estado)
+metrics.registrar_estado("perfil", perfil.estado)
+
+# Aquecimento em segundo plano depois do arranque (ver app/arranque.py)
+arranque.registrar_pool(executor.aquecer_pool)
+arranque.registrar_aquecimento("fitz", partial(arranque.importar, "fitz"), processos=("app", "pool"))
+arranque.registrar_aquecimento("fonte", textopdf.fonte_base, processos=("pool",))
+arranque.registrar_aquecimento("pdfplumber", partial(arranque.importar, "pdfplumber"), processos=("pool",))
+arranque.registrar_aquecimento("openpyxl", partial(arranque.importar, "openpyxl"))
+arranque.registrar_aquecimento("regras_hgr", regras_hgr.compilar)
 
 # --- DEFINIÇÕES GLOBAIS E FUNÇÕES AUXILIARES (CONSOLIDADAS) ---
 
-FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
-
 MONTH_MAP = {
     'JANEIRO': 1, 'FEVEREIRO': 2, 'MARÇO': 3, 'ABRIL': 4, 'MAIO': 5,
     'JUNHO': 6, 'JULHO': 7, 'AGOSTO': 8, 'SETEMBRO': 9, 'OUTUBRO': 10,
     'NOVEMBRO': 11, 'DEZEMBRO': 12
 }
 
-HORARIOS_TURNO = {
-    "MANHÃ": {"inicio": "07:00", "fim": "13:00"},
-    "TARDE": {"inicio": "13:00", "fim": "19:00"},
-    "NOITE (início)": {"inicio": "19:00", "fim": "01:00"},
-    "NOITE (fim)": {"inicio": "01:00", "fim": "07:00"},
-}
 
 PROFISSIONAIS_ANCHOR_MATRICIAL = [
     {"medico_nome": "MARCO ANTÔNIO LEAL SANTOS", "medico_setor": "CAMED/BLOCOS/ISOLAMENTO/UTIN/UCINco/UCINca", "medico_unidade": "HMINSN"},
@@ -54,55 +94,6 @@ def parse_mes_ano_geral(text):
     mes_nome, ano_str = match.groups()
     return MONTH_MAP.get(mes_nome.upper()), int(ano_str)
 
-def interpretar_turno_pdf(token):
-    token = token.replace('\n', '').replace('/', '').replace(' ', '').upper()
-    turnos_finais = []
-    for t in token:
-        if t == 'M': turnos_finais.append("MANHÃ")
-        elif t == 'T': turnos_finais.append("TARDE")
-        elif t == 'D': turnos_finais.extend(["MANHÃ", "TARDE"])
-        elif t == 'N': turnos_finais.extend(["NOITE (início)", "NOITE (fim)"])
-        elif t == 'n': turnos_finais.append("NOITE (início)")
-    return turnos_finais
-
-def interpretar_turno_pacs(token: str):
-    if not token or not isinstance(token, str):
-        return []
-    token_clean = token.replace('\n', ' ').replace('/', ' ').replace(' ', '')
-    tokens = list(token_clean)
-    turnos_finais = []
-    if "TOTAL" in token.upper() or "PL" in token.upper():
-        return []
-    for t in tokens:
-        if t == 'M': turnos_finais.append({"turno": "MANHÃ"})
-        elif t == 'T': turnos_finais.append({"turno": "TARDE"})
-        elif t == 'D':
-            turnos_finais.append({"turno": "MANHÃ"})
-            turnos_finais.append({"turno": "TARDE"})
-        elif t == 'N':
-            turnos_finais.append({"turno": "NOITE (início)"})
-            turnos_finais.append({"turno": "NOITE (fim)"})
-        elif t == 'n': turnos_finais.append({"turno": "NOITE (início)"})
-    return turnos_finais
-
-def interpretar_turno_matricial(token):
-    if not token or not isinstance(token, str):
-        return []
-    token_clean = token.replace('\n', '').replace(' ', '').replace('/', '')
-    if "TOTAL" in token.upper() or "PL" in token.upper():
-        return []
-    if len(token_clean) >= 2 and token_clean[-1].upper() in ['M', 'T', 'D', 'N']:
-        tokens = [token_clean[-1].upper()]
-    else:
-        tokens = list(token_clean.upper())
-    turnos = []
-    for t in tokens:
-        if t == 'M': turnos.append({"turno": "MANHÃ"})
-        elif t == 'T': turnos.append({"turno": "TARDE"})
-        elif t == 'D': turnos.append({"turno": "MANHÃ"}); turnos.append({"turno": "TARDE"})
-        elif t == 'N': turnos.append({"turno": "NOITE (início)"}); turnos.append({"turno": "NOITE (fim)"})
-    return turnos
-
 def is_valid_professional_name(name):
     if not name or not isinstance(name, str): return False
     name_upper = name.strip().upper()
@@ -115,16 +106,6 @@ def extrair_metadados_pagina(page_text):
     setor = re.search(r'UNIDADE[/\s-]*SETOR[:\s-]*(.+?)(MÊS|ESCALA|$)', page_text.replace('\n', ' '), re.I)
     return unidade.group(1).strip() if unidade else None, setor.group(1).strip() if setor else None
 
-def dedup_plantao(plantoes):
-    seen = set()
-    result = []
-    for p in plantoes:
-        key = (p["data"], p["turno"], p["inicio"], p["fim"])
-        if key not in seen:
-            seen.add(key)
-            result.append(p)
-    return result
-
 def extrair_setor_e_unidade_matricial(text, lines, table_data=None):
     text_normalized = text.upper().replace('Ç', 'C').replace('Á', 'A').replace('É', 'E').replace('Í', 'I').replace('Ó', 'O').replace('Ú', 'U')
     nome_unidade, nome_setor = "NÃO INFORMADO", "NÃO INFORMADO"
@@ -146,247 +127,283 @@ def extrair_setor_e_unidade_matricial(text, lines, table_data=None):
 
 # --- ENDPOINTS DA API ---
 
-@app.post("/xlsx-to-json")
-async def convert_xlsx_to_json(file: UploadFile = File(...)):
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
-            contents = await file.read()
-            tmp.write(contents)
-            tmp_path = tmp.name
-        
-        workbook = load_workbook(filename=tmp_path, data_only=True)
-        all_data = {}
-        for sheet_name in workbook.sheetnames:
-            sheet = workbook[sheet_name]
-            rows = list(sheet.iter_rows(values_only=True))
-            if not rows: continue
-            headers = [str(cell).strip() if cell is not None else "" for cell in rows[0]]
-            data = [dict(zip(headers, row)) for row in rows[1:]]
-            all_data[sheet_name] = data
-        
-        os.remove(tmp_path)
-        return JSONResponse(content=all_data)
-    except Exception as e:
-        return JSONResponse(content={"error": str(e), "trace": traceback.format_exc()}, status_code=500)
-
 @app.post("/split-pdf")
-async def split_pdf(file: UploadFile = File(...)):
+async def split_pdf(file: UploadFile = File(...), formato: str = "json", paginas: str = None, por_arquivo: int = 1,
+                    otimizar: bool = None):
     try:
         contents = await file.read()
-        pages_b64 = []
-        with fitz.open(stream=contents, filetype="pdf") as doc:
-            for i in range(len(doc)):
-                single_page = fitz.open()
-                single_page.insert_pdf(doc, from_page=i, to_page=i)
-                b64_bytes = single_page.write()
-                b64_content = base64.b64encode(b64_bytes).decode("utf-8")
-                pages_b64.append({
-                    "page": i + 1,
-                    "file_base64": b64_content,
-                    "filename": f"page_{i+1}.pdf"
-                })
-                single_page.close()
+        otimizar = divisao.SPLIT_OTIMIZAR if otimizar is None else otimizar
+        if formato in ("ndjson", "handles", "zip", "multipart"):
+            partes = divisao.abrir_partes(contents, paginas, por_arquivo, otimizar)
+        if formato == "ndjson":
+            return StreamingResponse(divisao.stream_split_ndjson(partes), media_type="application/x-ndjson")
+        if formato == "handles":
+            return JSONResponse(content={"pages": await run_in_threadpool(divisao.dividir_pdf_em_handles, partes)})
+        if formato == "zip":
+            return StreamingResponse(stream_zip(partes), media_type="application/zip",
+                                     headers={"Content-Disposition": 'attachment; filename="pages.zip"'})
+        if formato == "multipart":
+            fronteira = nova_fronteira()
+            return StreamingResponse(stream_multipart(partes, fronteira),
+                                     media_type=f'multipart/mixed; boundary="{fronteira}"')
+        pages_b64 = await executor.executar(divisao.dividir_pdf, contents, paginas, por_arquivo, otimizar)
         return JSONResponse(content={"pages": pages_b64})
+    except ErroRequisicao as e:
+        return e.resposta()
     except Exception as e:
         return JSONResponse(content={"error": str(e), "trace": traceback.format_exc()}, status_code=500)
 
 @app.post("/split-pdf-base64")
-async def split_pdf_base64(request: Request):
+async def split_pdf_base64(request: Request, formato: str = "json", paginas: str = None, por_arquivo: int = 1,
+                           otimizar: bool = None):
     try:
-        body = await request.json()
-        b64 = body.get("base64")
+        # O campo base64 chega já decodificado, sem a str inteira em memória
+        body = await ler_json(request, ("base64",))
+        b64 = body.get("base64") if isinstance(body, dict) else None
         if not b64:
             return JSONResponse(content={"error": "Campo 'base64' ausente"}, status_code=400)
         
-        return await split_pdf(UploadFile(file=io.BytesIO(base64.b64decode(b64))))
+        pdf_bytes = decodificar_base64(b64)
+        if not pdf_bytes:
+            raise ErroRequisicao("base64 inválido em 'base64'.")
+        paginas = paginas or body.get("paginas")
+        del body, b64  # libera o JSON antes de dividir
+        return await split_pdf(UploadFile(file=io.BytesIO(pdf_bytes)), formato=formato, paginas=paginas,
+                               por_arquivo=por_arquivo, otimizar=otimizar)
+    except ErroRequisicao as e:
+        return e.resposta()
     except Exception as e:
         return JSONResponse(content={"error": str(e), "trace": traceback.format_exc()}, status_code=500)
 
-@app.post("/text-to-pdf")
-async def text_to_pdf(request: Request):
-    try:
-        data = await request.json()
-        raw_text = data.get("text", "")
-        filename = data.get("filename", "saida.pdf")
+# Consolidação no pool, comum aos normalizadores (etapa e contagem para o /metrics)
+async def consolidar(func, *args):
+    with metrics.etapa("consolidacao"):
+        saida = await executor.executar(func, *args)
+    metrics.contar("profissionais", sum(len(escala["profissionais"]) for escala in saida))
+    return saida
 
-        if not os.path.exists(FONT_PATH):
-            raise RuntimeError(f"Fonte não encontrada em: {FONT_PATH}")
+# --- INÍCIO normaliza-escala-from-pdf ---
+class EscalaFromPdf:
+    # Consolidação alimentada página a página (o endpoint passa todas de uma
+    # vez; app/sessoes.py passa conforme chegam). Os turnos de cada linha já
+    # saem decodificados; só a expansão em datas fica para o fim, porque usa
+    # o último mês/ano visto no documento.
+    def __init__(self):
+        self.last_unidade, self.last_setor, self.last_mes, self.last_ano = None, None, None, None
+        self.header, self.header_map, self.nome_idx = None, None, None
+        self.profissionais_data = defaultdict(list)  # nome -> [(dia, códigos de turno)]
+
+    def adicionar(self, extracao):
+        page_text = extracao["text"]
+        unidade, setor = extrair_metadados_pagina(page_text)
+        if unidade: self.last_unidade = unidade
+        if setor: self.last_setor = setor
+        mes, ano = parse_mes_ano_geral(page_text)
+        if mes: self.last_mes = mes
+        if ano: self.last_ano = ano
+        tabelas = extracao["tables"]
+        if tabelas:
+            for row in tabelas[0]:
+                self._linha(row)
+
+    def _linha(self, row):
+        if self.header is None:
+            if row and "NOME COMPLETO" in ''.join(map(str, row)).upper():
+                self.header = row
+                self.nome_idx = next(i for i, col in enumerate(row) if "NOME COMPLETO" in str(col).upper())
+            return
+        if self.header_map is None:
+            # Linha logo abaixo do cabeçalho: números dos dias
+            self.header_map = {i: col.strip() for i, col in enumerate(row) if str(col).strip().isdigit()}
+            return
+        nome_bruto = row[self.nome_idx]
+        if not is_valid_professional_name(nome_bruto): return
+        nome = ' '.join(nome_bruto.split())
+        for idx, dia in self.header_map.items():
+            if idx < len(row) and row[idx]:
+                codigos_turno = turnos.decodificar_pdf(row[idx])
+                if codigos_turno: self.profissionais_data[nome].append((int(dia), codigos_turno))
+
+    def finalizar(self):
+        if self.header is None:
+            raise ErroRequisicao("Cabeçalho não encontrado.")
+        if self.header_map is None:
+            raise ErroRequisicao("Linha de dias não encontrada abaixo do cabeçalho.")
 
-        clean_text = " ".join(raw_text.replace("\r", "").split())
-        lines = [clean_text[i:i+120] for i in range(0, len(clean_text), 120)]
+        lista_profissionais_final = []
+        for nome, dias in self.profissionais_data.items():
+            codigos = [c for dia, codigos_turno in dias for c in turnos.expandir(self.last_ano, self.last_mes, dia, codigos_turno)]
+            lista_profissionais_final.append({
+                "medico_nome": nome, "medico_setor": self.last_setor or "NÃO INFORMADO",
+                "plantoes": turnos.materializar(turnos.ordenar_por_horario(codigos))
+            })
 
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.add_font("DejaVu", "", FONT_PATH, uni=True)
-        pdf.set_font("DejaVu", size=10)
+        mes_nome_str = next(k for k, v in MONTH_MAP.items() if v == self.last_mes)
+        return [{"unidade_escala": self.last_unidade or "NÃO INFORMADO", "mes_ano_escala": f"{mes_nome_str}/{self.last_ano}", "profissionais": lista_profissionais_final}]
 
-        for line in lines:
-            pdf.multi_cell(w=190, h=8, txt=line)
+def consolidar_escala_from_pdf(extracoes):
+    escala = EscalaFromPdf()
+    for extracao in extracoes:
+        escala.adicionar(extracao)
+    return escala.finalizar()
 
-        pdf_bytes = pdf.output(dest='S').encode('latin1')
-        base64_pdf = base64.b64encode(pdf_bytes).decode("utf-8")
+async def extrair_paginas_from_pdf(paginas):
+    return await extrair_paginas(paginas, "from-pdf")
 
-        return JSONResponse(content={"file_base64": base64_pdf, "filename": filename})
-    except Exception as e:
-        return JSONResponse(content={"error": str(e), "trace": traceback.format_exc()}, status_code=500)
+async def normalizar_from_pdf(paginas):
+    extracoes = await extrair_paginas_from_pdf(paginas)
+    return await consolidar(consolidar_escala_from_pdf, extracoes)
+
+jobs.registrar_tipo("from-pdf", normalizar_from_pdf)
+diferencas.registrar_tipo("from-pdf", normalizar_from_pdf)
+sessoes.registrar_tipo("from-pdf", extrair_paginas_from_pdf, EscalaFromPdf)
 
-# --- INÍCIO normaliza-escala-from-pdf ---
 @app.post("/normaliza-escala-from-pdf")
-async def normaliza_escala_from_pdf(request: Request):
+async def normaliza_escala_from_pdf(request: Request, backend: str = None, formato: str = "json", guardar: bool = None):
     try:
-        body = await request.json()
-        pages = body["pages"] if isinstance(body, dict) else body
-        all_table_rows, last_unidade, last_setor, last_mes, last_ano = [], None, None, None, None
-
-        for page_data in pages:
-            b64_data = page_data.get("file_base64") or page_data.get("base64")
-            if not b64_data: continue
-
-            pdf_bytes = base64.b64decode(b64_data)
-            with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-                page_text = doc[0].get_text("text")
-                unidade, setor = extrair_metadados_pagina(page_text)
-                if unidade: last_unidade = unidade
-                if setor: last_setor = setor
-                mes, ano = parse_mes_ano_geral(page_text)
-                if mes: last_mes = mes
-                if ano: last_ano = ano
-                tabelas = [t.extract() for t in doc[0].find_tables() if t.extract()]
-                if tabelas: all_table_rows.extend(tabelas[0])
-        
-        header_row_idx = next((i for i, r in enumerate(all_table_rows) if r and "NOME COMPLETO" in ''.join(map(str, r)).upper()), None)
-        if header_row_idx is None:
-            return JSONResponse({"error": "Cabeçalho não encontrado."}, status_code=400)
-        
-        header = all_table_rows[header_row_idx]
-        dias_row = all_table_rows[header_row_idx + 1]
-        header_map = {i: col.strip() for i, col in enumerate(dias_row) if str(col).strip().isdigit()}
-        nome_idx = next(i for i, col in enumerate(header) if "NOME COMPLETO" in str(col).upper())
-
-        profissionais_data = defaultdict(lambda: defaultdict(list))
-        for row in all_table_rows[header_row_idx+2:]:
-            nome_bruto = row[nome_idx]
-            if not is_valid_professional_name(nome_bruto): continue
-            nome = ' '.join(nome_bruto.split())
-            for idx, dia in header_map.items():
-                if idx < len(row) and row[idx]:
-                    for turno in interpretar_turno_pdf(row[idx]):
-                        horarios = HORARIOS_TURNO.get(turno)
-                        dia_plantao = datetime(last_ano, last_mes, int(dia))
-                        if turno == "NOITE (fim)": dia_plantao += timedelta(days=1)
-                        profissionais_data[nome]["plantoes"].append({
-                            "dia": dia_plantao.day, "data": dia_plantao.strftime('%d/%m/%Y'),
-                            "turno": turno, "inicio": horarios["inicio"], "fim": horarios["fim"]
-                        })
-
-        lista_profissionais_final = [
-            {"medico_nome": nome, "medico_setor": last_setor or "NÃO INFORMADO",
-             "plantoes": sorted(plantoes["plantoes"], key=lambda x: (datetime.strptime(x["data"], '%d/%m/%Y'), x["inicio"]))
-            } for nome, plantoes in profissionais_data.items()
-        ]
-        
-        mes_nome_str = next(k for k, v in MONTH_MAP.items() if v == last_mes)
-        return JSONResponse([{"unidade_escala": last_unidade or "NÃO INFORMADO", "mes_ano_escala": f"{mes_nome_str}/{last_ano}", "profissionais": lista_profissionais_final}])
+        escolher_backend(backend)
+        validar_formato(formato)
+        ignoradas = prefiltro.coletar()
+        paginas = await carregar_paginas(request)
+        resultado = await normalizar_from_pdf(paginas)
+        resposta = prefiltro.cabecalho(RespostaJSON(formatar(resultado, formato)), ignoradas)
+        return diferencas.guardar_resposta(resposta, resultado, formato, guardar)
+    except ErroRequisicao as e:
+        return e.resposta()
     except Exception as e:
         return JSONResponse({"error": str(e), "trace": traceback.format_exc()}, status_code=500)
 # --- FIM normaliza-escala-from-pdf ---
 
 # --- INÍCIO normaliza-escala-PACS ---
-@app.post("/normaliza-escala-PACS")
-async def normaliza_escala_PACS(request: Request):
-    try:
-        body = await request.json()
-        all_table_rows, full_text = [], ""
-        last_unidade, last_setor, last_mes, last_ano = None, None, None, None
-
-        for page_data in body:
-            b64_data = page_data.get("base64") or page_data.get("bae64")
-            if not b64_data: continue
-            pdf_bytes = base64.b64decode(b64_data)
-            with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-                page = doc[0]
-                if not full_text: full_text = page.get_text("text")
-                for table in page.find_tables():
-                    if table.extract(): all_table_rows.extend(table.extract())
-
+CAMPOS_PLANTAO_PACS = ("data", "dia", "turno", "setor", "inicio", "fim")
+
+class EscalaPACS:
+    # Consolidação alimentada página a página, como EscalaFromPdf. Unidade,
+    # setor e mês vêm só do texto da primeira página. Cada linha guarda os
+    # turnos já decodificados com o cabeçalho vigente; no fim, o cabeçalho que
+    # vale é o último visto, então as linhas lidas com um cabeçalho diferente
+    # são decodificadas de novo.
+    def __init__(self):
+        self.full_text = None
+        self.tem_linhas = False
+        self.header_map, self.nome_idx, self.last_name = None, None, None
+        self.profissionais_data = defaultdict(list)  # nome -> [(linha, cabeçalho, turnos)]
+
+    def adicionar(self, extracao):
+        if self.full_text is None:
+            self.full_text = extracao["text"]
+        for tabela in extracao["tables"]:
+            for row in tabela:
+                self.tem_linhas = True
+                self._linha(row)
+
+    @staticmethod
+    def _plantoes(row, header_map):
+        plantoes = []
+        for dia, col_idx in header_map.items():
+            if isinstance(dia, int) and col_idx < len(row) and row[col_idx]:
+                codigos_turno = turnos.decodificar_pacs(str(row[col_idx]).strip())
+                if codigos_turno: plantoes.append((dia, codigos_turno))
+        return plantoes
+
+    def _linha(self, row):
+        if not row or not any(row): return
+
+        if any("NOME" in str(c or '').upper() and "COMPLETO" in str(c or '').upper() for c in row):
+            header_map = {}
+            offset = 1 if str(row[0]).strip().isdigit() else 0
+            for i, col in enumerate(row[offset:]):
+                col_upper = str(col or '').strip().upper()
+                pos = i + offset
+                if "NOME COMPLETO" in col_upper: header_map["NOME COMPLETO"] = pos
+                elif "CARGO" in col_upper: header_map["CARGO"] = pos
+                elif "VÍNCULO" in col_upper or "VINCULO" in col_upper: header_map["VÍNCULO"] = pos
+                elif "CONSELHO" in col_upper or "CRM" in col_upper: header_map["CRM"] = pos
+                elif re.match(r'^(\d{1,2})(?:\D|$)', str(col or '').strip()):
+                    day = int(re.match(r'^(\d{1,2})', str(col or '').strip()).group(1))
+                    if 1 <= day <= 31: header_map[day] = pos
+            self.header_map = header_map
+            self.nome_idx = header_map.get("NOME COMPLETO")
+            return
+
+        if not self.header_map or self.nome_idx is None: return
+
+        nome_bruto = row[self.nome_idx] if self.nome_idx < len(row) else None
+        if nome_bruto and is_valid_professional_name(nome_bruto):
+            self.last_name = ' '.join(nome_bruto.split())
+        elif nome_bruto and self.last_name and len(nome_bruto.strip().split()) == 1:
+            self.last_name += f" {nome_bruto.strip()}"
+
+        if self.last_name:
+            self.profissionais_data[self.last_name].append((list(row), self.header_map, self._plantoes(row, self.header_map)))
+
+    def finalizar(self):
+        full_text = self.full_text or ""
+        header_map = self.header_map
         unidade_match = re.search(r'UNIDADE:\s*(.*?)\n', full_text, re.I)
         setor_match = re.search(r'SETOR:\s*(.*?)\n', full_text, re.I)
         last_unidade = unidade_match.group(1).strip() if unidade_match else "NÃO INFORMADO"
         last_setor = setor_match.group(1).strip() if setor_match else "NÃO INFORMADO"
         last_mes, last_ano = parse_mes_ano_geral(full_text)
 
-        if not all_table_rows or not last_mes or not last_ano:
-            return JSONResponse({"error": "Dados insuficientes (tabela, mês ou ano) não encontrados."}, status_code=400)
-
-        header_map, nome_idx, last_name = None, None, None
-        profissionais_data = defaultdict(lambda: {"info_rows": []})
-
-        for row in all_table_rows:
-            if not row or not any(row): continue
-            
-            if any("NOME" in str(c or '').upper() and "COMPLETO" in str(c or '').upper() for c in row):
-                header_map = {}
-                offset = 1 if str(row[0]).strip().isdigit() else 0
-                for i, col in enumerate(row[offset:]):
-                    col_upper = str(col or '').strip().upper()
-                    pos = i + offset
-                    if "NOME COMPLETO" in col_upper: header_map["NOME COMPLETO"] = pos
-                    elif "CARGO" in col_upper: header_map["CARGO"] = pos
-                    elif "VÍNCULO" in col_upper or "VINCULO" in col_upper: header_map["VÍNCULO"] = pos
-                    elif "CONSELHO" in col_upper or "CRM" in col_upper: header_map["CRM"] = pos
-                    elif re.match(r'^(\d{1,2})(?:\D|$)', str(col or '').strip()):
-                        day = int(re.match(r'^(\d{1,2})', str(col or '').strip()).group(1))
-                        if 1 <= day <= 31: header_map[day] = pos
-                nome_idx = header_map.get("NOME COMPLETO")
-                continue
-
-            if not header_map or nome_idx is None: continue
-            
-            nome_bruto = row[nome_idx] if nome_idx < len(row) else None
-            if nome_bruto and is_valid_professional_name(nome_bruto):
-                last_name = ' '.join(nome_bruto.split())
-            elif nome_bruto and last_name and len(nome_bruto.strip().split()) == 1:
-                last_name += f" {nome_bruto.strip()}"
-            
-            if last_name:
-                profissionais_data[last_name]["info_rows"].append(list(row))
-        
+        if not self.tem_linhas or not last_mes or not last_ano:
+            raise ErroRequisicao("Dados insuficientes (tabela, mês ou ano) não encontrados.")
+
         lista_profissionais_final = []
-        for nome, data in profissionais_data.items():
-            primeira_linha = data["info_rows"][0]
+        for nome, linhas in self.profissionais_data.items():
+            primeira_linha = linhas[0][0]
             get_cell = lambda n, d="N/I": str(primeira_linha[header_map[n]]).strip() if header_map.get(n) and header_map[n] < len(primeira_linha) and primeira_linha[header_map[n]] else d
-            
+
             profissional_obj = {"medico_nome": nome, "medico_crm": get_cell("CRM"), "medico_especialidade": get_cell("CARGO"), "medico_vinculo": get_cell("VÍNCULO"), "medico_setor": last_setor, "medico_unidade": last_unidade, "plantoes": []}
             if "PAES" not in profissional_obj["medico_vinculo"].upper(): continue
-            
-            plantoes_brutos = defaultdict(list)
-            for row in data["info_rows"]:
-                for dia, col_idx in header_map.items():
-                    if isinstance(dia, int) and col_idx < len(row) and row[col_idx]:
-                        plantoes_brutos[dia].append(str(row[col_idx]).strip())
-            
-            for dia, tokens in sorted(plantoes_brutos.items()):
-                for token in tokens:
-                    for turno_info in interpretar_turno_pacs(token):
-                        horarios = HORARIOS_TURNO.get(turno_info["turno"], {})
-                        data_inicio = datetime(last_ano, last_mes, dia)
-                        if turno_info["turno"] == "NOITE (fim)": data_inicio += timedelta(days=1)
-                        profissional_obj["plantoes"].append({
-                            "data": data_inicio.strftime('%d/%m/%Y'), "dia": data_inicio.day, "turno": turno_info["turno"],
-                            "setor": last_setor, "inicio": horarios.get("inicio"), "fim": horarios.get("fim")
-                        })
-            
-            profissional_obj["plantoes"] = dedup_plantao(profissional_obj["plantoes"])
-            if profissional_obj["plantoes"]:
-                profissional_obj["plantoes"].sort(key=lambda p: (datetime.strptime(p['data'], '%d/%m/%Y'), p["inicio"] or ""))
+
+            codigos = []
+            for row, mapa, plantoes in linhas:
+                if mapa is not header_map and mapa != header_map:
+                    plantoes = self._plantoes(row, header_map)
+                for dia, codigos_turno in plantoes:
+                    codigos.extend(turnos.expandir(last_ano, last_mes, dia, codigos_turno))
+
+            # A ordenação final é total, então a ordem de chegada não importa
+            codigos = turnos.deduplicar(codigos)
+            if codigos:
+                profissional_obj["plantoes"] = turnos.materializar(turnos.ordenar_por_horario(codigos), CAMPOS_PLANTAO_PACS, {"setor": last_setor})
                 lista_profissionais_final.append(profissional_obj)
-        
+
         lista_profissionais_final.sort(key=lambda p: p['medico_nome'])
         mes_nome_str = next(k for k, v in MONTH_MAP.items() if v == last_mes)
-        final_output = [{"unidade_escala": last_unidade, "mes_ano_escala": f"{mes_nome_str}/{last_ano}", "profissionais": lista_profissionais_final}]
+        return [{"unidade_escala": last_unidade, "mes_ano_escala": f"{mes_nome_str}/{last_ano}", "profissionais": lista_profissionais_final}]
+
+def consolidar_escala_pacs(extracoes):
+    escala = EscalaPACS()
+    for extracao in extracoes:
+        escala.adicionar(extracao)
+    return escala.finalizar()
+
+async def extrair_paginas_pacs(paginas):
+    return await extrair_paginas(paginas, "PACS")
 
-        return JSONResponse(content=final_output)
+async def normalizar_pacs(paginas):
+    extracoes = await extrair_paginas_pacs(paginas)
+    return await consolidar(consolidar_escala_pacs, extracoes)
+
+jobs.registrar_tipo("PACS", normalizar_pacs)
+diferencas.registrar_tipo("PACS", normalizar_pacs)
+sessoes.registrar_tipo("PACS", extrair_paginas_pacs, EscalaPACS)
+
+@app.post("/normaliza-escala-PACS")
+async def normaliza_escala_PACS(request: Request, backend: str = None, formato: str = "json", guardar: bool = None):
+    try:
+        escolher_backend(backend)
+        validar_formato(formato)
+        ignoradas = prefiltro.coletar()
+        paginas = await carregar_paginas(request)
+        final_output = await normalizar_pacs(paginas)
+
+        resposta = prefiltro.cabecalho(RespostaJSON(content=formatar(final_output, formato)), ignoradas)
+        return diferencas.guardar_resposta(resposta, final_output, formato, guardar)
+    except ErroRequisicao as e:
+        return e.resposta()
     except Exception as e:
         return JSONResponse(content={"error": str(e), "trace": traceback.format_exc()}, status_code=500)
 # --- FIM normaliza-escala-PACS ---
@@ -398,12 +415,6 @@ MONTH_MAP = {
     'JUNHO': 6, 'JULHO': 7, 'AGOSTO': 8, 'SETEMBRO': 9, 'OUTUBRO': 10,
     'NOVEMBRO': 11, 'DEZEMBRO': 12
 }
-HORARIOS_TURNO = {
-    "MANHÃ": {"inicio": "07:00", "fim": "13:00"},
-    "TARDE": {"inicio": "13:00", "fim": "19:00"},
-    "NOITE (início)": {"inicio": "19:00", "fim": "01:00"},
-    "NOITE (fim)": {"inicio": "01:00", "fim": "07:00"},
-}
 UNIDADE_MAP = {
     "HMINSN": "HOSPITAL MATERNO INFANTIL NOSSA SENHORA DE NAZARETH"
 }
@@ -436,160 +447,157 @@ def extrair_setor_e_unidade(text):
     
     return nome_unidade, nome_setor
 
-def interpretar_turno(token):
-    if not token or not isinstance(token, str): return []
-    token_clean = token.replace('\n', '').replace(' ', '').replace('/', '')
-    if any(stop in token.upper() for stop in ["TOTAL", "PL"]): return []
-    tokens = [token_clean[-1].upper()] if len(token_clean) >= 2 and token_clean[-1].upper() in 'MTDN' else list(token_clean.upper())
-    turnos = []
-    for t in tokens:
-        if t == 'M': turnos.append({"turno": "MANHÃ"})
-        elif t == 'T': turnos.append({"turno": "TARDE"})
-        elif t == 'D': turnos.extend([{"turno": "MANHÃ"}, {"turno": "TARDE"}])
-        elif t == 'N': turnos.extend([{"turno": "NOITE (início)"}, {"turno": "NOITE (fim)"}])
-    return turnos
-
-def dedup_plantao(plantoes):
-    seen, result = set(), []
-    for p in plantoes:
-        key = (p["data"], p["turno"], p["inicio"], p["fim"])
-        if key not in seen:
-            seen.add(key)
-            result.append(p)
-    return result
+# --- EXTRAÇÃO (roda no pool; resultado vai para o cache) ---
+def motivo_para_ignorar_matricial(text):
+    motivo = prefiltro.motivo_para_ignorar(text)
+    # Páginas sem mês/ano são ignoradas adiante; não vale extrair tabelas
+    if not motivo and not all(parse_mes_ano(text)):
+        motivo = "sem_mes_ano"
+    return motivo
+
+async def extrair_paginas_matricial(paginas):
+    # Uma lista de extrações (todas as páginas do item) por página recebida
+    return await extrair_paginas(paginas, "MATERNIDADE-MATRICIAL", motivo_para_ignorar_matricial, todas=True)
 
 # --- FUNÇÃO PRINCIPAL DE PROCESSAMENTO ---
-def processar_pagina_pdf(b64_content, page_info=""):
+def processar_pagina_pdf(paginas_extraidas, page_info=""):
     try:
-        pdf_bytes = base64.b64decode(b64_content)
         profissionais = []
 
-        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text() or ""
-                nome_unidade, nome_setor = extrair_setor_e_unidade(text)
-                mes, ano = parse_mes_ano(text)
-                if not mes or not ano: continue
-
-                tables = page.extract_tables()
-                if tables:
-                    for table in tables:
-                        header = {}
-                        for row in table:
-                            # Mapeia cabeçalho
-                            if not header and any("NOME" in str(c or '').upper() for c in row):
-                                for i, col in enumerate(row):
-                                    col_clean = str(col or '').strip().upper()
-                                    if "NOME" in col_clean: header["nome"] = i
-                                    elif "VÍNCULO" in col_clean or "VINCULO" in col_clean: header["vinculo"] = i
-                                    elif "MATRÍCULA" in col_clean or "MATRICULA" in col_clean: header["matricula"] = i
-                                    elif "CARGO" in col_clean: header["cargo"] = i
-                                    elif "CRM" in col_clean or "CONSELHO" in col_clean: header["crm"] = i
-                                    elif re.fullmatch(r"\d{1,2}", col_clean): header[int(col_clean)] = i
-                                continue
-
-                            if "nome" not in header or not row or not row[header["nome"]]: continue
-                            
-                            # Filtro preciso em Matrícula e Vínculo
-                            vinculo_idx = header.get("vinculo", -1)
-                            matricula_idx = header.get("matricula", -1)
-                            vinculo_texto = str(row[vinculo_idx]).upper() if vinculo_idx < len(row) and row[vinculo_idx] else ""
-                            matricula_texto = str(row[matricula_idx]).upper() if matricula_idx < len(row) and row[matricula_idx] else ""
-                            
-                            if "PAES" not in vinculo_texto and "PAES" not in matricula_texto:
-                                continue
-
-                            # Extrai os dados
-                            linha_completa = " ".join(filter(None, [str(c).replace('\n', ' ').strip() for c in row]))
-                            nome = str(row[header["nome"]]).replace('\n', ' ').strip()
-                            
-                            crm_match = re.search(r'(?:CRM|RQE)[\s-]*[A-Z]{2}[\s-]*(\d{3,5})|(\d{3,5})[\s-]*[A-Z]{2}|(?<=\s)(\d{3,5})(?=\s|$)', linha_completa)
-                            crm = crm_match.group(1) or crm_match.group(2) or crm_match.group(3) if crm_match else ""
-                            
-                            especialidade_match = re.search(r'(MÉDICO\s+CLÍNICO\s+GERAL|CLÍNICO\s+GERAL|PEDIATRA)', linha_completa, re.IGNORECASE)
-                            cargo = especialidade_match.group(0).strip() if especialidade_match else (str(row[header.get("cargo", -1)] or "").strip())
-                            
-                            anchor_data = PROF_ANCHOR_MAP.get(nome.upper())
-                            if anchor_data:
-                                if nome_setor == "NÃO INFORMADO": nome_setor = anchor_data["medico_setor"]
-                                if nome_unidade == "NÃO INFORMADO":
-                                    unidade_sigla = anchor_data["medico_unidade"]
-                                    nome_unidade = UNIDADE_MAP.get(unidade_sigla, unidade_sigla)
-
-                            plantoes = []
-                            for dia, col_idx in header.items():
-                                if isinstance(dia, int) and col_idx < len(row) and row[col_idx]:
-                                    for turno in interpretar_turno(str(row[col_idx])):
-                                        data_plantao = datetime(ano, mes, dia)
-                                        if turno["turno"] == "NOITE (fim)": data_plantao += timedelta(days=1)
-                                        horario = HORARIOS_TURNO.get(turno["turno"], {})
-                                        plantoes.append({
-                                            "dia": data_plantao.day,
-                                            "data": data_plantao.strftime("%d/%m/%Y"),
-                                            "turno": turno["turno"],
-                                            "inicio": horario["inicio"],
-                                            "fim": horario["fim"],
-                                            "setor": nome_setor,
-                                            "medico_unidade": nome_unidade,
-                                            "medico_setor": nome_setor
-                                        })
-                            
-                            if plantoes:
-                                profissionais.append({
-                                    "medico_nome": nome,
-                                    "medico_crm": crm,
-                                    "medico_especialidade": cargo,
-                                    "medico_vinculo": "R.P. PAES",
-                                    "plantoes": dedup_plantao(plantoes)
-                                })
+        for page in paginas_extraidas:
+            text = page["text"]
+            nome_unidade, nome_setor = extrair_setor_e_unidade(text)
+            mes, ano = parse_mes_ano(text)
+            if not mes or not ano: continue
+
+            tables = page["tables"]
+            if tables:
+                for table in tables:
+                    header = {}
+                    for row in table:
+                        # Mapeia cabeçalho
+                        if not header and any("NOME" in str(c or '').upper() for c in row):
+                            for i, col in enumerate(row):
+                                col_clean = str(col or '').strip().upper()
+                                if "NOME" in col_clean: header["nome"] = i
+                                elif "VÍNCULO" in col_clean or "VINCULO" in col_clean: header["vinculo"] = i
+                                elif "MATRÍCULA" in col_clean or "MATRICULA" in col_clean: header["matricula"] = i
+                                elif "CARGO" in col_clean: header["cargo"] = i
+                                elif "CRM" in col_clean or "CONSELHO" in col_clean: header["crm"] = i
+                                elif re.fullmatch(r"\d{1,2}", col_clean): header[int(col_clean)] = i
+                            continue
+
+                        if "nome" not in header or not row or not row[header["nome"]]: continue
+                        
+                        # Filtro preciso em Matrícula e Vínculo
+                        vinculo_idx = header.get("vinculo", -1)
+                        matricula_idx = header.get("matricula", -1)
+                        vinculo_texto = str(row[vinculo_idx]).upper() if vinculo_idx < len(row) and row[vinculo_idx] else ""
+                        matricula_texto = str(row[matricula_idx]).upper() if matricula_idx < len(row) and row[matricula_idx] else ""
+                        
+                        if "PAES" not in vinculo_texto and "PAES" not in matricula_texto:
+                            continue
+
+                        # Extrai os dados
+                        linha_completa = " ".join(filter(None, [str(c).replace('\n', ' ').strip() for c in row]))
+                        nome = str(row[header["nome"]]).replace('\n', ' ').strip()
+                        
+                        crm_match = re.search(r'(?:CRM|RQE)[\s-]*[A-Z]{2}[\s-]*(\d{3,5})|(\d{3,5})[\s-]*[A-Z]{2}|(?<=\s)(\d{3,5})(?=\s|$)', linha_completa)
+                        crm = crm_match.group(1) or crm_match.group(2) or crm_match.group(3) if crm_match else ""
+                        
+                        especialidade_match = re.search(r'(MÉDICO\s+CLÍNICO\s+GERAL|CLÍNICO\s+GERAL|PEDIATRA)', linha_completa, re.IGNORECASE)
+                        cargo = especialidade_match.group(0).strip() if especialidade_match else (str(row[header.get("cargo", -1)] or "").strip())
+                        
+                        anchor_data = PROF_ANCHOR_MAP.get(nome.upper())
+                        if anchor_data:
+                            if nome_setor == "NÃO INFORMADO": nome_setor = anchor_data["medico_setor"]
+                            if nome_unidade == "NÃO INFORMADO":
+                                unidade_sigla = anchor_data["medico_unidade"]
+                                nome_unidade = UNIDADE_MAP.get(unidade_sigla, unidade_sigla)
+
+                        # Plantões como (código, extras); os dicts só saem na consolidação
+                        extras = {"setor": nome_setor, "medico_unidade": nome_unidade, "medico_setor": nome_setor}
+                        plantoes = {}
+                        for dia, col_idx in header.items():
+                            if isinstance(dia, int) and col_idx < len(row) and row[col_idx]:
+                                codigos_turno = turnos.decodificar_matricial(str(row[col_idx]))
+                                if not codigos_turno: continue
+                                for codigo in turnos.expandir(ano, mes, dia, codigos_turno):
+                                    plantoes.setdefault(codigo, extras)
+                        
+                        if plantoes:
+                            profissionais.append({
+                                "medico_nome": nome,
+                                "medico_crm": crm,
+                                "medico_especialidade": cargo,
+                                "medico_vinculo": "R.P. PAES",
+                                "plantoes": list(plantoes.items())
+                            })
         return profissionais
     except Exception as e:
         print(f"Erro processando {page_info}: {str(e)}\n{traceback.format_exc()}")
         return []
 
-# --- ENDPOINT FASTAPI ---
-@app.post("/normaliza-escala-MATERNIDADE-MATRICIAL")
-async def normaliza_escala_maternidade_matricial(request: Request):
-    try:
-        body = await request.json()
-        todos_profissionais = []
-
-        if isinstance(body, list):
-            for i, page_data in enumerate(body):
-                b64 = page_data.get("base64") or page_data.get("bae64")
-                if b64:
-                    profissionais_da_pagina = processar_pagina_pdf(b64, f"Página {i+1}")
-                    todos_profissionais.extend(profissionais_da_pagina)
-        
-        medicos_consolidados = defaultdict(lambda: {"plantoes": [], "info": {}})
-        for prof in todos_profissionais:
+CAMPOS_PLANTAO_MATRICIAL = turnos.CAMPOS_BASE + ("setor", "medico_unidade", "medico_setor")
+
+def consolidar_escala_matricial(extracoes, paginas_info):
+    profissionais_por_pagina = [processar_pagina_pdf(extracao, info) for extracao, info in zip(extracoes, paginas_info)]
+    medicos_consolidados = defaultdict(lambda: {"plantoes": {}, "info": {}})
+    for profissionais_da_pagina in profissionais_por_pagina:
+        for prof in profissionais_da_pagina:
             nome = prof["medico_nome"]
             if not medicos_consolidados[nome]["info"]:
                 medicos_consolidados[nome]["info"] = {k: v for k, v in prof.items() if k != 'plantoes'}
-            medicos_consolidados[nome]["plantoes"].extend(prof["plantoes"])
-        
-        profissionais_final = []
-        for nome, data in medicos_consolidados.items():
-            prof_obj = data["info"]
-            prof_obj["plantoes"] = dedup_plantao(data["plantoes"])
-            prof_obj["plantoes"].sort(key=lambda p: datetime.strptime(p['data'], '%d/%m/%Y'))
-            profissionais_final.append(prof_obj)
-
-        profissionais_final.sort(key=lambda p: p["medico_nome"])
-
-        mes_nome_str, ano = "JULHO", 2025 # Fallback
-        if profissionais_final and any(p["plantoes"] for p in profissionais_final):
-            primeiro_plantao = next((p for p in profissionais_final if p["plantoes"]), {}).get("plantoes")[0]
-            data_parts = primeiro_plantao["data"].split("/")
-            mes = int(data_parts[1])
-            ano = int(data_parts[2])
-            mes_nome_str = [k for k, v in MONTH_MAP.items() if v == mes][0]
-
-        return JSONResponse(content=[{
-            "unidade_escala": "HMINSN",
-            "mes_ano_escala": f"{mes_nome_str}/{ano}",
-            "profissionais": profissionais_final
-        }])
+            for codigo, extras in prof["plantoes"]:
+                medicos_consolidados[nome]["plantoes"].setdefault(codigo, extras)
+
+    profissionais_final = []
+    for nome, data in medicos_consolidados.items():
+        prof_obj = data["info"]
+        prof_obj["plantoes"] = [
+            turnos.plantao(codigo, CAMPOS_PLANTAO_MATRICIAL, data["plantoes"][codigo])
+            for codigo in turnos.ordenar_por_data(data["plantoes"])
+        ]
+        profissionais_final.append(prof_obj)
+
+    profissionais_final.sort(key=lambda p: p["medico_nome"])
+
+    mes_nome_str, ano = "JULHO", 2025 # Fallback
+    if profissionais_final and any(p["plantoes"] for p in profissionais_final):
+        primeiro_plantao = next((p for p in profissionais_final if p["plantoes"]), {}).get("plantoes")[0]
+        data_parts = primeiro_plantao["data"].split("/")
+        mes = int(data_parts[1])
+        ano = int(data_parts[2])
+        mes_nome_str = [k for k, v in MONTH_MAP.items() if v == mes][0]
+
+    return [{
+        "unidade_escala": "HMINSN",
+        "mes_ano_escala": f"{mes_nome_str}/{ano}",
+        "profissionais": profissionais_final
+    }]
+
+async def normalizar_matricial(paginas):
+    paginas_info = [f"Página {pagina['page']}" for pagina in paginas]
+    extracoes = await extrair_paginas_matricial(paginas)
+    return await consolidar(consolidar_escala_matricial, extracoes, paginas_info)
+
+jobs.registrar_tipo("MATERNIDADE-MATRICIAL", normalizar_matricial)
+diferencas.registrar_tipo("MATERNIDADE-MATRICIAL", normalizar_matricial)
+
+# --- ENDPOINT FASTAPI ---
+@app.post("/normaliza-escala-MATERNIDADE-MATRICIAL")
+async def normaliza_escala_maternidade_matricial(request: Request, backend: str = None, formato: str = "json",
+                                                 guardar: bool = None):
+    try:
+        escolher_backend(backend)
+        validar_formato(formato)
+        ignoradas = prefiltro.coletar()
+        paginas = await carregar_paginas(request)
+        resultado = await normalizar_matricial(paginas)
+        resposta = prefiltro.cabecalho(RespostaJSON(content=formatar(resultado, formato)), ignoradas)
+        return diferencas.guardar_resposta(resposta, resultado, formato, guardar)
+    except ErroRequisicao as e:
+        return e.resposta()
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
 # --- FIM normaliza-ESCALA-MATRIZ ---
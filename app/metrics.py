@@ -0,0 +1,248 @@
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app import arranque
+
+router = APIRouter()
+
+# Instrumentação por endpoint e por etapa (decodificação, extração,
+# consolidação, serialização, e dentro do pool: abertura do PDF, texto,
+# find_tables...). Cada requisição tem um coletor num contextvar; as etapas
+# e contadores registrados durante a requisição (inclusive nos processos do
+# pool, ver executar_medido) vão para histogramas e contadores por endpoint,
+# expostos no formato texto do Prometheus em /metrics. Etapas que rodam em
+# paralelo no pool somam o tempo de todas as páginas.
+
+# Server-Timing com as etapas em cada resposta (METRICS_SERVER_TIMING=1)
+SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "0") != "0"
+PREFIXO = "sidecar"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Coletor:
+    def __init__(self):
+        self.etapas = {}
+        self.contadores = {}
+        # perfil.Perfil durante um perfilamento: etapa() chama entrar/sair
+        self.perfil = None
+        self._lock = threading.Lock()
+
+    def etapa(self, nome, segundos):
+        with self._lock:
+            self.etapas[nome] = self.etapas.get(nome, 0.0) + segundos
+
+    def contar(self, nome, valor):
+        with self._lock:
+            self.contadores[nome] = self.contadores.get(nome, 0) + valor
+
+    def exportar(self):
+        with self._lock:
+            return {"etapas": dict(self.etapas), "contadores": dict(self.contadores)}
+
+    def mesclar(self, dados):
+        for nome, segundos in dados["etapas"].items():
+            self.etapa(nome, segundos)
+        for nome, valor in dados["contadores"].items():
+            self.contar(nome, valor)
+
+
+_coletor = contextvars.ContextVar("coletor_metricas", default=None)
+
+
+def coletor_atual():
+    return _coletor.get()
+
+
+def registrar_etapa(nome, segundos):
+    coletor = _coletor.get()
+    if coletor is not None:
+        coletor.etapa(nome, segundos)
+
+
+@contextmanager
+def etapa(nome):
+    coletor = _coletor.get()
+    perfil = coletor.perfil if coletor is not None else None
+    if perfil is not None:
+        perfil.entrar()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        if coletor is not None:
+            coletor.etapa(nome, time.perf_counter() - inicio)
+        if perfil is not None:
+            perfil.sair(nome)
+
+
+def contar(nome, valor=1):
+    coletor = _coletor.get()
+    if coletor is not None:
+        coletor.contar(nome, valor)
+
+
+def executar_medido(func, *args, perfil=None):
+    # Roda no processo do pool: devolve o resultado junto com as etapas e
+    # contadores registrados lá, para absorver() juntar à requisição.
+    coletor = Coletor()
+    coletor.perfil = perfil
+    token = _coletor.set(coletor)
+    try:
+        return func(*args), coletor.exportar()
+    finally:
+        _coletor.reset(token)
+
+
+def absorver(retorno):
+    resultado, dados = retorno
+    coletor = _coletor.get()
+    if coletor is not None:
+        coletor.mesclar(dados)
+    return resultado
+
+
+class RespostaJSON(JSONResponse):
+    def render(self, content):
+        with etapa("serializacao"):
+            return super().render(content)
+
+
+# --- REGISTRO (processo principal) ---
+class Histograma:
+    def __init__(self):
+        self.contagens = [0] * (len(BUCKETS) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect_left(BUCKETS, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+
+_lock = threading.Lock()
+_requisicoes = {}   # (endpoint, metodo, status) -> n
+_duracoes = {}      # endpoint -> Histograma
+_etapas = {}        # (endpoint, etapa) -> Histograma
+_contadores = {}    # (nome, endpoint) -> valor
+_estados = {}       # prefixo -> função que devolve um dict (pool, caches...)
+
+
+def registrar_estado(prefixo, funcao):
+    _estados[prefixo] = funcao
+
+
+def _observar(endpoint, metodo, status, duracao, coletor, bytes_entrada, bytes_saida):
+    dados = coletor.exportar()
+    with _lock:
+        chave = (endpoint, metodo, str(status))
+        _requisicoes[chave] = _requisicoes.get(chave, 0) + 1
+        _duracoes.setdefault(endpoint, Histograma()).observar(duracao)
+        for nome, segundos in dados["etapas"].items():
+            _etapas.setdefault((endpoint, nome), Histograma()).observar(segundos)
+        contadores = {**dados["contadores"], "bytes_entrada": bytes_entrada, "bytes_saida": bytes_saida}
+        for nome, valor in contadores.items():
+            _contadores[(nome, endpoint)] = _contadores.get((nome, endpoint), 0) + valor
+
+
+def _server_timing(coletor, inicio):
+    partes = [f"{nome};dur={segundos * 1000:.1f}" for nome, segundos in coletor.exportar()["etapas"].items()]
+    partes.append(f"total;dur={(time.perf_counter() - inicio) * 1000:.1f}")
+    return ", ".join(partes).encode("latin-1")
+
+
+class MetricasMiddleware:
+    # Middleware ASGI puro: conta bytes também nas respostas em streaming
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        coletor = Coletor()
+        token = _coletor.set(coletor)
+        inicio = time.perf_counter()
+        medidas = {"status": 500, "entrada": 0, "saida": 0}
+
+        async def receive_medido():
+            mensagem = await receive()
+            if mensagem["type"] == "http.request":
+                medidas["entrada"] += len(mensagem.get("body", b""))
+            return mensagem
+
+        async def send_medido(mensagem):
+            if mensagem["type"] == "http.response.start":
+                medidas["status"] = mensagem["status"]
+                if SERVER_TIMING:
+                    mensagem = {**mensagem, "headers": [*mensagem.get("headers", []), (b"server-timing", _server_timing(coletor, inicio))]}
+            elif mensagem["type"] == "http.response.body":
+                medidas["saida"] += len(mensagem.get("body", b""))
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive_medido, send_medido)
+        finally:
+            _coletor.reset(token)
+            # Caminho da rota (ex. /paginas/{handle}) para não explodir os rótulos
+            rota = scope.get("route")
+            endpoint = getattr(rota, "path", None) or "nao_roteado"
+            duracao = time.perf_counter() - inicio
+            _observar(endpoint, scope["method"], medidas["status"], duracao,
+                      coletor, medidas["entrada"], medidas["saida"])
+            arranque.registrar_requisicao(endpoint, duracao)
+
+
+# --- EXPOSIÇÃO ---
+def _rotulos(**rotulos):
+    def escapar(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in rotulos.items()) + "}"
+
+
+def _linhas_histograma(nome, histogramas):
+    linhas = []
+    for rotulos, h in histogramas:
+        acumulado = 0
+        for limite, contagem in zip((*BUCKETS, "+Inf"), h.contagens):
+            acumulado += contagem
+            linhas.append(f"{nome}_bucket{_rotulos(**rotulos, le=limite)} {acumulado}")
+        linhas.append(f"{nome}_sum{_rotulos(**rotulos)} {h.soma:.6f}")
+        linhas.append(f"{nome}_count{_rotulos(**rotulos)} {h.total}")
+    return linhas
+
+
+def texto_prometheus():
+    linhas = []
+    with _lock:
+        linhas += [f"# TYPE {PREFIXO}_requisicoes_total counter"]
+        linhas += [f"{PREFIXO}_requisicoes_total{_rotulos(endpoint=e, metodo=m, status=s)} {n}"
+                   for (e, m, s), n in sorted(_requisicoes.items())]
+        linhas += [f"# TYPE {PREFIXO}_requisicao_segundos histogram"]
+        linhas += _linhas_histograma(f"{PREFIXO}_requisicao_segundos",
+                                     [({"endpoint": e}, h) for e, h in sorted(_duracoes.items())])
+        linhas += [f"# TYPE {PREFIXO}_etapa_segundos histogram"]
+        linhas += _linhas_histograma(f"{PREFIXO}_etapa_segundos",
+                                     [({"endpoint": e, "etapa": n}, h) for (e, n), h in sorted(_etapas.items())])
+        nomes = sorted({nome for nome, _ in _contadores})
+        for nome in nomes:
+            linhas.append(f"# TYPE {PREFIXO}_{nome}_total counter")
+            linhas += [f"{PREFIXO}_{nome}_total{_rotulos(endpoint=e)} {v}"
+                       for (n, e), v in sorted(_contadores.items()) if n == nome]
+    for prefixo, funcao in _estados.items():
+        for campo, valor in funcao().items():
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                linhas.append(f"# TYPE {PREFIXO}_{prefixo}_{campo} gauge")
+                linhas.append(f"{PREFIXO}_{prefixo}_{campo} {valor}")
+    return "\n".join(linhas) + "\n"
+
+
+@router.get("/metrics")
+def metrics():
+    return PlainTextResponse(texto_prometheus(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,88 @@
+import io
+import json
+import uuid
+import zipfile
+
+# Saídas binárias do /split-pdf: as páginas vão como arquivos page_N.pdf
+# (sem base64) e um manifest.json pequeno fecha o pacote. Os geradores
+# recebem (número, bytes) de uma página por vez e repassam os bytes assim
+# que cada entrada é escrita. Com ?por_arquivo= (app/divisao.py) o número
+# vira a tupla de páginas do arquivo, pages_1-3.pdf ou pages_1_4.pdf.
+
+
+class _SaidaSemSeek(io.RawIOBase):
+    # zipfile grava em modo streaming (data descriptors) quando o destino
+    # não suporta seek/tell.
+    def __init__(self):
+        self.partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.partes.append(bytes(b))
+        return len(b)
+
+    def drenar(self):
+        dados = b"".join(self.partes)
+        self.partes.clear()
+        return dados
+
+
+def nome_pagina(page):
+    if isinstance(page, tuple):
+        # (1, 3, 4, 5) -> pages_1_3-5.pdf
+        trechos, inicio = [], 0
+        for i in range(1, len(page) + 1):
+            if i == len(page) or page[i] != page[i - 1] + 1:
+                trechos.append(str(page[inicio]) if inicio == i - 1 else f"{page[inicio]}-{page[i - 1]}")
+                inicio = i
+        return f"pages_{'_'.join(trechos)}.pdf"
+    return f"page_{page}.pdf"
+
+
+def _entrada_manifesto(page, filename, page_bytes):
+    if isinstance(page, tuple):
+        return {"page": page[0], "paginas": list(page), "filename": filename, "bytes": len(page_bytes)}
+    return {"page": page, "filename": filename, "bytes": len(page_bytes)}
+
+
+def descrever_pagina(page, page_bytes):
+    return _entrada_manifesto(page, nome_pagina(page), page_bytes)
+
+
+def stream_zip(paginas, nome_arquivo=nome_pagina):
+    saida = _SaidaSemSeek()
+    manifesto = []
+    with zipfile.ZipFile(saida, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        for page, page_bytes in paginas:
+            filename = nome_arquivo(page)
+            zf.writestr(filename, page_bytes)
+            manifesto.append(_entrada_manifesto(page, filename, page_bytes))
+            yield saida.drenar()
+        zf.writestr("manifest.json", json.dumps({"pages": manifesto}))
+    yield saida.drenar()
+
+
+def nova_fronteira():
+    return f"page-{uuid.uuid4().hex}"
+
+
+def _parte_multipart(fronteira, content_type, filename, dados):
+    cabecalho = (
+        f"--{fronteira}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f'Content-Disposition: attachment; filename="{filename}"\r\n'
+        f"Content-Length: {len(dados)}\r\n\r\n"
+    )
+    return cabecalho.encode("ascii") + dados + b"\r\n"
+
+
+def stream_multipart(paginas, fronteira, nome_arquivo=nome_pagina):
+    manifesto = []
+    for page, page_bytes in paginas:
+        filename = nome_arquivo(page)
+        manifesto.append(_entrada_manifesto(page, filename, page_bytes))
+        yield _parte_multipart(fronteira, "application/pdf", filename, page_bytes)
+    yield _parte_multipart(fronteira, "application/json", "manifest.json", json.dumps({"pages": manifesto}).encode("utf-8"))
+    yield f"--{fronteira}--\r\n".encode("ascii")
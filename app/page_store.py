@@ -0,0 +1,45 @@
+import hashlib
+import os
+import re
+
+from app.armazem import ArmazemLRU
+from app.erros import ErroRequisicao
+
+# --- CONFIGURAÇÃO (variáveis de ambiente) ---
+PAGE_STORE_MAX_BYTES = int(os.getenv("PAGE_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Diretório opcional para onde vão as páginas despejadas da memória.
+PAGE_STORE_DIR = os.getenv("PAGE_STORE_DIR") or None
+PAGE_STORE_TTL_SEGUNDOS = int(os.getenv("PAGE_STORE_TTL_SEGUNDOS", "3600"))
+
+TAMANHO_HANDLE = 32
+HANDLE_REGEX = re.compile(r'^[0-9a-f]{%d}$' % TAMANHO_HANDLE)
+
+
+class PaginaNaoEncontradaError(ErroRequisicao):
+    status_code = 404
+
+
+def calcular_handle(pdf_bytes):
+    return hashlib.sha256(pdf_bytes).hexdigest()[:TAMANHO_HANDLE]
+
+
+class PageStore(ArmazemLRU):
+    # Páginas endereçadas pelo conteúdo (prefixo do SHA-256).
+    def __init__(self, max_bytes, diretorio=None, ttl_segundos=3600):
+        super().__init__(max_bytes, diretorio, ttl_segundos, extensao=".pdf")
+
+    def guardar(self, pdf_bytes):
+        handle = calcular_handle(pdf_bytes)
+        super().guardar(handle, pdf_bytes)
+        return handle
+
+    def obter(self, handle):
+        if not HANDLE_REGEX.match(handle or ""):
+            raise PaginaNaoEncontradaError(f"Handle inválido: {handle!r}.")
+        pdf_bytes = super().obter(handle)
+        if pdf_bytes is None:
+            raise PaginaNaoEncontradaError(f"Página {handle} não encontrada (expirada ou nunca enviada).")
+        return pdf_bytes
+
+
+page_store = PageStore(PAGE_STORE_MAX_BYTES, PAGE_STORE_DIR, PAGE_STORE_TTL_SEGUNDOS)
@@ -0,0 +1,203 @@
+import base64
+import binascii
+import io
+import json
+import os
+import re
+import zipfile
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import UploadFile
+
+from app import executor, metrics
+from app.corpo import Base64Decodificado, ler_corpo, ler_formulario, ler_json
+from app.erros import ErroRequisicao
+from app.extracao import contar_paginas
+from app.page_store import page_store
+
+router = APIRouter()
+
+# Entrada comum dos normalizadores: aceita o JSON de sempre
+# ([{"base64": ...}, ...] ou {"pages": [...]}), handles do page store
+# ([{"handle": ...}, ...]) e também as saídas binárias do /split-pdf
+# reenviadas como estão (multipart/form-data, multipart/mixed ou ZIP).
+# Cada página vira {"page", "filename", "pdf_bytes"}.
+#
+# Modo documento inteiro: o PDF original (sem passar pelo /split-pdf) vem
+# como corpo application/pdf, campo de arquivo "documento" num
+# multipart/form-data ou "documento_base64" no JSON, com intervalo opcional
+# em "paginas" (query, campo do form ou do JSON), ex. "1-3,7,10-". As
+# páginas compartilham os mesmos pdf_bytes e ganham "indice" (0-based).
+
+CAMPOS_BASE64 = ("file_base64", "base64", "bae64")
+MAX_ARQUIVOS_MULTIPART = int(os.getenv("MAX_ARQUIVOS_MULTIPART", "5000"))
+
+
+def _numero_pagina(filename):
+    match = re.search(r'(\d+)\D*$', filename or "")
+    return int(match.group(1)) if match else None
+
+
+def _pagina(page, filename, pdf_bytes):
+    return {"page": page, "filename": filename, "pdf_bytes": pdf_bytes}
+
+
+def interpretar_intervalo(texto, total):
+    if not texto:
+        return list(range(total))
+    indices = []
+    for parte in str(texto).replace(" ", "").split(","):
+        if not parte: continue
+        match = re.fullmatch(r'(\d*)-(\d*)|(\d+)', parte)
+        if not match:
+            raise ErroRequisicao(f"Intervalo de páginas inválido: {parte!r}.")
+        if match.group(3):
+            inicio = fim = int(match.group(3))
+        else:
+            inicio, fim = int(match.group(1) or 1), int(match.group(2) or total)
+        if inicio < 1 or fim > total or inicio > fim:
+            raise ErroRequisicao(f"Intervalo {parte!r} fora do documento ({total} páginas).")
+        indices.extend(range(inicio - 1, fim))
+    return list(dict.fromkeys(indices))
+
+
+async def paginas_de_documento(pdf_bytes, filename=None, intervalo=None):
+    total = await executor.executar(contar_paginas, pdf_bytes)
+    return [
+        {"page": i + 1, "filename": filename, "pdf_bytes": pdf_bytes, "indice": i}
+        for i in interpretar_intervalo(intervalo, total)
+    ]
+
+
+async def carregar_paginas(request):
+    with metrics.etapa("decodificacao"):
+        paginas = await _carregar_paginas(request)
+    metrics.contar("paginas", len(paginas))
+    return paginas
+
+
+async def _carregar_paginas(request):
+    content_type = request.headers.get("content-type", "")
+    intervalo = request.query_params.get("paginas")
+    if content_type.startswith("multipart/form-data"):
+        return await _paginas_form(request, intervalo)
+    if content_type.startswith("multipart/mixed"):
+        return _paginas_multipart_mixed(content_type, await ler_corpo(request))
+    if content_type.startswith(("application/zip", "application/x-zip-compressed")):
+        return _paginas_zip(await ler_corpo(request))
+    if content_type.startswith("application/pdf"):
+        return await paginas_de_documento(await ler_corpo(request), None, intervalo)
+    # JSON analisado em streaming, com o base64 já decodificado (app/corpo.py)
+    return await paginas_de_corpo_json(await ler_json(request, CAMPOS_BASE64 + ("documento_base64",)), intervalo)
+
+
+async def paginas_de_corpo_json(body, intervalo=None):
+    if isinstance(body, dict) and body.get("documento_base64"):
+        pdf_bytes = decodificar_base64(body["documento_base64"])
+        if not pdf_bytes:
+            raise ErroRequisicao("base64 inválido em 'documento_base64'.")
+        return await paginas_de_documento(pdf_bytes, body.get("filename"), intervalo or body.get("paginas"))
+    return paginas_de_json(body)
+
+
+def decodificar_base64(valor):
+    # Bytes de um campo base64, já decodificado pelo parser ou ainda str;
+    # None se inválido
+    if isinstance(valor, Base64Decodificado):
+        return valor.dados
+    try:
+        return base64.b64decode(valor)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+def paginas_de_json(body):
+    itens = body.get("pages") if isinstance(body, dict) else body
+    if not isinstance(itens, list):
+        raise ErroRequisicao("Corpo deve ser uma lista de páginas ou {\"pages\": [...]}.")
+    paginas = []
+    for i, page_data in enumerate(itens):
+        if page_data.get("handle"):
+            pdf_bytes = page_store.obter(page_data["handle"])
+        else:
+            b64 = next((page_data[c] for c in CAMPOS_BASE64 if page_data.get(c)), None)
+            if not b64: continue
+            pdf_bytes = decodificar_base64(b64)
+            if not pdf_bytes:
+                raise ErroRequisicao(f"base64 inválido na página {i+1}.")
+        page = page_data.get("page") or page_data.get("page_number") or i + 1
+        paginas.append(_pagina(page, page_data.get("filename"), pdf_bytes))
+    return paginas
+
+
+async def _paginas_form(request, intervalo=None):
+    form = await ler_formulario(request, MAX_ARQUIVOS_MULTIPART)
+    paginas = []
+    try:
+        documento = form.get("documento")
+        if isinstance(documento, UploadFile):
+            return await paginas_de_documento(await documento.read(), documento.filename, intervalo or form.get("paginas"))
+        for _, valor in form.multi_items():
+            if not isinstance(valor, UploadFile) or valor.filename == "manifest.json": continue
+            page = _numero_pagina(valor.filename) or len(paginas) + 1
+            paginas.append(_pagina(page, valor.filename, await valor.read()))
+    finally:
+        await form.close()
+    return paginas
+
+
+def _paginas_multipart_mixed(content_type, body):
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not match:
+        raise ErroRequisicao("multipart/mixed sem boundary.")
+    paginas = []
+    for bloco in body.split(b"--" + match.group(1).encode("latin-1"))[1:]:
+        if bloco.startswith(b"--"): break
+        cabecalho, _, dados = bloco.partition(b"\r\n\r\n")
+        cabecalho = cabecalho.decode("latin-1")
+        if "application/pdf" not in cabecalho.lower(): continue
+        if dados.endswith(b"\r\n"): dados = dados[:-2]
+        filename = re.search(r'filename="?([^";\r\n]+)"?', cabecalho)
+        filename = filename.group(1) if filename else None
+        paginas.append(_pagina(_numero_pagina(filename) or len(paginas) + 1, filename, dados))
+    return paginas
+
+
+def _paginas_zip(body):
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(body))
+    except zipfile.BadZipFile:
+        raise ErroRequisicao("ZIP inválido.")
+    with zf:
+        nomes = [n for n in zf.namelist() if n.lower().endswith(".pdf")]
+        if "manifest.json" in zf.namelist():
+            ordem = [p["filename"] for p in json.loads(zf.read("manifest.json")).get("pages", [])]
+            nomes = [n for n in ordem if n in nomes] + [n for n in nomes if n not in ordem]
+        return [_pagina(_numero_pagina(n) or i + 1, n, zf.read(n)) for i, n in enumerate(nomes)]
+
+
+# --- ROTAS DO PAGE STORE ---
+@router.post("/paginas")
+async def guardar_paginas(request: Request):
+    try:
+        paginas = await carregar_paginas(request)
+        return JSONResponse(content={"pages": [
+            {"page": p["page"], "filename": p["filename"], "handle": page_store.guardar(p["pdf_bytes"]), "bytes": len(p["pdf_bytes"])}
+            for p in paginas
+        ]})
+    except ErroRequisicao as e:
+        return e.resposta()
+
+
+@router.get("/paginas")
+def estado_paginas():
+    return page_store.estado()
+
+
+@router.get("/paginas/{handle}")
+def obter_pagina(handle: str):
+    try:
+        return Response(content=page_store.obter(handle), media_type="application/pdf")
+    except ErroRequisicao as e:
+        return e.resposta()
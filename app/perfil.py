@@ -0,0 +1,405 @@
+import asyncio
+import cProfile
+import contextvars
+import hmac
+import json
+import marshal
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from starlette.datastructures import Headers
+
+from app import metrics
+from app.armazem import ArmazemLRU
+from app.erros import ErroRequisicao
+
+router = APIRouter()
+
+# Perfilamento sob demanda de uma requisição: com PERFIL_TOKEN definido, uma
+# chamada aos PERFIL_ENDPOINTS com o cabeçalho X-Perfil-Token: <token> roda
+# perfilada e a resposta leva X-Perfil-Id. O relatório fica guardado num LRU
+# (PERFIL_MAX_BYTES, PERFIL_DIR, PERFIL_TTL_SEGUNDOS):
+#   GET /perfis/{id}            resumo: etapas, pico de memória por etapa
+#                               (tracemalloc) e as funções mais caras
+#   GET /perfis/{id}/pstats     cProfile mesclado (python -m pstats, snakeviz)
+#   GET /perfis/{id}/colapsado  pilhas amostradas "f1;f2;f3 n" (flamegraph.pl,
+#                               speedscope)
+# Todos exigem o mesmo cabeçalho. O cProfile liga, em cada thread, da entrada
+# à saída da etapa mais externa (metrics.etapa; no loop, a requisição
+# inteira) e em cada tarefa do pool (ver executor.executar); o amostrador
+# pega também o que roda fora das etapas. Tudo o que é do processo (pico do
+# tracemalloc, amostras, o loop) inclui requisições simultâneas: perfile com
+# o servidor calmo. Com perfil, o cache de extração não é consultado, para
+# que a extração rode de verdade.
+
+# --- CONFIGURAÇÃO (variáveis de ambiente) ---
+PERFIL_TOKEN = os.getenv("PERFIL_TOKEN", "")
+PERFIL_ENDPOINTS = tuple(
+    p.strip() for p in os.getenv("PERFIL_ENDPOINTS", "/normaliza-escala-,/split-pdf,/classifica-paginas-hgr").split(",")
+    if p.strip()
+)
+PERFIL_INTERVALO_MS = float(os.getenv("PERFIL_INTERVALO_MS", "5"))
+PERFIL_MAX_BYTES = int(os.getenv("PERFIL_MAX_BYTES", str(64 * 1024 * 1024)))
+PERFIL_DIR = os.getenv("PERFIL_DIR") or None
+PERFIL_TTL_SEGUNDOS = int(os.getenv("PERFIL_TTL_SEGUNDOS", str(24 * 3600)))
+PERFIL_TOP = int(os.getenv("PERFIL_TOP", "30"))
+
+CABECALHO_TOKEN = "x-perfil-token"
+ID_REGEX = re.compile(r"^[0-9a-f]{32}$")
+# Pilhas paradas nestes arquivos são threads ociosas (select, filas, locks)
+ARQUIVOS_OCIOSOS = ("selectors.py", "threading.py", "queue.py", "thread.py")
+# O loop esperando o pool (select/poll) fica fora do ranking do resumo
+ARQUIVOS_LOOP = ("base_events.py", "events.py", "selectors.py")
+MAX_RESUMOS = 200
+
+relatorios = ArmazemLRU(PERFIL_MAX_BYTES, PERFIL_DIR, PERFIL_TTL_SEGUNDOS, extensao=".perfil")
+_resumos = OrderedDict()  # id -> resumo curto, para GET /perfis
+# Perfil da requisição atual (None fora de um perfilamento)
+perfil_atual = contextvars.ContextVar("perfil_requisicao", default=None)
+_lock = threading.Lock()
+_estado = {"ativos": 0, "rastreando": 0}
+_perfilando = {}  # thread -> Perfil com cProfile ligado nela
+
+
+class PerfilNaoAutorizadoError(ErroRequisicao):
+    status_code = 403
+
+
+class PerfilNaoEncontradoError(ErroRequisicao):
+    status_code = 404
+
+
+def autorizado(token):
+    return bool(PERFIL_TOKEN) and token is not None and hmac.compare_digest(token.encode(), PERFIL_TOKEN.encode())
+
+
+def exigir_token(token):
+    if not PERFIL_TOKEN:
+        raise PerfilNaoAutorizadoError("Perfilamento desligado: defina PERFIL_TOKEN.")
+    if not autorizado(token):
+        raise PerfilNaoAutorizadoError("X-Perfil-Token inválido.")
+
+
+def _iniciar_tracemalloc():
+    with _lock:
+        if _estado["rastreando"] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _estado["rastreando"] += 1
+
+
+def _parar_tracemalloc():
+    with _lock:
+        _estado["rastreando"] -= 1
+        if _estado["rastreando"] == 0:
+            tracemalloc.stop()
+
+
+@lru_cache(maxsize=65536)
+def _rotulo(codigo):
+    return f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})"
+
+
+def _pilha_colapsada(frame, ociosas):
+    if not ociosas and os.path.basename(frame.f_code.co_filename) in ARQUIVOS_OCIOSOS:
+        return None
+    rotulos = []
+    while frame is not None:
+        rotulos.append(_rotulo(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(rotulos))
+
+
+class Amostrador(threading.Thread):
+    # A cada PERFIL_INTERVALO_MS conta a pilha de cada thread (só as de
+    # `threads`, ou todas as que não estão ociosas)
+    def __init__(self, raiz, threads=None):
+        super().__init__(name="perfil-amostrador", daemon=True)
+        self.raiz = raiz
+        self.threads = threads
+        self.pilhas = Counter()
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(PERFIL_INTERVALO_MS / 1000):
+            for ident, frame in sys._current_frames().items():
+                if ident == self.ident or (self.threads is not None and ident not in self.threads):
+                    continue
+                pilha = _pilha_colapsada(frame, self.threads is not None)
+                if pilha:
+                    self.pilhas[f"{self.raiz};{pilha}"] += 1
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+        return self.pilhas
+
+
+class _Estatisticas:
+    # Adapta o dicionário de um cProfile para pstats.Stats
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class Perfil:
+    # Estado de um perfilamento, no processo do app ou numa tarefa do pool.
+    # metrics.etapa chama entrar()/sair(): em cada thread, a etapa mais
+    # externa liga e desliga o cProfile; toda etapa mede o pico do
+    # tracemalloc acima do que já estava alocado ao entrar (reset_peak zera o
+    # pico global, então o pico de uma etapa interna sobe para a externa).
+    def __init__(self, endpoint=None):
+        self.id = uuid.uuid4().hex
+        self.endpoint = endpoint
+        self.criado_em = time.time()
+        self.estatisticas = []
+        self.pilhas = Counter()
+        self.memoria = {}
+        self.tarefas_pool = 0
+        self._threads = threading.local()
+        self._lock = threading.Lock()
+
+    def entrar(self):
+        local = self._threads
+        if not hasattr(local, "pilha"):
+            local.pilha, local.perfilador = [], None
+        atual, pico = tracemalloc.get_traced_memory()
+        if local.pilha:
+            local.pilha[-1][1] = max(local.pilha[-1][1], pico)
+        else:
+            local.perfilador = self._ligar()
+        tracemalloc.reset_peak()
+        local.pilha.append([atual, atual])
+
+    def sair(self, nome=None):
+        local = self._threads
+        inicio, pico_filhas = local.pilha.pop()
+        pico = max(tracemalloc.get_traced_memory()[1], pico_filhas)
+        if local.pilha:
+            local.pilha[-1][1] = max(local.pilha[-1][1], pico)
+        elif local.perfilador is not None:
+            self._desligar(local.perfilador)
+            local.perfilador = None
+        if nome:
+            with self._lock:
+                self.memoria[nome] = max(self.memoria.get(nome, 0), pico - inicio)
+
+    def _ligar(self):
+        # Um cProfile por thread: se outro perfil já usa esta, fica só a amostragem
+        ident = threading.get_ident()
+        with _lock:
+            if ident in _perfilando:
+                return None
+            _perfilando[ident] = self
+        perfilador = cProfile.Profile()
+        try:
+            perfilador.enable()
+        except ValueError:
+            with _lock:
+                del _perfilando[ident]
+            return None
+        return perfilador
+
+    def _desligar(self, perfilador):
+        perfilador.disable()
+        with _lock:
+            _perfilando.pop(threading.get_ident(), None)
+        perfilador.create_stats()
+        with self._lock:
+            self.estatisticas.append(perfilador.stats)
+
+    def exportar(self):
+        return {"estatisticas": self.estatisticas, "pilhas": dict(self.pilhas), "memoria": self.memoria}
+
+    def absorver(self, retorno):
+        # Retorno de executar_perfilado: junta o perfil da tarefa do pool e
+        # devolve o (resultado, métricas) de metrics.executar_medido
+        medido, dados = retorno
+        with self._lock:
+            self.estatisticas.extend(dados["estatisticas"])
+            self.pilhas.update(dados["pilhas"])
+            for nome, pico in dados["memoria"].items():
+                self.memoria[nome] = max(self.memoria.get(nome, 0), pico)
+            self.tarefas_pool += 1
+        return medido
+
+    def stats(self):
+        with self._lock:
+            estatisticas = list(self.estatisticas)
+        if not estatisticas:
+            return None
+        stats = pstats.Stats(_Estatisticas(estatisticas[0]))
+        if estatisticas[1:]:
+            stats.add(*(_Estatisticas(e) for e in estatisticas[1:]))
+        return stats
+
+
+def executar_perfilado(func, *args):
+    # Roda no processo do pool no lugar de metrics.executar_medido
+    perfil = Perfil()
+    _iniciar_tracemalloc()
+    amostrador = Amostrador(f"pool-{os.getpid()}", {threading.get_ident()})
+    amostrador.start()
+    perfil.entrar()
+    try:
+        medido = metrics.executar_medido(func, *args, perfil=perfil)
+    finally:
+        perfil.sair("tarefa_pool")
+        perfil.pilhas.update(amostrador.parar())
+        _parar_tracemalloc()
+    return medido, perfil.exportar()
+
+
+def _funcoes(stats):
+    linhas = []
+    for (arquivo, linha, funcao), (_, chamadas, proprio, acumulado, _) in stats.stats.items():
+        if os.path.basename(arquivo) in ARQUIVOS_LOOP or (arquivo == "~" and "'select." in funcao):
+            continue
+        linhas.append({
+            "funcao": f"{funcao} ({os.path.basename(arquivo)}:{linha})" if linha else funcao,
+            "chamadas": chamadas,
+            "tempo_proprio": round(proprio, 6),
+            "tempo_acumulado": round(acumulado, 6),
+        })
+    linhas.sort(key=lambda f: f["tempo_acumulado"], reverse=True)
+    return linhas[:PERFIL_TOP]
+
+
+def _finalizar(perfil, metodo, status, duracao, coletor):
+    stats = perfil.stats()
+    amostras = sum(perfil.pilhas.values())
+    resumo = {
+        "id": perfil.id,
+        "endpoint": perfil.endpoint,
+        "metodo": metodo,
+        "status": status,
+        "criado_em": perfil.criado_em,
+        "duracao_segundos": round(duracao, 4),
+        "etapas": {nome: round(s, 4) for nome, s in coletor.exportar()["etapas"].items()} if coletor else {},
+        "contadores": coletor.exportar()["contadores"] if coletor else {},
+        "memoria_pico_bytes": dict(sorted(perfil.memoria.items(), key=lambda m: m[1], reverse=True)),
+        "tarefas_pool": perfil.tarefas_pool,
+        "amostras": amostras,
+        "intervalo_amostragem_ms": PERFIL_INTERVALO_MS,
+        "funcoes": _funcoes(stats) if stats else [],
+    }
+    if stats:
+        relatorios.guardar(f"{perfil.id}-pstats", marshal.dumps(stats.stats))
+    colapsado = "".join(f"{pilha} {n}\n" for pilha, n in perfil.pilhas.most_common())
+    relatorios.guardar(f"{perfil.id}-colapsado", colapsado.encode("utf-8"))
+    relatorios.guardar(f"{perfil.id}-resumo", json.dumps(resumo, ensure_ascii=False).encode("utf-8"))
+    with _lock:
+        _resumos[perfil.id] = {k: resumo[k] for k in ("id", "endpoint", "metodo", "status", "criado_em", "duracao_segundos")}
+        while len(_resumos) > MAX_RESUMOS:
+            _resumos.popitem(last=False)
+
+
+class PerfilMiddleware:
+    # Fica dentro do MetricasMiddleware: usa o coletor da requisição para
+    # ligar o perfil nas etapas e para o resumo das etapas
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(PERFIL_ENDPOINTS):
+            return await self.app(scope, receive, send)
+        token = Headers(scope=scope).get(CABECALHO_TOKEN)
+        if token is None:
+            return await self.app(scope, receive, send)
+        try:
+            exigir_token(token)
+        except ErroRequisicao as e:
+            return await e.resposta()(scope, receive, send)
+
+        perfil = Perfil(scope["path"])
+        coletor = metrics.coletor_atual()
+        if coletor is not None:
+            coletor.perfil = perfil
+        status = {"codigo": 500}
+
+        async def send_com_id(mensagem):
+            if mensagem["type"] == "http.response.start":
+                status["codigo"] = mensagem["status"]
+                mensagem = {**mensagem, "headers": [*mensagem.get("headers", []), (b"x-perfil-id", perfil.id.encode())]}
+            await send(mensagem)
+
+        _estado["ativos"] += 1
+        _iniciar_tracemalloc()
+        amostrador = Amostrador("app")
+        amostrador.start()
+        marca = perfil_atual.set(perfil)
+        inicio = time.perf_counter()
+        perfil.entrar()
+        try:
+            await self.app(scope, receive, send_com_id)
+        finally:
+            perfil.sair("requisicao")
+            duracao = time.perf_counter() - inicio
+            perfil_atual.reset(marca)
+            perfil.pilhas.update(amostrador.parar())
+            _parar_tracemalloc()
+            _estado["ativos"] -= 1
+            if coletor is not None:
+                coletor.perfil = None
+            await asyncio.to_thread(_finalizar, perfil, scope["method"], status["codigo"], duracao, coletor)
+
+
+def _ler(perfil_id, parte):
+    dados = relatorios.obter(f"{perfil_id}-{parte}") if ID_REGEX.match(perfil_id) else None
+    if dados is None:
+        raise PerfilNaoEncontradoError(f"Perfil {perfil_id} não encontrado (expirado, inexistente ou sem {parte}).")
+    return dados
+
+
+def estado():
+    return {"ativos": _estado["ativos"], "relatorios": len(_resumos), **relatorios.estado()}
+
+
+# --- ROTAS ---
+@router.get("/perfis")
+def listar_perfis(request: Request):
+    try:
+        exigir_token(request.headers.get(CABECALHO_TOKEN))
+        with _lock:
+            return {"perfis": list(reversed(_resumos.values()))}
+    except ErroRequisicao as e:
+        return e.resposta()
+
+
+@router.get("/perfis/{perfil_id}")
+def consultar_perfil(perfil_id: str, request: Request):
+    try:
+        exigir_token(request.headers.get(CABECALHO_TOKEN))
+        return JSONResponse(content=json.loads(_ler(perfil_id, "resumo")))
+    except ErroRequisicao as e:
+        return e.resposta()
+
+
+@router.get("/perfis/{perfil_id}/pstats")
+def baixar_pstats(perfil_id: str, request: Request):
+    try:
+        exigir_token(request.headers.get(CABECALHO_TOKEN))
+        return Response(_ler(perfil_id, "pstats"), media_type="application/octet-stream",
+                        headers={"Content-Disposition": f'attachment; filename="perfil-{perfil_id}.pstats"'})
+    except ErroRequisicao as e:
+        return e.resposta()
+
+
+@router.get("/perfis/{perfil_id}/colapsado")
+def baixar_colapsado(perfil_id: str, request: Request):
+    try:
+        exigir_token(request.headers.get(CABECALHO_TOKEN))
+        return PlainTextResponse(_ler(perfil_id, "colapsado").decode("utf-8"))
+    except ErroRequisicao as e:
+        return e.resposta()
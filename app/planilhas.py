@@ -0,0 +1,162 @@
+import json
+import traceback
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from fastapi import APIRouter, File, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app import arranque
+from app.erros import ErroRequisicao
+
+router = APIRouter()
+
+openpyxl = arranque.ModuloPreguicoso("openpyxl")
+
+# /xlsx-to-json lendo direto do upload (já em SpooledTemporaryFile, sem
+# arquivo temporário próprio) em modo read_only: as linhas são percorridas
+# uma a uma, sem carregar a planilha inteira. Parâmetros (query):
+#   formato  json (padrão, {aba: [{cabeçalho: valor}, ...]}), ndjson (uma
+#            linha {"aba", "linha", "dados"} por linha da planilha, em
+#            streaming) ou colunar ({aba: {"colunas", "tipos", "dados"}})
+#   abas     nomes das abas separados por vírgula (padrão: todas)
+#   inicio   primeira linha de dados (1 = logo abaixo do cabeçalho)
+#   limite   máximo de linhas de dados por aba
+# A primeira linha de cada aba é o cabeçalho.
+
+FORMATOS = ("json", "ndjson", "colunar")
+
+
+def valor_json(valor):
+    if isinstance(valor, (datetime, date, time)):
+        return valor.isoformat()
+    if isinstance(valor, timedelta):
+        return valor.total_seconds()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return valor
+
+
+def _tipo(valor):
+    if isinstance(valor, bool): return "bool"
+    if isinstance(valor, int): return "int"
+    if isinstance(valor, (float, Decimal)): return "float"
+    if isinstance(valor, datetime): return "datetime"
+    if isinstance(valor, date): return "date"
+    if isinstance(valor, time): return "time"
+    if isinstance(valor, timedelta): return "duracao"
+    return "str"
+
+
+def _tipo_coluna(tipos):
+    if not tipos: return "vazio"
+    if len(tipos) == 1: return next(iter(tipos))
+    if tipos == {"int", "float"}: return "float"
+    return "misto"
+
+
+def abrir_planilha(arquivo):
+    try:
+        return openpyxl.load_workbook(filename=arquivo, read_only=True, data_only=True)
+    except Exception:
+        raise ErroRequisicao("Arquivo XLSX inválido.")
+
+
+def _abas(workbook, abas):
+    if not abas:
+        return workbook.sheetnames
+    nomes = [a.strip() for a in abas.split(",") if a.strip()]
+    faltando = [a for a in nomes if a not in workbook.sheetnames]
+    if faltando:
+        raise ErroRequisicao(f"Abas não encontradas: {', '.join(faltando)}. Disponíveis: {', '.join(workbook.sheetnames)}.")
+    return nomes
+
+
+def linhas_aba(sheet, inicio=1, limite=None):
+    # (cabeçalho, gerador de (número da linha de dados, valores)); cabeçalho
+    # None para aba vazia
+    linhas = sheet.iter_rows(values_only=True)
+    primeira = next(linhas, None)
+    if primeira is None:
+        return None, iter(())
+    headers = [str(cell).strip() if cell is not None else "" for cell in primeira]
+    min_row = 1 + max(inicio, 1)
+    max_row = min_row + limite - 1 if limite is not None else None
+    dados = sheet.iter_rows(min_row=min_row, max_row=max_row, values_only=True)
+    return headers, ((min_row - 1 + i, row) for i, row in enumerate(dados))
+
+
+def _json(workbook, abas, inicio, limite):
+    all_data = {}
+    for sheet_name in abas:
+        headers, linhas = linhas_aba(workbook[sheet_name], inicio, limite)
+        if headers is None: continue
+        all_data[sheet_name] = [dict(zip(headers, map(valor_json, row))) for _, row in linhas]
+    return all_data
+
+
+def _colunar(workbook, abas, inicio, limite):
+    saida = {}
+    for sheet_name in abas:
+        headers, linhas = linhas_aba(workbook[sheet_name], inicio, limite)
+        if headers is None: continue
+        colunas = [[] for _ in headers]
+        tipos = [set() for _ in headers]
+        for _, row in linhas:
+            for i in range(len(headers)):
+                valor = row[i] if i < len(row) else None
+                if valor is not None: tipos[i].add(_tipo(valor))
+                colunas[i].append(valor_json(valor))
+        saida[sheet_name] = {
+            "colunas": headers,
+            "tipos": [_tipo_coluna(t) for t in tipos],
+            "linhas": len(colunas[0]) if colunas else 0,
+            "dados": colunas,
+        }
+    return saida
+
+
+def _ndjson(workbook, abas, inicio, limite):
+    # Gerador síncrono (o Starlette itera em thread); fecha a planilha no fim
+    try:
+        for sheet_name in abas:
+            headers, linhas = linhas_aba(workbook[sheet_name], inicio, limite)
+            if headers is None: continue
+            for numero, row in linhas:
+                dados = dict(zip(headers, map(valor_json, row)))
+                yield (json.dumps({"aba": sheet_name, "linha": numero, "dados": dados}, ensure_ascii=False) + "\n").encode("utf-8")
+    finally:
+        workbook.close()
+
+
+def _converter(arquivo, formato, abas, inicio, limite):
+    workbook = abrir_planilha(arquivo)
+    try:
+        selecionadas = _abas(workbook, abas)
+        return (_json if formato == "json" else _colunar)(workbook, selecionadas, inicio, limite)
+    finally:
+        workbook.close()
+
+
+@router.post("/xlsx-to-json")
+async def convert_xlsx_to_json(file: UploadFile = File(...), formato: str = "json", abas: str = None,
+                               inicio: int = 1, limite: int = None):
+    try:
+        if formato not in FORMATOS:
+            raise ErroRequisicao(f"Formato inválido: {formato!r}. Use um de: {', '.join(FORMATOS)}.")
+        if limite is not None and limite < 1:
+            raise ErroRequisicao("'limite' deve ser maior que zero.")
+        if formato == "ndjson":
+            workbook = await run_in_threadpool(abrir_planilha, file.file)
+            try:
+                selecionadas = _abas(workbook, abas)
+            except ErroRequisicao:
+                workbook.close()
+                raise
+            return StreamingResponse(_ndjson(workbook, selecionadas, inicio, limite), media_type="application/x-ndjson")
+        return JSONResponse(content=await run_in_threadpool(_converter, file.file, formato, abas, inicio, limite))
+    except ErroRequisicao as e:
+        return e.resposta()
+    except Exception as e:
+        return JSONResponse(content={"error": str(e), "trace": traceback.format_exc()}, status_code=500)
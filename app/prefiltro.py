@@ -0,0 +1,91 @@
+import contextvars
+import os
+import re
+
+from app import metrics
+
+# Pré-filtro de páginas, comum aos extratores: roda sobre o texto (extração
+# barata) e decide se vale chamar find_tables()/extract_tables(), a parte
+# mais cara. Só são puladas páginas sem texto ou com as marcas de lixo do
+# /classifica-paginas-hgr (assinatura, autenticidade SEI, decreto) e sem
+# nenhum sinal de tabela: cabeçalho NOME, linha de dias ou uma sequência de
+# códigos de turno. O rodapé "documento assinado" aparece em todas as
+# páginas do SEI, então uma página de continuação da escala continua sendo
+# extraída. A página pulada mantém o texto (mês, setor etc. seguem valendo
+# para as seguintes) e leva "ignorada": motivo na extração.
+
+# --- CONFIGURAÇÃO (variáveis de ambiente) ---
+PREFILTRO_PAGINAS = os.getenv("PREFILTRO_PAGINAS", "1") != "0"
+
+RE_LIXO = re.compile(r"documento assinado|autenticidade do documento|decreto|sei\.rr\.gov\.br")
+RE_CABECALHO = re.compile(r"\bnome\b")
+RE_DIA = re.compile(r"\b(?:[1-9]|[12]\d|3[01])\b")
+RE_CODIGO_TURNO = re.compile(r"\b(?:pss1|chm|pjm|pj|[mtnd]{1,3})\b")
+MIN_DIAS_SEGUIDOS = 7
+MIN_CODIGOS_TURNO = 10
+
+# Páginas ignoradas na tarefa atual, como [{"page", "motivo"}] (ver coletar)
+ignoradas = contextvars.ContextVar("paginas_ignoradas", default=None)
+
+
+def _linha_de_dias(texto):
+    # Há uma sequência crescente 1, 2, 3... de pelo menos MIN_DIAS_SEGUIDOS?
+    seguidos, anterior = 0, None
+    for m in RE_DIA.finditer(texto):
+        dia = int(m.group())
+        seguidos = seguidos + 1 if anterior is not None and dia == anterior + 1 else 1
+        if seguidos >= MIN_DIAS_SEGUIDOS:
+            return True
+        anterior = dia
+    return False
+
+
+def motivo_para_ignorar(texto):
+    # None se a página deve seguir para a extração de tabelas
+    if not PREFILTRO_PAGINAS:
+        return None
+    if not texto or not texto.strip():
+        return "sem_texto"
+    texto_lower = texto.lower()
+    lixo = RE_LIXO.search(texto_lower)
+    if not lixo:
+        return None
+    if RE_CABECALHO.search(texto_lower) or _linha_de_dias(texto_lower):
+        return None
+    if len(RE_CODIGO_TURNO.findall(texto_lower)) >= MIN_CODIGOS_TURNO:
+        return None
+    return f"descartavel: {lixo.group()}"
+
+
+def parece_ter_cabecalho(texto):
+    # Cabeçalho de escala no texto (NOME e linha de dias); ver extracao.tem_cabecalho
+    texto_lower = (texto or "").lower()
+    return bool(RE_CABECALHO.search(texto_lower)) and _linha_de_dias(texto_lower)
+
+
+def coletar():
+    # Passa a guardar as páginas ignoradas da tarefa atual; devolve a lista
+    lista = []
+    ignoradas.set(lista)
+    return lista
+
+
+def registrar(paginas, extracoes):
+    # Chamado no processo principal depois da extração (com ou sem cache).
+    # Cada extração é um dict de página ou, no matricial, uma lista deles.
+    lista = ignoradas.get()
+    total = 0
+    for pagina, extracao in zip(paginas, extracoes):
+        for sub in (extracao if isinstance(extracao, list) else [extracao]):
+            if sub.get("ignorada"):
+                total += 1
+                if lista is not None:
+                    lista.append({"page": pagina["page"], "motivo": sub["ignorada"]})
+    metrics.contar("paginas_ignoradas", total)
+
+
+def cabecalho(resposta, lista):
+    # X-Paginas-Ignoradas: 3=sem_texto, 7=descartavel: decreto
+    if lista:
+        resposta.headers["X-Paginas-Ignoradas"] = ", ".join(f"{p['page']}={p['motivo']}" for p in lista)
+    return resposta
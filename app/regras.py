@@ -0,0 +1,96 @@
+import re
+import threading
+
+# Motor de regras por texto. Cada regra tem um ou mais padrões (todos
+# precisam aparecer no texto) e as regras valem na ordem em que são
+# declaradas: decide a primeira cujos padrões foram todos encontrados.
+#
+# Os padrões de todas as regras viram uma única alternação de lookaheads
+# (?=(?:(?P<r0_0>...)|(?P<r1_0>...)|...)), compilada uma vez: cada search()
+# varre o texto no C e para na primeira posição onde algum padrão casa. A
+# partir daí só interessam as regras de prioridade maior que a melhor já
+# decidida (e os padrões ainda não vistos), então a busca continua da mesma
+# posição com a alternação só desses padrões, também compilada e guardada.
+# São no máximo tantas buscas quanto padrões, em vez de um re.search por
+# regra em toda página, e o resultado é o mesmo da avaliação em sequência
+# (primeira ocorrência de cada padrão, regra de maior prioridade).
+
+
+class Regra:
+    def __init__(self, nome, classificacao, *padroes):
+        self.nome = nome
+        self.classificacao = classificacao
+        self.padroes = padroes
+
+
+class MotorRegras:
+    def __init__(self, regras):
+        self.regras = tuple(regras)
+        self._inicial = frozenset((i, j) for i, regra in enumerate(self.regras) for j in range(len(regra.padroes)))
+        self._padroes = {}     # padrões pendentes -> alternação compilada
+        self._transicoes = {}  # (pendentes, grupo encontrado) -> (pendentes, regra decidida)
+        self._acertos = {regra.nome: 0 for regra in self.regras}
+        self._acertos[None] = 0
+        self._lock = threading.Lock()
+
+    def _combinado(self, pendentes):
+        combinado = self._padroes.get(pendentes)
+        if combinado is None:
+            alternativas = "|".join(
+                f"(?P<r{i}_{j}>{self.regras[i].padroes[j]})" for i, j in sorted(pendentes)
+            )
+            combinado = self._padroes[pendentes] = re.compile(f"(?=(?:{alternativas}))")
+        return combinado
+
+    def _transicao(self, pendentes, grupo):
+        chave = (pendentes, grupo)
+        transicao = self._transicoes.get(chave)
+        if transicao is None:
+            # O grupo externo fecha por último, mesmo com grupos internos
+            i, j = map(int, grupo[1:].split("_"))
+            restantes = pendentes - {(i, j)}
+            decidida = None
+            if not any(k == i for k, _ in restantes):
+                # Regra completa: só as de prioridade maior ainda importam
+                decidida = i
+                restantes = frozenset((k, l) for k, l in restantes if k < i)
+            transicao = self._transicoes[chave] = (restantes, decidida)
+        return transicao
+
+    def avaliar(self, texto):
+        # (regra, match) da regra que decide, ou (None, None)
+        pendentes, melhor, decisivo = self._inicial, None, None
+        pos = 0
+        while pendentes:
+            m = self._combinado(pendentes).search(texto, pos)
+            if m is None:
+                break
+            pendentes, decidida = self._transicao(pendentes, m.lastgroup)
+            if decidida is not None:
+                melhor, decisivo = decidida, m
+            pos = m.start()
+        regra = self.regras[melhor] if melhor is not None else None
+        with self._lock:
+            self._acertos[regra.nome if regra else None] += 1
+        return regra, decisivo
+
+    def compilar(self):
+        # Compila de antemão a alternação inicial (usada em toda página)
+        self._combinado(self._inicial)
+
+    def acertos(self):
+        with self._lock:
+            contagem = {nome: n for nome, n in self._acertos.items() if nome is not None}
+            contagem["sem_regra"] = self._acertos[None]
+        return contagem
+
+    def estado(self):
+        acertos = self.acertos()
+        return {
+            "regras": [
+                {"nome": r.nome, "classificacao": r.classificacao, "padroes": list(r.padroes), "acertos": acertos[r.nome]}
+                for r in self.regras
+            ],
+            "sem_regra": acertos["sem_regra"],
+            "padroes_compilados": len(self._padroes),
+        }
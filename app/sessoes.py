@@ -0,0 +1,151 @@
+import asyncio
+import os
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from app import compacto, extracao, prefiltro
+from app.erros import ErroRequisicao
+from app.paginas import carregar_paginas
+
+router = APIRouter()
+
+# Modo incremental para quem recebe as páginas uma a uma (ex. um loop do
+# n8n sobre a saída do /split-pdf). POST /sessoes?tipo=PACS abre a sessão;
+# cada POST /sessoes/{id}/paginas extrai as páginas na hora e alimenta o
+# consolidador do tipo (cabeçalho, mês e estado por profissional ficam na
+# sessão); POST /sessoes/{id}/finalizar devolve o mesmo resultado do
+# endpoint normaliza-escala-* correspondente, sem reprocessar nada. As
+# páginas precisam chegar na ordem do documento.
+
+# --- CONFIGURAÇÃO (variáveis de ambiente) ---
+SESSOES_TTL_SEGUNDOS = int(os.getenv("SESSOES_TTL_SEGUNDOS", "1800"))
+SESSOES_MAX = int(os.getenv("SESSOES_MAX", "200"))
+
+# tipo -> (async extrator(paginas), fábrica do consolidador); ver app/main.py
+_tipos = {}
+_sessoes = OrderedDict()
+
+
+class SessaoNaoEncontradaError(ErroRequisicao):
+    status_code = 404
+
+
+def registrar_tipo(tipo, extrator, consolidador):
+    _tipos[tipo] = (extrator, consolidador)
+
+
+class Sessao:
+    def __init__(self, tipo, backend=None):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.backend = backend
+        self.extrator, fabrica = _tipos[tipo]
+        self.escala = fabrica()
+        self.paginas = 0
+        self.paginas_ignoradas = []
+        self.criada_em = self.ultimo_uso = time.time()
+        # Uma página por vez: o estado depende da ordem de chegada
+        self.lock = asyncio.Lock()
+
+    def json(self):
+        return {
+            "id": self.id,
+            "tipo": self.tipo,
+            "backend": self.backend,
+            "paginas": self.paginas,
+            "profissionais_parciais": len(self.escala.profissionais_data),
+            "paginas_ignoradas": self.paginas_ignoradas,
+            "criada_em": self.criada_em,
+            "ultimo_uso": self.ultimo_uso,
+        }
+
+
+def _limpar_expiradas():
+    agora = time.time()
+    for sessao in list(_sessoes.values()):
+        if agora - sessao.ultimo_uso > SESSOES_TTL_SEGUNDOS:
+            del _sessoes[sessao.id]
+
+
+def _obter(sessao_id):
+    _limpar_expiradas()
+    sessao = _sessoes.get(sessao_id)
+    if sessao is None:
+        raise SessaoNaoEncontradaError(f"Sessão {sessao_id} não encontrada (expirada ou finalizada).")
+    sessao.ultimo_uso = time.time()
+    _sessoes.move_to_end(sessao_id)
+    return sessao
+
+
+# --- ROTAS ---
+@router.post("/sessoes")
+async def abrir_sessao(tipo: str, backend: str = None):
+    if tipo not in _tipos:
+        return ErroRequisicao(f"Tipo de sessão inválido: {tipo!r}. Use um de: {', '.join(_tipos)}.").resposta()
+    if backend:
+        try:
+            extracao.validar_backend(backend)
+        except ErroRequisicao as e:
+            return e.resposta()
+    _limpar_expiradas()
+    # Sem espaço, descarta a sessão parada há mais tempo
+    while len(_sessoes) >= SESSOES_MAX:
+        _sessoes.popitem(last=False)
+    sessao = Sessao(tipo, backend)
+    _sessoes[sessao.id] = sessao
+    return JSONResponse(content=sessao.json(), status_code=201)
+
+
+@router.get("/sessoes/{sessao_id}")
+async def consultar_sessao(sessao_id: str):
+    try:
+        return JSONResponse(content=_obter(sessao_id).json())
+    except ErroRequisicao as e:
+        return e.resposta()
+
+
+@router.post("/sessoes/{sessao_id}/paginas")
+async def adicionar_paginas(sessao_id: str, request: Request):
+    try:
+        sessao = _obter(sessao_id)
+        prefiltro.ignoradas.set(sessao.paginas_ignoradas)
+        extracao.backend_escolhido.set(sessao.backend)
+        paginas = await carregar_paginas(request)
+        async with sessao.lock:
+            for pagina in await sessao.extrator(paginas):
+                sessao.escala.adicionar(pagina)
+                sessao.paginas += 1
+        return JSONResponse(content=sessao.json())
+    except ErroRequisicao as e:
+        return e.resposta()
+    except Exception as e:
+        return JSONResponse(content={"error": str(e), "trace": traceback.format_exc()}, status_code=500)
+
+
+@router.post("/sessoes/{sessao_id}/finalizar")
+async def finalizar_sessao(sessao_id: str, formato: str = "json"):
+    try:
+        compacto.validar_formato(formato)
+        sessao = _obter(sessao_id)
+        async with sessao.lock:
+            resultado = sessao.escala.finalizar()
+        _sessoes.pop(sessao_id, None)
+        return JSONResponse(content=compacto.formatar(resultado, formato))
+    except ErroRequisicao as e:
+        return e.resposta()
+    except Exception as e:
+        return JSONResponse(content={"error": str(e), "trace": traceback.format_exc()}, status_code=500)
+
+
+@router.delete("/sessoes/{sessao_id}")
+async def descartar_sessao(sessao_id: str):
+    try:
+        _sessoes.pop(_obter(sessao_id).id)
+        return JSONResponse(content={"id": sessao_id, "removida": True})
+    except ErroRequisicao as e:
+        return e.resposta()
@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+logger = logging.getLogger(__name__)
+
+# Índice de setores para o /classifica-paginas-hgr. As chaves (texto do
+# carimbo normalizado) ganham listas invertidas de trigramas: cada busca só
+# compara com os setores que dividem algum trigrama com o texto e passam
+# pelo filtro de tamanho, em vez de varrer todos. A decisão final continua
+# sendo o ratio do difflib com o mesmo cutoff, então o resultado é o mesmo
+# do get_close_matches de antes.
+
+# Arquivo JSON opcional com o mapa carimbo -> setor ({"...": "..."} ou
+# {"setores": {...}}). Substitui o mapa padrão e é recarregado quando muda.
+SETORES_CONFIG_PATH = os.getenv("SETORES_CONFIG_PATH") or None
+INTERVALO_VERIFICACAO_SEGUNDOS = 2.0
+CUTOFF_PADRAO = 0.75
+
+_NAO_ALFANUMERICO = re.compile(r'[^a-z0-9 ]')
+
+
+def normalizar(texto):
+    return _NAO_ALFANUMERICO.sub('', unicodedata.normalize('NFKD', texto.lower()).encode('ascii', 'ignore').decode())
+
+
+def _trigramas(texto):
+    texto = f"  {texto} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceSetores:
+    def __init__(self, mapa):
+        self.mapa = dict(mapa)
+        self.setores = {normalizar(k): v for k, v in self.mapa.items()}
+        self.chaves = list(self.setores)
+        self._listas = defaultdict(list)
+        for i, chave in enumerate(self.chaves):
+            for grama in _trigramas(chave):
+                self._listas[grama].append(i)
+
+    def _candidatos(self, texto, cutoff):
+        if len(texto) < 4:
+            return range(len(self.chaves))
+        contagem = defaultdict(int)
+        for grama in _trigramas(texto):
+            for i in self._listas.get(grama, ()):
+                contagem[i] += 1
+        n = len(texto)
+        # Limite do real_quick_ratio: 2*min(a, b)/(a + b) >= cutoff
+        return [i for i in contagem if 2 * min(n, len(self.chaves[i])) / (n + len(self.chaves[i])) >= cutoff]
+
+    def buscar(self, texto_normalizado, cutoff=CUTOFF_PADRAO):
+        # (setor, chave, score) do melhor setor com ratio >= cutoff, ou None
+        if texto_normalizado in self.setores:
+            return self.setores[texto_normalizado], texto_normalizado, 1.0
+        melhor = None
+        s = SequenceMatcher()
+        s.set_seq2(texto_normalizado)
+        for i in self._candidatos(texto_normalizado, cutoff):
+            s.set_seq1(self.chaves[i])
+            if s.quick_ratio() >= cutoff:
+                score = s.ratio()
+                if score >= cutoff and (melhor is None or (score, self.chaves[i]) > melhor):
+                    melhor = (score, self.chaves[i])
+        if melhor is None:
+            return None
+        return self.setores[melhor[1]], melhor[1], melhor[0]
+
+
+class SetoresRecarregaveis:
+    # Devolve o índice atual, reconstruindo-o quando o arquivo de
+    # configuração muda (verificado no máximo a cada poucos segundos).
+    def __init__(self, mapa_padrao, caminho=None):
+        self.mapa_padrao = mapa_padrao
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._ultima_verificacao = 0.0
+        self._indice = IndiceSetores(mapa_padrao)
+        self._verificar(forcar=True)
+
+    def _ler_config(self):
+        with open(self.caminho, encoding="utf-8") as f:
+            dados = json.load(f)
+        mapa = dados.get("setores", dados) if isinstance(dados, dict) else None
+        if not isinstance(mapa, dict) or not all(isinstance(v, str) for v in mapa.values()):
+            raise ValueError(f"{self.caminho}: esperado um objeto carimbo -> setor")
+        return mapa
+
+    def _verificar(self, forcar=False):
+        agora = time.monotonic()
+        if not self.caminho or (not forcar and agora - self._ultima_verificacao < INTERVALO_VERIFICACAO_SEGUNDOS):
+            return
+        with self._lock:
+            self._ultima_verificacao = agora
+            try:
+                mtime = os.stat(self.caminho).st_mtime
+            except FileNotFoundError:
+                return
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            try:
+                self._indice = IndiceSetores(self._ler_config())
+            except (OSError, ValueError) as e:
+                # Mantém o índice anterior se o arquivo estiver inválido
+                logger.warning("Erro carregando setores de %s: %s", self.caminho, e)
+
+    def indice(self):
+        self._verificar()
+        return self._indice
+
+    def estado(self):
+        indice = self.indice()
+        return {"config": self.caminho, "carregado_em_mtime": self._mtime, "total": len(indice.chaves), "setores": indice.mapa}
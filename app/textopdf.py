@@ -0,0 +1,209 @@
+import base64
+import copy
+import io
+import os
+import threading
+import traceback
+from collections import OrderedDict
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app import arranque, executor, metrics
+from app.corpo import ler_json
+from app.erros import ErroRequisicao
+from app.pacotes import nova_fronteira, stream_multipart, stream_zip
+
+router = APIRouter()
+
+fpdf = arranque.ModuloPreguicoso("fpdf")
+fpdf_fonts = arranque.ModuloPreguicoso("fpdf.fonts")
+ttLib = arranque.ModuloPreguicoso("fontTools.ttLib")
+
+# /text-to-pdf e /text-to-pdf/lote. O add_font do fpdf2 lê e analisa o TTF
+# inteiro (cmap, larguras de todos os glifos) a cada documento; aqui isso é
+# feito uma vez por processo e cada documento recebe uma cópia rasa da fonte
+# já analisada. Só o TTFont do fontTools é reaberto por documento (lazy, a
+# partir dos bytes em memória), porque o output() faz o subset nele. Como o
+# subset da fonte inteira domina o tempo do output(), a fonte já reduzida é
+# guardada pelo conjunto de glifos usados: um documento com os mesmos glifos
+# parte dela, e o subset de uma fonte pequena sai quase de graça.
+#
+# POST /text-to-pdf/lote?formato=json|zip|multipart recebe
+# [{"text", "filename"}, ...] (ou {"itens": [...]}) e devolve todos os PDFs
+# de uma vez: {"files": [{"file_base64", "filename"}, ...]} ou um pacote
+# zip/multipart como o do /split-pdf.
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+FONTE = "DejaVu"
+LARGURA_LINHA = 120
+FORMATOS_LOTE = ("json", "zip", "multipart")
+MAX_SUBSETS = int(os.getenv("TEXTO_PDF_MAX_SUBSETS", "64"))
+
+_fonte = {"base": None, "bytes": None}
+_fonte_lock = threading.Lock()
+_subsets = OrderedDict()  # frozenset(nomes dos glifos) -> bytes da fonte reduzida
+
+
+def fonte_base():
+    if _fonte["base"] is None:
+        with _fonte_lock:
+            if _fonte["base"] is None:
+                if not os.path.exists(FONT_PATH):
+                    raise RuntimeError(f"Fonte não encontrada em: {FONT_PATH}")
+                with open(FONT_PATH, "rb") as f:
+                    _fonte["bytes"] = f.read()
+                modelo = fpdf.FPDF()
+                modelo.add_font(FONTE, "", FONT_PATH)
+                _fonte["base"] = modelo.fonts[FONTE.lower()]
+    return _fonte["base"]
+
+
+def _abrir_ttfont(dados):
+    return ttLib.TTFont(io.BytesIO(dados), recalcTimestamp=False, fontNumber=0, lazy=True)
+
+
+def _instalar_fonte(pdf):
+    # Equivalente ao add_font, sem reanalisar o TTF: o estado por documento
+    # (índice, subset, glifos ausentes, TTFont do output) é novo; cmap e
+    # larguras são compartilhados, só leitura.
+    fonte = copy.copy(fonte_base())
+    fonte.i = len(pdf.fonts) + 1
+    fonte.ttfont = None  # aberto em gerar_pdf, quando os glifos são conhecidos
+    fonte.missing_glyphs = []
+    reservados = "\x00 \r\n"
+    if pdf.str_alias_nb_pages:
+        reservados += "0123456789" + pdf.str_alias_nb_pages
+    fonte.subset = fpdf_fonts.SubsetMap(fonte, [ord(c) for c in reservados])
+    pdf.fonts[fonte.fontkey] = fonte
+
+
+def gerar_pdf(pdf):
+    # pdf.output() partindo da fonte reduzida em cache, se houver
+    fonte = pdf.fonts[FONTE.lower()]
+    glifos = frozenset(fonte.subset.get_all_glyph_names())
+    with _fonte_lock:
+        reduzida = _subsets.get(glifos)
+        if reduzida is not None:
+            _subsets.move_to_end(glifos)
+    fonte.ttfont = _abrir_ttfont(reduzida if reduzida is not None else _fonte["bytes"])
+    pdf_bytes = bytes(pdf.output())
+    if reduzida is None and MAX_SUBSETS > 0:
+        saida = io.BytesIO()
+        fonte.ttfont.save(saida)
+        with _fonte_lock:
+            _subsets[glifos] = saida.getvalue()
+            while len(_subsets) > MAX_SUBSETS:
+                _subsets.popitem(last=False)
+    return pdf_bytes
+
+
+def novo_documento():
+    pdf = fpdf.FPDF()
+    pdf.add_page()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    _instalar_fonte(pdf)
+    pdf.set_font(FONTE, size=10)
+    return pdf
+
+
+def renderizar_texto(raw_text):
+    clean_text = " ".join(raw_text.replace("\r", "").split())
+    pdf = novo_documento()
+    for i in range(0, len(clean_text), LARGURA_LINHA):
+        pdf.multi_cell(w=190, h=8, txt=clean_text[i:i + LARGURA_LINHA])
+    return gerar_pdf(pdf)
+
+
+def renderizar_lote(textos):
+    return [renderizar_texto(texto) for texto in textos]
+
+
+def _texto(valor, posicao=None):
+    if valor is None:
+        return ""
+    if not isinstance(valor, str):
+        onde = f" no item {posicao}" if posicao else ""
+        raise ErroRequisicao(f"Campo 'text' deve ser texto{onde}.")
+    return valor
+
+
+def _itens_lote(body):
+    itens = body.get("itens") if isinstance(body, dict) else body
+    if not isinstance(itens, list) or not itens:
+        raise ErroRequisicao("Corpo deve ser uma lista de {\"text\", \"filename\"} ou {\"itens\": [...]}.")
+    textos, nomes, usados = [], [], set()
+    for i, item in enumerate(itens, start=1):
+        if not isinstance(item, dict):
+            raise ErroRequisicao(f"Item {i} deve ser um objeto.")
+        textos.append(_texto(item.get("text"), i))
+        # Nomes repetidos ganham sufixo para não colidirem no zip
+        nome = item.get("filename") or f"texto_{i}.pdf"
+        base, ext = os.path.splitext(nome)
+        n = 2
+        while nome in usados:
+            nome = f"{base}_{n}{ext}"
+            n += 1
+        usados.add(nome)
+        nomes.append(nome)
+    return textos, nomes
+
+
+async def _renderizar(textos):
+    # Um lote por worker, com os textos intercalados (lotes de tamanho
+    # parecido); cada worker mantém sua própria fonte analisada
+    lotes = [textos[i::executor.CONCORRENCIA_POR_REQUISICAO] for i in range(executor.CONCORRENCIA_POR_REQUISICAO)]
+    lotes = [lote for lote in lotes if lote]
+    with metrics.etapa("renderizacao"):
+        resultados = await executor.mapear_paginas(renderizar_lote, lotes, pesos=[len(l) for l in lotes])
+    metrics.contar("pdfs", len(textos))
+    # Desfaz a intercalação
+    pdfs = [None] * len(textos)
+    for i, lote in enumerate(resultados):
+        pdfs[i::len(resultados)] = lote
+    return pdfs
+
+
+# --- ROTAS ---
+@router.post("/text-to-pdf")
+async def text_to_pdf(request: Request):
+    try:
+        data = await ler_json(request, ())
+        if not isinstance(data, dict):
+            raise ErroRequisicao("Corpo deve ser {\"text\", \"filename\"}.")
+        raw_text = _texto(data.get("text", ""))
+        filename = data.get("filename", "saida.pdf")
+        with metrics.etapa("renderizacao"):
+            pdf_bytes = await executor.executar(renderizar_texto, raw_text)
+        base64_pdf = base64.b64encode(pdf_bytes).decode("utf-8")
+        return JSONResponse(content={"file_base64": base64_pdf, "filename": filename})
+    except ErroRequisicao as e:
+        return e.resposta()
+    except Exception as e:
+        return JSONResponse(content={"error": str(e), "trace": traceback.format_exc()}, status_code=500)
+
+
+@router.post("/text-to-pdf/lote")
+async def text_to_pdf_lote(request: Request, formato: str = "json"):
+    try:
+        if formato not in FORMATOS_LOTE:
+            raise ErroRequisicao(f"Formato inválido: {formato!r}. Use um de: {', '.join(FORMATOS_LOTE)}.")
+        textos, nomes = _itens_lote(await ler_json(request, ()))
+        pdfs = await _renderizar(textos)
+        if formato == "json":
+            return JSONResponse(content={"files": [
+                {"file_base64": base64.b64encode(pdf_bytes).decode("utf-8"), "filename": nome}
+                for pdf_bytes, nome in zip(pdfs, nomes)
+            ]})
+        arquivos = ((i, pdf_bytes) for i, pdf_bytes in enumerate(pdfs, start=1))
+        nome_arquivo = lambda i: nomes[i - 1]
+        if formato == "zip":
+            return StreamingResponse(stream_zip(arquivos, nome_arquivo), media_type="application/zip",
+                                     headers={"Content-Disposition": 'attachment; filename="textos.zip"'})
+        fronteira = nova_fronteira()
+        return StreamingResponse(stream_multipart(arquivos, fronteira, nome_arquivo),
+                                 media_type=f'multipart/mixed; boundary="{fronteira}"')
+    except ErroRequisicao as e:
+        return e.resposta()
+    except Exception as e:
+        return JSONResponse(content={"error": str(e), "trace": traceback.format_exc()}, status_code=500)
@@ -0,0 +1,107 @@
+import calendar
+from datetime import date
+from functools import lru_cache
+
+# Motor único de expansão de plantões. Cada plantão é um inteiro
+# (ordinal da data * 4 + código do turno): deduplicar e ordenar viram
+# operações sobre inteiros, e os dicts de saída só são montados no fim
+# (materializar), a partir de tabelas pré-calculadas por data.
+
+TURNOS = ("MANHÃ", "TARDE", "NOITE (início)", "NOITE (fim)")
+MANHA, TARDE, NOITE_INICIO, NOITE_FIM = range(4)
+HORARIOS = (("07:00", "13:00"), ("13:00", "19:00"), ("19:00", "01:00"), ("01:00", "07:00"))
+# Posição de cada turno quando a ordem é (data, início): 01:00 < 07:00 < 13:00 < 19:00
+_ORDEM_INICIO = (1, 2, 3, 0)
+
+CAMPOS_BASE = ("dia", "data", "turno", "inicio", "fim")
+
+# --- DECODIFICAÇÃO DE TOKENS (uma tabela por layout de escala) ---
+_LETRAS_PDF = {"M": (MANHA,), "T": (TARDE,), "D": (MANHA, TARDE), "N": (NOITE_INICIO, NOITE_FIM)}
+_LETRAS_PACS = {**_LETRAS_PDF, "n": (NOITE_INICIO,)}
+
+
+def _decodificar(letras, tabela):
+    return tuple(codigo for letra in letras for codigo in tabela.get(letra, ()))
+
+
+@lru_cache(maxsize=4096)
+def decodificar_pdf(token):
+    return _decodificar(token.replace('\n', '').replace('/', '').replace(' ', '').upper(), _LETRAS_PDF)
+
+
+@lru_cache(maxsize=4096)
+def decodificar_pacs(token):
+    if not token or not isinstance(token, str):
+        return ()
+    if "TOTAL" in token.upper() or "PL" in token.upper():
+        return ()
+    return _decodificar(token.replace('\n', ' ').replace('/', ' ').replace(' ', ''), _LETRAS_PACS)
+
+
+@lru_cache(maxsize=4096)
+def decodificar_matricial(token):
+    # Códigos como "12M" valem só pela última letra
+    if not token or not isinstance(token, str):
+        return ()
+    token_clean = token.replace('\n', '').replace(' ', '').replace('/', '')
+    if "TOTAL" in token.upper() or "PL" in token.upper():
+        return ()
+    letras = token_clean[-1].upper() if len(token_clean) >= 2 and token_clean[-1].upper() in 'MTDN' else token_clean.upper()
+    return _decodificar(letras, _LETRAS_PDF)
+
+
+# --- CALENDÁRIO ---
+@lru_cache(maxsize=256)
+def calendario(ano, mes):
+    # (ordinal do dia 1, número de dias do mês)
+    return date(ano, mes, 1).toordinal(), calendar.monthrange(ano, mes)[1]
+
+
+@lru_cache(maxsize=4096)
+def _rotulos_data(ordinal):
+    d = date.fromordinal(ordinal)
+    return d.day, f"{d.day:02d}/{d.month:02d}/{d.year}"
+
+
+def expandir(ano, mes, dia, codigos_turno):
+    # Códigos de plantão de um dia; NOITE (fim) cai no dia seguinte
+    primeiro, dias_no_mes = calendario(ano, mes)
+    if not 1 <= dia <= dias_no_mes:
+        raise ValueError("day is out of range for month")
+    base = (primeiro + dia - 1) * 4
+    return [base + 4 + turno if turno == NOITE_FIM else base + turno for turno in codigos_turno]
+
+
+def deduplicar(codigos):
+    return list(dict.fromkeys(codigos))
+
+
+def ordenar_por_horario(codigos):
+    return sorted(codigos, key=lambda c: c - (c & 3) + _ORDEM_INICIO[c & 3])
+
+
+def ordenar_por_data(codigos):
+    return sorted(codigos, key=lambda c: c >> 2)
+
+
+def mes_ano(codigo):
+    d = date.fromordinal(codigo >> 2)
+    return d.month, d.year
+
+
+@lru_cache(maxsize=16384)
+def _valores(codigo):
+    dia, data = _rotulos_data(codigo >> 2)
+    turno = codigo & 3
+    return {"dia": dia, "data": data, "turno": TURNOS[turno], "inicio": HORARIOS[turno][0], "fim": HORARIOS[turno][1]}
+
+
+def plantao(codigo, campos=CAMPOS_BASE, extras=None):
+    valores = _valores(codigo)
+    if extras:
+        valores = {**valores, **extras}
+    return {campo: valores[campo] for campo in campos}
+
+
+def materializar(codigos, campos=CAMPOS_BASE, extras=None):
+    return [plantao(codigo, campos, extras) for codigo in codigos]
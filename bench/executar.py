@@ -0,0 +1,309 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from bench import gerador
+
+# Benchmark do sidecar, rodando o app ASGI no próprio processo (httpx +
+# ASGITransport, com o lifespan e o pool de processos de verdade). Cada
+# cenário gera sua entrada com bench/gerador.py, faz uma requisição de
+# aquecimento e mede as seguintes: latência p50/p95/p99, páginas/s, pico de
+# RSS (processo + workers do pool) e o tempo de cada etapa, lido do
+# Server-Timing (ver app/metrics.py). O resultado vai para um JSON que pode
+# ser comparado com uma execução anterior:
+#
+#   python -m bench.executar --saida bench/resultado.json
+#   python -m bench.executar --rapido --comparar bench/resultado.json
+#
+# Precisa do httpx (já usado pelo TestClient do FastAPI).
+
+ENDPOINT_LAYOUT = {
+    "pacs": "/normaliza-escala-PACS",
+    "matricial": "/normaliza-escala-MATERNIDADE-MATRICIAL",
+    "from_pdf": "/normaliza-escala-from-pdf",
+}
+MESES = ((2025, 2), (2024, 7), (2025, 12))
+
+
+class Cenario:
+    def __init__(self, nome, metodo, caminho, paginas, **kwargs):
+        self.nome = nome
+        self.metodo = metodo
+        self.caminho = caminho
+        self.paginas = paginas
+        self.kwargs = kwargs
+
+
+def cenarios(rapido=False):
+    tamanhos = (12, 36) if rapido else (12, 60, 180)
+    lista = []
+    for layout, caminho in ENDPOINT_LAYOUT.items():
+        for profissionais in tamanhos:
+            for ano, mes in (MESES[:1] if rapido else MESES):
+                pdf = gerador.escala_pdf(layout, profissionais, ano, mes, seed=profissionais + mes)
+                paginas = gerador.paginas_base64(pdf)
+                sufixo = f"{layout}-{profissionais}prof-{ano}{mes:02d}"
+                lista.append(Cenario(f"{sufixo}-base64", "POST", caminho, len(paginas), json=paginas))
+                lista.append(Cenario(f"{sufixo}-documento", "POST", caminho, len(paginas),
+                                     content=pdf, headers={"content-type": "application/pdf"}))
+
+    # Mesmo documento em cada backend de extração (ver app/extracao.py)
+    pdf = gerador.escala_pdf("pacs", 36 if rapido else 60, seed=11)
+    for backend in ("pymupdf", "pdfplumber", "palavras", "auto"):
+        lista.append(Cenario(f"backend-{backend}-pacs", "POST", f"/normaliza-escala-PACS?backend={backend}",
+                             len(gerador.dividir(pdf)), content=pdf, headers={"content-type": "application/pdf"}))
+
+    pdf = gerador.escala_pdf("pacs", 36 if rapido else 180, seed=7)
+    total = len(gerador.dividir(pdf))
+    for formato in ("json", "ndjson", "zip", "handles"):
+        lista.append(Cenario(f"split-pdf-{formato}", "POST", f"/split-pdf?formato={formato}", total,
+                             files={"file": ("escala.pdf", pdf, "application/pdf")}))
+    # Escrita sem otimização, seleção de páginas e arquivos de várias páginas (app/divisao.py)
+    selecao = min(4, total)
+    for sufixo, query, paginas in (("sem-otimizar", "otimizar=false", total), ("selecao", f"paginas=1-{selecao}", selecao),
+                                   ("por-arquivo-4", "por_arquivo=4", total)):
+        lista.append(Cenario(f"split-pdf-{sufixo}", "POST", f"/split-pdf?{query}", paginas,
+                             files={"file": ("escala.pdf", pdf, "application/pdf")}))
+    lista.append(Cenario("split-pdf-base64", "POST", "/split-pdf-base64", total,
+                         json={"base64": base64.b64encode(pdf).decode()}))
+    lista.append(Cenario("paginas-store", "POST", "/paginas", total, json=gerador.paginas_base64(pdf)))
+
+    paginas_hgr = gerador.paginas_hgr(40 if rapido else 200)
+    lista.append(Cenario("classifica-paginas-hgr", "POST", "/classifica-paginas-hgr", len(paginas_hgr), json=paginas_hgr))
+    lista.append(Cenario("classifica-paginas-hgr-ndjson", "POST", "/classifica-paginas-hgr/ndjson", len(paginas_hgr),
+                         content="".join(json.dumps(p) + "\n" for p in paginas_hgr).encode(),
+                         headers={"content-type": "application/x-ndjson"}))
+    lista.append(Cenario("text-to-pdf", "POST", "/text-to-pdf", 1, json={"text": gerador.texto_longo(20000), "filename": "saida.pdf"}))
+    textos = [{"text": gerador.texto_longo(1500, seed=i), "filename": f"texto_{i}.pdf"} for i in range(20 if rapido else 200)]
+    lista.append(Cenario("text-to-pdf-lote", "POST", "/text-to-pdf/lote", len(textos), json=textos))
+    xlsx = gerador.planilha(200 if rapido else 2000)
+    lista.append(Cenario("xlsx-to-json", "POST", "/xlsx-to-json", 0,
+                         files={"file": ("planilha.xlsx", xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}))
+    return lista
+
+
+# --- MEDIÇÃO ---
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    k = (len(ordenados) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(ordenados) - 1)
+    return ordenados[i] + (ordenados[j] - ordenados[i]) * (k - i)
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1])
+    except (FileNotFoundError, ProcessLookupError):
+        pass
+    return 0
+
+
+class AmostradorRSS:
+    # Pico de RSS do processo + workers do pool durante um cenário (Linux);
+    # sem /proc, cai para o ru_maxrss (pico da vida toda do processo).
+    def __init__(self, intervalo=0.01):
+        self.intervalo = intervalo
+        self.pico_kb = 0
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._rodar, daemon=True)
+
+    def _pids(self):
+        from app import executor
+        pool = executor._pool
+        return [os.getpid()] + list(getattr(pool, "_processes", None) or {})
+
+    def _rodar(self):
+        while not self._parar.is_set():
+            self.pico_kb = max(self.pico_kb, sum(_rss_kb(pid) for pid in self._pids()))
+            self._parar.wait(self.intervalo)
+
+    def __enter__(self):
+        if os.path.exists("/proc/self/status"):
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if not self.pico_kb:
+            self.pico_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _etapas_server_timing(valor):
+    etapas = {}
+    for parte in (valor or "").split(","):
+        nome, _, dur = parte.strip().partition(";dur=")
+        if nome and dur:
+            etapas[nome] = float(dur)
+    return etapas
+
+
+async def _requisicao(cliente, cenario):
+    inicio = time.perf_counter()
+    resposta = await cliente.request(cenario.metodo, cenario.caminho, **cenario.kwargs)
+    await resposta.aread()
+    return time.perf_counter() - inicio, resposta.status_code, _etapas_server_timing(resposta.headers.get("server-timing"))
+
+
+async def medir(cliente, cenario, iteracoes, concorrencia, com_cache):
+    from app.cache import cache_extracao
+
+    # Aquecimento (pool, layouts, imports); cenário que já falha aqui está
+    # montado errado e não vale medir
+    resposta = await cliente.request(cenario.metodo, cenario.caminho, **cenario.kwargs)
+    if not resposta.is_success:
+        raise RuntimeError(f"{cenario.nome}: {cenario.caminho} respondeu {resposta.status_code}: {resposta.text[:300]}")
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def _uma():
+        async with semaforo:
+            if not com_cache:
+                cache_extracao.limpar()
+            return await _requisicao(cliente, cenario)
+
+    with AmostradorRSS() as rss:
+        inicio = time.perf_counter()
+        medidas = await asyncio.gather(*(_uma() for _ in range(iteracoes)))
+        duracao = time.perf_counter() - inicio
+
+    latencias = [m[0] * 1000 for m in medidas]
+    status = {}
+    etapas = {}
+    for _, codigo, tempos in medidas:
+        status[str(codigo)] = status.get(str(codigo), 0) + 1
+        for nome, ms in tempos.items():
+            etapas.setdefault(nome, []).append(ms)
+
+    return {
+        "nome": cenario.nome,
+        "endpoint": cenario.caminho,
+        "paginas_por_requisicao": cenario.paginas,
+        "requisicoes": iteracoes,
+        "concorrencia": concorrencia,
+        "status": status,
+        "erros": sum(n for codigo, n in status.items() if not codigo.startswith("2")),
+        "duracao_s": round(duracao, 4),
+        "requisicoes_por_segundo": round(iteracoes / duracao, 3),
+        "paginas_por_segundo": round(cenario.paginas * iteracoes / duracao, 3),
+        "latencia_ms": {
+            "p50": round(percentil(latencias, 50), 2),
+            "p95": round(percentil(latencias, 95), 2),
+            "p99": round(percentil(latencias, 99), 2),
+            "media": round(sum(latencias) / len(latencias), 2),
+            "max": round(max(latencias), 2),
+        },
+        "pico_rss_mb": round(rss.pico_kb / 1024, 1),
+        "etapas_ms": {
+            nome: {"media": round(sum(v) / len(v), 2), "p50": round(percentil(v, 50), 2), "p95": round(percentil(v, 95), 2)}
+            for nome, v in etapas.items()
+        },
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def executar(args):
+    import httpx
+    from app.main import app
+    from app import executor
+
+    lista = [c for c in cenarios(args.rapido) if not args.filtro or args.filtro in c.nome]
+    resultados = []
+    async with app.router.lifespan_context(app):
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=None) as cliente:
+            for cenario in lista:
+                resultado = await medir(cliente, cenario, args.iteracoes, args.concorrencia, args.com_cache)
+                resultados.append(resultado)
+                print(f"{resultado['nome']:<45} p50={resultado['latencia_ms']['p50']:>9.1f}ms "
+                      f"p95={resultado['latencia_ms']['p95']:>9.1f}ms {resultado['paginas_por_segundo']:>8.1f} pág/s "
+                      f"rss={resultado['pico_rss_mb']:>7.1f}MB erros={resultado['erros']}", flush=True)
+    return {
+        "meta": {
+            "data": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "pool": executor.estado_pool(),
+            "argumentos": {k: v for k, v in vars(args).items() if k not in ("saida", "comparar")},
+        },
+        "cenarios": resultados,
+    }
+
+
+# --- COMPARAÇÃO ---
+def comparar(atual, anterior, tolerancia):
+    # Regressão: p50 mais lento ou páginas/s menor além da tolerância
+    anteriores = {c["nome"]: c for c in anterior["cenarios"]}
+    regressoes = []
+    for c in atual["cenarios"]:
+        base = anteriores.get(c["nome"])
+        if not base:
+            continue
+        p50 = c["latencia_ms"]["p50"] / base["latencia_ms"]["p50"] - 1 if base["latencia_ms"]["p50"] else 0
+        vazao = c["paginas_por_segundo"] / base["paginas_por_segundo"] - 1 if base["paginas_por_segundo"] else 0
+        marca = ""
+        if p50 > tolerancia or vazao < -tolerancia:
+            regressoes.append(c["nome"])
+            marca = "  <-- REGRESSÃO"
+        print(f"{c['nome']:<45} p50 {p50:+7.1%}  pág/s {vazao:+7.1%}{marca}")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do n8n side car")
+    parser.add_argument("--saida", default=None, help="arquivo JSON de resultado")
+    parser.add_argument("--comparar", default=None, help="JSON de uma execução anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.15, help="variação aceita antes de acusar regressão")
+    parser.add_argument("--iteracoes", type=int, default=10)
+    parser.add_argument("--concorrencia", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None, help="PDF_POOL_WORKERS")
+    parser.add_argument("--filtro", default=None, help="só cenários cujo nome contém o texto")
+    parser.add_argument("--rapido", action="store_true", help="matriz reduzida de cenários")
+    parser.add_argument("--com-cache", action="store_true", help="não limpa o cache de extração entre requisições")
+    args = parser.parse_args()
+
+    os.environ["METRICS_SERVER_TIMING"] = "1"
+    if args.workers is not None:
+        os.environ["PDF_POOL_WORKERS"] = str(args.workers)
+
+    resultado = asyncio.run(executar(args))
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+    regressoes = []
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regressoes = comparar(resultado, json.load(f), args.tolerancia)
+    falhas = [f"{c['nome']} {c['status']}" for c in resultado["cenarios"] if c["erros"]]
+    if falhas:
+        print("Cenários com respostas fora de 2xx:\n  " + "\n  ".join(falhas), file=sys.stderr)
+    if regressoes or falhas:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
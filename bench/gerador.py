@@ -0,0 +1,147 @@
+import base64
+import calendar
+import io
+import random
+
+import fitz  # PyMuPDF
+from fpdf import FPDF
+from openpyxl import Workbook
+
+# Gerador de escalas sintéticas para o benchmark. Reproduz os três layouts
+# de tabela que os normalizadores esperam (PACS, MATRICIAL e o genérico do
+# normaliza-escala-from-pdf), com o número de profissionais, páginas e o
+# mês variando. Tudo determinístico a partir da seed.
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+LAYOUTS = ("pacs", "matricial", "from_pdf")
+MESES = ['JANEIRO', 'FEVEREIRO', 'MARÇO', 'ABRIL', 'MAIO', 'JUNHO', 'JULHO',
+         'AGOSTO', 'SETEMBRO', 'OUTUBRO', 'NOVEMBRO', 'DEZEMBRO']
+NOMES = ["ANA", "BRUNO", "CARLA", "DIEGO", "ELISA", "FABIO", "GABRIELA", "HUGO",
+         "IRIS", "JOAO", "KARINA", "LUCAS", "MARIA", "NELSON", "OLGA", "PAULO"]
+SOBRENOMES = ["SILVA", "SOUZA", "LIMA", "COSTA", "ALVES", "PEREIRA", "ROCHA", "DIAS", "MOURA", "NUNES"]
+TURNOS = ["", "", "", "M", "T", "N", "D", "MT", "M/N"]
+SETORES_HGR = ["UNIDADE DE TERAPIA INTENSIVA - UTI 1", "NEUROCIRURGIA", "UNIDADE DE AVC",
+               "URGÊNCIA E EMERGÊNCIA", "BLOCO E HOSPITALISTA", "UTI 03", "ÁREA DE SUTURA"]
+
+
+def _nome(rng):
+    return f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}"
+
+
+def escala_pdf(layout, profissionais=20, ano=2025, mes=7, seed=0, por_pagina=12):
+    # PDF de várias páginas, por_pagina profissionais em cada uma
+    if layout not in LAYOUTS:
+        raise ValueError(f"layout desconhecido: {layout}")
+    rng = random.Random(seed)
+    dias = calendar.monthrange(ano, mes)[1]
+    pdf = FPDF(orientation="L", format="A3")
+    pdf.add_font("DejaVu", "", FONT_PATH)
+    nomes = [_nome(rng) for _ in range(profissionais)]
+    grupos = [nomes[i:i + por_pagina] for i in range(0, len(nomes), por_pagina)] or [[]]
+
+    if layout == "matricial":
+        fixos = [("NOME", 60), ("MATRÍCULA", 18), ("CARGO", 22), ("VÍNCULO", 18), ("CRM", 12)]
+    else:
+        fixos = [("Nº", 8), ("NOME COMPLETO", 60), ("CARGO", 22), ("VÍNCULO", 18), ("CRM", 12)]
+    largura_dia, altura = 8, 5
+
+    for pg, grupo in enumerate(grupos):
+        pdf.add_page()
+        pdf.set_font("DejaVu", size=9)
+        if layout == "matricial":
+            pdf.cell(0, 6, "UNIDADE: HMINSN", new_x="LMARGIN", new_y="NEXT")
+            pdf.cell(0, 6, "UNIDADE/SETOR: UTI NEONATAL", new_x="LMARGIN", new_y="NEXT")
+        else:
+            pdf.cell(0, 6, "UNIDADE: HOSPITAL GERAL DE RORAIMA", new_x="LMARGIN", new_y="NEXT")
+            pdf.cell(0, 6, "SETOR: UTI 1", new_x="LMARGIN", new_y="NEXT")
+        pdf.cell(0, 6, f"MÊS: {MESES[mes - 1]} {ano}", new_x="LMARGIN", new_y="NEXT")
+
+        pdf.set_font("DejaVu", size=6)
+        for titulo, w in fixos:
+            pdf.cell(w, altura, titulo, border=1)
+        if layout == "from_pdf":
+            # Layout genérico: dias numa segunda linha de cabeçalho
+            for _ in range(dias):
+                pdf.cell(largura_dia, altura, "", border=1)
+            pdf.ln()
+            for _, w in fixos:
+                pdf.cell(w, altura, "", border=1)
+        for d in range(1, dias + 1):
+            pdf.cell(largura_dia, altura, str(d), border=1)
+        pdf.ln()
+
+        for i, nome in enumerate(grupo):
+            crm = str(1000 + pg * por_pagina + i)
+            if layout == "matricial":
+                valores = [nome, "PAES", "PEDIATRA", "R.P. PAES", crm]
+            else:
+                valores = [str(pg * por_pagina + i + 1), nome, "MÉDICO", "R.P. PAES", crm]
+            for (_, w), valor in zip(fixos, valores):
+                pdf.cell(w, altura, valor, border=1)
+            for _ in range(dias):
+                pdf.cell(largura_dia, altura, rng.choice(TURNOS), border=1)
+            pdf.ln()
+    return bytes(pdf.output())
+
+
+def dividir(pdf_bytes):
+    # Uma página por PDF, como o /split-pdf devolve
+    paginas = []
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for i in range(len(doc)):
+            with fitz.open() as saida:
+                saida.insert_pdf(doc, from_page=i, to_page=i)
+                paginas.append(saida.tobytes())
+    return paginas
+
+
+def paginas_base64(pdf_bytes):
+    return [
+        {"page": i + 1, "filename": f"page_{i + 1}.pdf", "base64": base64.b64encode(p).decode()}
+        for i, p in enumerate(dividir(pdf_bytes))
+    ]
+
+
+def paginas_hgr(quantidade=40, seed=0):
+    # Texto de páginas como o n8n manda para o /classifica-paginas-hgr:
+    # cabeçalhos de setor (com ruído), continuações, retificações e lixo
+    rng = random.Random(seed)
+    paginas = []
+    for i in range(quantidade):
+        sorteio = rng.random()
+        if sorteio < 0.35:
+            setor = rng.choice(SETORES_HGR)
+            if rng.random() < 0.3:
+                setor = setor.replace("A", "", 1)
+            texto = f"ESCALA DE SERVIÇO\nSETOR: {setor}\n" + "\n".join(f"{_nome(rng)} M T N" for _ in range(8))
+        elif sorteio < 0.7:
+            texto = "\n".join(f"{_nome(rng).lower()} pss1 d" for _ in range(10))
+        elif sorteio < 0.8:
+            texto = "RETIFICAÇÃO DA ESCALA\n" + _nome(rng)
+        else:
+            texto = "Documento assinado eletronicamente. sei.rr.gov.br autenticidade do documento"
+        paginas.append({"page_number": i + 1, "filename": f"page_{i + 1}.pdf", "text": texto})
+    return paginas
+
+
+def planilha(linhas=500, abas=2, seed=0):
+    rng = random.Random(seed)
+    wb = Workbook()
+    wb.remove(wb.active)
+    for a in range(abas):
+        ws = wb.create_sheet(f"Aba{a + 1}")
+        ws.append(["NOME", "CRM", "SETOR", "DATA", "TURNO"])
+        for i in range(linhas):
+            ws.append([_nome(rng), 1000 + i, rng.choice(SETORES_HGR), f"{rng.randint(1, 28):02d}/07/2025", rng.choice("MTN")])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def texto_longo(caracteres=5000, seed=0):
+    rng = random.Random(seed)
+    palavras = []
+    while sum(len(p) + 1 for p in palavras) < caracteres:
+        palavras.append(rng.choice(NOMES + SOBRENOMES).lower())
+    return " ".join(palavras)